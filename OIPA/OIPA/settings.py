@@ -118,6 +118,15 @@ MEDIA_ROOT = os.environ.get(
         os.path.dirname(BASE_DIR),
         'public/media'))
 
+# Publisher exports of unpublished activities. They are only served through
+# the (authenticated) export result view, so keep this directory out of
+# MEDIA_ROOT and STATIC_ROOT:
+EXPORT_ROOT = os.environ.get(
+    'OIPA_EXPORT_ROOT',
+    os.path.join(
+        os.path.dirname(BASE_DIR),
+        'exports'))
+
 # Additional locations of static files
 STATICFILES_DIRS = (
     os.path.join(BASE_DIR, 'static/'),
@@ -253,6 +262,88 @@ CORS_URLS_REGEX = r'^/api/.*$'
 CORS_ALLOW_METHODS = ('GET',)
 
 IATI_PARSER_DISABLED = False
+# Parse datasets with etree.iterparse instead of building the whole XML tree
+# in memory (peak memory then follows the largest activity, not the file):
+IATI_PARSER_STREAMING = literal_eval(
+    env.get('OIPA_IATI_PARSER_STREAMING', 'False')
+)
+# Save the models of a parsed activity with one bulk_create() per model class
+# instead of one INSERT per model (see iati/parser/bulk_save.py):
+IATI_PARSER_BULK_SAVE = literal_eval(
+    env.get('OIPA_IATI_PARSER_BULK_SAVE', 'False')
+)
+# Keep activities of which the XML didn't change (even when their
+# last-updated-datetime moved) and only rewrite the changed transactions,
+# budgets or results/locations of the others (see iati/parser/activity_hash.py)
+IATI_PARSER_INCREMENTAL_UPDATE = literal_eval(
+    env.get('OIPA_IATI_PARSER_INCREMENTAL_UPDATE', 'False')
+)
+# Record time, calls and queries per element handler and post-save step of
+# every parsed dataset in a DatasetParseProfile (see
+# iati/parser/profiling.py):
+IATI_PARSER_PROFILING = literal_eval(
+    env.get('OIPA_IATI_PARSER_PROFILING', 'False')
+)
+# Rebuild the traceability chains around the changed activities of a dataset
+# after it is parsed (see traceability/incremental.py). Run the
+# retrieve_chains command once after enabling this:
+TRACEABILITY_INCREMENTAL_CHAINS = literal_eval(
+    env.get('OIPA_TRACEABILITY_INCREMENTAL_CHAINS', 'False')
+)
+# Keep downloaded datasets in an on-disk cache and fetch them with conditional
+# GETs (ETag / Last-Modified), so unchanged files aren't downloaded again by
+# the parser, the validation and the syncer (see iati/file_cache.py):
+IATI_FILE_CACHE = literal_eval(env.get('OIPA_IATI_FILE_CACHE', 'False'))
+IATI_FILE_CACHE_DIR = env.get(
+    'OIPA_IATI_FILE_CACHE_DIR',
+    os.path.join(os.path.dirname(BASE_DIR), 'file_cache')
+)
+# Number of processes of the parse orchestrator, and the seconds after which
+# it stops parsing a dataset and marks it failed (see
+# iati_synchroniser/parse_orchestrator.py):
+PARSER_POOL_WORKERS = int(env.get('OIPA_PARSER_POOL_WORKERS', '4'))
+PARSER_POOL_DATASET_TIMEOUT = int(
+    env.get('OIPA_PARSER_POOL_DATASET_TIMEOUT', '14400')
+)
+# Fetch the registry pages and download the datasets concurrently when
+# syncing with the registry, with at most IATI_REGISTRY_SYNC_CONNECTIONS
+# requests at a time and IATI_REGISTRY_SYNC_CONNECTIONS_PER_HOST per server
+# (see iati_synchroniser/fetch_engine.py):
+IATI_REGISTRY_CONCURRENT_SYNC = literal_eval(
+    env.get('OIPA_IATI_REGISTRY_CONCURRENT_SYNC', 'False')
+)
+IATI_REGISTRY_SYNC_CONNECTIONS = int(
+    env.get('OIPA_IATI_REGISTRY_SYNC_CONNECTIONS', '20')
+)
+IATI_REGISTRY_SYNC_CONNECTIONS_PER_HOST = int(
+    env.get('OIPA_IATI_REGISTRY_SYNC_CONNECTIONS_PER_HOST', '4')
+)
+IATI_REGISTRY_SYNC_TIMEOUT = int(
+    env.get('OIPA_IATI_REGISTRY_SYNC_TIMEOUT', '60')
+)
+# Only ask the registry for the datasets modified since the last sync, and
+# queue a parse of the ones of which the URL or the file hash changed (see
+# DatasetSyncer.synchronize_delta()):
+IATI_REGISTRY_DELTA_SYNC = literal_eval(
+    env.get('OIPA_IATI_REGISTRY_DELTA_SYNC', 'False')
+)
+# Keep the TransactionFact table up to date after parsing a dataset and
+# answer transaction aggregations from it (see iati/transaction/facts.py).
+# Run the refresh_transaction_facts command once after enabling this:
+TRANSACTION_FACTS = literal_eval(env.get('OIPA_TRANSACTION_FACTS', 'False'))
+# Compute all aggregations of an aggregation request in one query, with
+# conditional aggregates, instead of a query per aggregation:
+AGGREGATION_SINGLE_QUERY = literal_eval(
+    env.get('OIPA_AGGREGATION_SINGLE_QUERY', 'True'))
+# Order and page the groups of aggregation requests in SQL instead of
+# querying all groups (see api/aggregation/aggregation.py):
+AGGREGATION_DATABASE_PAGINATION = literal_eval(
+    env.get('OIPA_AGGREGATION_DATABASE_PAGINATION', 'True'))
+# Cache the JSON and IATI XML representations of activities per activity
+# and reuse them in list endpoints and exports (see
+# common/fragment_cache.py):
+ACTIVITY_FRAGMENT_CACHE = literal_eval(
+    env.get('OIPA_ACTIVITY_FRAGMENT_CACHE', 'False'))
 CONVERT_CURRENCIES = True
 ROOT_ORGANISATIONS = []
 
@@ -17,7 +17,8 @@ from api.dataset.serializers import SimpleDatasetSerializer
 from api.generics.fields import PointField
 from api.generics.serializers import (
     DynamicFieldsModelSerializer, DynamicFieldsSerializer,
-    ModelSerializerNoValidation, SerializerNoValidation
+    FragmentCacheListSerializer, ModelSerializerNoValidation,
+    SerializerNoValidation
 )
 from api.generics.utils import get_or_none, get_or_raise, handle_errors
 from api.publisher.serializers import PublisherSerializer
@@ -3716,6 +3717,7 @@ class ActivitySerializer(DynamicFieldsModelSerializer):
         )
 
         validators = []
+        list_serializer_class = FragmentCacheListSerializer
 
 
 class ActivitySerializerByIatiIdentifier(ActivitySerializer):
@@ -6,12 +6,14 @@ import datetime
 from collections import OrderedDict
 from unittest import skip
 
-from django.test import RequestFactory, TestCase
+from django.test import RequestFactory, TestCase, override_settings
 from rest_framework.reverse import reverse
 
 from api.activity import serializers
 from api.codelist.serializers import CodelistCategorySerializer
+from common.fragment_cache import invalidate_activity_fragments
 from iati.factory import iati_factory
+from iati.models import Activity
 from iati_codelists.factory import codelist_factory
 from iati_codelists.factory.codelist_factory import AidTypeFactory
 from iati_synchroniser.factory.synchroniser_factory import PublisherFactory
@@ -725,3 +727,37 @@ class ActivitySerializerTestCase(TestCase):
                 'narratives': []
             }
         )
+
+
+@override_settings(
+    ACTIVITY_FRAGMENT_CACHE=True,
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'api': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    })
+class ActivityFragmentCacheTestCase(TestCase):
+    request_dummy = RequestFactory().get('/')
+
+    def serialize(self):
+        return serializers.ActivitySerializer(
+            Activity.objects.all(),
+            many=True,
+            context={'request': self.request_dummy},
+            fields=('id', 'iati_identifier'),
+        ).data
+
+    def test_cached_fragments(self):
+        activity = iati_factory.ActivityFactory.create()
+        self.assertEqual(self.serialize()[0]['iati_identifier'], 'IATI-0001')
+
+        # an update which doesn't change last_updated_model is not seen:
+        Activity.objects.filter(pk=activity.pk).update(
+            iati_identifier='IATI-0002')
+        self.assertEqual(self.serialize()[0]['iati_identifier'], 'IATI-0001')
+
+        invalidate_activity_fragments([activity])
+        self.assertEqual(self.serialize()[0]['iati_identifier'], 'IATI-0002')
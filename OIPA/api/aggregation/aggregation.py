@@ -1,19 +1,32 @@
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from functools import reduce
-from operator import itemgetter
-
+from operator import itemgetter, or_
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Max, Min, Q
+from django.db.models.constants import LOOKUP_SEP
 from django.utils.encoding import smart_text
 
+# page size of keyset (cursor) pages when no page_size is given:
+DEFAULT_CURSOR_PAGE_SIZE = 100
 
-def apply_annotations(
-        queryset, selected_groupings, selected_aggregations, query_params):
-    """
-    Builds and performs the query, when multiple aggregations were requested
-    it joins the results
-    """
 
-    group_fields = flatten(
+def get_group_fields(selected_groupings):
+    return flatten(
         [grouping.get_fields() for grouping in selected_groupings]
     )
+
+
+def prepare_queryset(queryset, selected_groupings, query_params):
+    """
+    Adds the renamed fields and extra's of the group by's to {queryset} and
+    leaves out rows of which a grouped by field is null
+    """
     rename_annotations = merge([grouping.get_renamed_fields()
                                 for grouping in selected_groupings])
     group_extras = merge(
@@ -38,9 +51,203 @@ def apply_annotations(
     eliminate_nulls = {"{}__isnull".format(
         grouping): False for grouping in nullable_group_fields}
 
-    queryset = queryset \
+    return queryset \
         .filter(**eliminate_nulls)
 
+
+def get_lookups(expression):
+    """
+    Returns the field lookups {expression} (an expression or a Q()) and the
+    expressions and Q()'s in it refer to
+    """
+    if isinstance(expression, F):
+        return {expression.name}
+
+    if isinstance(expression, Q):
+        lookups = set()
+        for child in expression.children:
+            if isinstance(child, Q):
+                lookups |= get_lookups(child)
+            else:
+                lookup, value = child
+                lookups.add(lookup)
+                if hasattr(value, 'resolve_expression'):
+                    lookups |= get_lookups(value)
+        return lookups
+
+    if not hasattr(expression, 'get_source_expressions'):
+        return set()
+
+    sources = list(expression.get_source_expressions())
+    if getattr(expression, 'filter', None) is not None:
+        sources.append(expression.filter)
+
+    return set().union(*[
+        get_lookups(source) for source in sources if source is not None
+    ])
+
+
+def get_multi_valued_path(model, lookup):
+    """
+    Returns the part of {lookup} up to and including its last one-to-many or
+    many-to-many relation: the joins which multiply the rows of {model}.
+    None when {lookup} can't be followed
+    """
+    names = lookup.split(LOOKUP_SEP)
+    path = ()
+
+    for i, name in enumerate(names):
+        try:
+            field = model._meta.pk if name == 'pk' \
+                else model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # a lookup (e.g. __in) or transform after the last field:
+            return path if i else None
+
+        if field.one_to_many or field.many_to_many:
+            path = tuple(names[:i + 1])
+
+        if not field.is_relation:
+            break
+
+        model = field.related_model
+
+    return path
+
+
+def is_duplicate_insensitive(annotation):
+    """
+    True when {annotation} isn't changed by rows repeated by a join
+    """
+    # Count(..., distinct=True) keeps DISTINCT in its template extra's:
+    return isinstance(annotation, (Max, Min)) \
+        or bool(getattr(annotation, 'extra', {}).get('distinct'))
+
+
+def can_combine(model, annotations):
+    """
+    True when {annotations} can be computed in one query on {model}: every
+    annotation joins the same multi-valued relations, so none of them is
+    multiplied by the rows of a relation joined for another one. Annotations
+    which aren't changed by repeated rows may join a part of those relations
+    """
+    paths = []
+
+    for annotation in annotations:
+        annotation_paths = {
+            get_multi_valued_path(model, lookup)
+            for lookup in get_lookups(annotation)
+        }
+
+        if None in annotation_paths:
+            return False
+
+        # all relations of an annotation are joined along one path:
+        path = max(annotation_paths, key=len, default=())
+        if any(path[:len(p)] != p for p in annotation_paths):
+            return False
+
+        paths.append((path, is_duplicate_insensitive(annotation)))
+
+    common_path = max([path for path, insensitive in paths], key=len)
+
+    return all(
+        path == common_path
+        or (insensitive and common_path[:len(path)] == path)
+        for path, insensitive in paths
+    )
+
+
+def get_grouped_queryset(queryset, selected_groupings, selected_aggregations,
+                         query_params, single_query=None):
+    """
+    Returns (filtered queryset, grouped queryset): one values().annotate()
+    query computing all aggregations, on a queryset prepared by
+    prepare_queryset(). (None, None) when the aggregations can't be
+    computed in one query, like aggregations over different one-to-many
+    relations, which would multiply each other's rows (see can_combine())
+
+    With {single_query} (settings.AGGREGATION_SINGLE_QUERY by default)
+    multiple aggregations are computed in one query, with their extra
+    filters as FILTER clauses of the aggregates
+    """
+    if single_query is None:
+        single_query = settings.AGGREGATION_SINGLE_QUERY
+
+    group_fields = get_group_fields(selected_groupings)
+
+    if len(selected_aggregations) == 1:
+        aggregation = selected_aggregations[0]
+        queryset = aggregation.apply_extra_filter(queryset)
+
+        return queryset, aggregation.apply_annotation(
+            queryset.values(*group_fields), query_params, selected_groupings
+        )
+
+    if not single_query:
+        return None, None
+
+    annotations = [
+        (aggregation.annotate_name, aggregation.get_conditional_annotation(
+            query_params, selected_groupings))
+        for aggregation in selected_aggregations
+    ]
+
+    if None in [annotation for name, annotation in annotations]:
+        return None, None
+
+    if not can_combine(
+            queryset.model, [annotation for name, annotation in annotations]):
+        return None, None
+
+    extra_filters = [
+        aggregation.extra_filter for aggregation in selected_aggregations
+    ]
+
+    # only the groups the separate queries would return:
+    if None not in extra_filters:
+        queryset = queryset.filter(reduce(or_, extra_filters))
+
+    return queryset, queryset.values(*group_fields).annotate(
+        **dict(annotations))
+
+
+def fill_missing_aggregations(result, selected_aggregations):
+    """
+    Like merge_results() does, sets aggregations without rows in a group to 0
+    """
+    if len(selected_aggregations) > 1:
+        for item in result:
+            for aggregation in selected_aggregations:
+                if item.get(aggregation.field) is None:
+                    item[aggregation.field] = 0
+
+    return result
+
+
+def apply_annotations(
+        queryset, selected_groupings, selected_aggregations, query_params,
+        single_query=None):
+    """
+    Builds and performs the query, when multiple aggregations were requested
+    it joins the results (or computes them in one query, see
+    get_grouped_queryset())
+    """
+    if single_query is None:
+        single_query = settings.AGGREGATION_SINGLE_QUERY
+
+    group_fields = get_group_fields(selected_groupings)
+    queryset = prepare_queryset(queryset, selected_groupings, query_params)
+
+    if single_query and len(selected_aggregations) > 1:
+        filtered, grouped = get_grouped_queryset(
+            queryset, selected_groupings, selected_aggregations,
+            query_params, single_query)
+
+        if grouped is not None:
+            return fill_missing_aggregations(
+                list(grouped), selected_aggregations)
+
     def get_aggregation_queryset(queryset, group_fields, aggregation):
 
         # TODO: Should queryset be copied here? - 2016-04-07
@@ -227,10 +434,266 @@ def apply_group_filters(queryset, selected_groupings, params):
     return queryset
 
 
+def apply_limit_offset(results, page_size, page):
+    """
+    limit the results to the amount set by page_size
+    """
+    if page_size:
+
+        if not page:
+            page = 1
+
+        page_size = int(page_size)
+        page = int(page)
+
+        offset = (page * page_size) - page_size
+        offset_plus_limit = offset + page_size
+        return results[offset:offset_plus_limit]
+
+    return results
+
+
+def get_result_names(grouped):
+    """
+    The keys of the rows of a values() queryset, in the order of the
+    columns of its SQL
+    """
+    query = grouped.query
+
+    return list(query.extra_select) + list(query.values_select) \
+        + list(query.annotation_select)
+
+
+def get_database_orderings(names, selected_orderings, group_fields):
+    """
+    Returns the orderings followed by the group fields (so the order is
+    unique), or None when an ordering isn't one of {names}
+    """
+    orderings = list(selected_orderings or [])
+    ordered_fields = [ordering.lstrip('-') for ordering in orderings]
+
+    if any(field not in names for field in ordered_fields):
+        return None
+
+    return orderings + [
+        field for field in group_fields if field not in ordered_fields
+    ]
+
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder truncates datetimes and times to milliseconds, so a
+    cursor wouldn't compare equal to the row it was taken from. Encodes them
+    with microseconds instead
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+
+        return super(CursorJSONEncoder, self).default(o)
+
+
+def encode_cursor(orderings, values):
+    data = json.dumps([orderings, values], cls=CursorJSONEncoder)
+    return urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, orderings):
+    try:
+        cursor_orderings, values = json.loads(
+            urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (TypeError, ValueError):
+        cursor_orderings, values = None, None
+
+    if cursor_orderings != orderings or not isinstance(values, list) \
+            or len(values) != len(orderings):
+        raise ValueError(
+            "Invalid value {} for field 'cursor'".format(cursor))
+
+    return values
+
+
+def keyset_condition(keys, values):
+    """
+    Returns the SQL condition (and its params) of the rows after {values}
+    in the order of {keys}, (column, descending) pairs, with nulls last
+    (ORDER BY ... NULLS LAST) in both directions
+    """
+    conditions = []
+    params = []
+
+    for i, ((column, descending), value) in enumerate(zip(keys, values)):
+        parts = []
+        part_params = []
+
+        for (equal_column, _), equal_value in zip(keys[:i], values[:i]):
+            if equal_value is None:
+                parts.append('{} IS NULL'.format(equal_column))
+            else:
+                parts.append('{} = %s'.format(equal_column))
+                part_params.append(equal_value)
+
+        if value is None:
+            # nothing comes after null
+            continue
+
+        parts.append('({0} {1} %s OR {0} IS NULL)'.format(
+            column, '<' if descending else '>'))
+        part_params.append(value)
+
+        conditions.append('({})'.format(' AND '.join(parts)))
+        params.extend(part_params)
+
+    if not conditions:
+        return 'FALSE', []
+
+    return ' OR '.join(conditions), params
+
+
+def get_database_page(grouped, orderings, page_size=None, page=None,
+                      cursor=None, zero_when_null=()):
+    """
+    Orders and pages the groups of the values() queryset {grouped} in SQL:
+
+    SELECT * FROM (grouped query) ORDER BY orderings LIMIT page_size
+    OFFSET (page - 1) * page_size
+
+    With a {cursor} ('' for the first page) the page starts after the
+    groups of the cursor instead (keyset pagination), which stays fast for
+    deep pages. Returns (rows, cursor of the next page)
+
+    The results in {zero_when_null} (the aggregations) are ordered as 0 when
+    they are null, like the aggregations ordered in Python (see
+    apply_ordering() and fill_missing_aggregations()). Other nulls come
+    last
+    """
+    names = get_result_names(grouped)
+    sql, params = grouped.order_by().query.sql_with_params()
+    params = list(params)
+
+    # the columns of the grouped query are renamed, as fields of different
+    # tables can have the same column name:
+    connection = connections[grouped.db]
+    columns = [
+        connection.ops.quote_name('c{}'.format(i)) for i in range(len(names))
+    ]
+    column_of = dict(zip(names, columns))
+    keys = []
+
+    for ordering in orderings:
+        name = ordering.lstrip('-')
+        column = column_of[name]
+
+        if name in zero_when_null:
+            column = 'COALESCE({}, 0)'.format(column)
+
+        keys.append((column, ordering.startswith('-')))
+
+    where = ''
+    offset = 0
+
+    if cursor is not None:
+        page_size = int(page_size or DEFAULT_CURSOR_PAGE_SIZE)
+
+        if cursor:
+            condition, condition_params = keyset_condition(
+                keys, decode_cursor(cursor, orderings))
+            where = 'WHERE {}'.format(condition)
+            params.extend(condition_params)
+
+    elif page_size:
+        page_size = int(page_size)
+        offset = (int(page or 1) - 1) * page_size
+
+    limit = ''
+    if page_size:
+        limit = 'LIMIT %s OFFSET %s'
+        params.extend([page_size, offset])
+
+    sql = 'SELECT * FROM ({sql}) AS aggregation_groups ({columns}) ' \
+        '{where} ORDER BY {order} {limit}'.format(
+            sql=sql,
+            columns=', '.join(columns),
+            where=where,
+            order=', '.join(
+                '{} {} NULLS LAST'.format(
+                    column, 'DESC' if descending else 'ASC')
+                for column, descending in keys),
+            limit=limit,
+        )
+
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        rows = [dict(zip(names, row)) for row in db_cursor.fetchall()]
+
+    next_cursor = None
+    if cursor is not None and rows and len(rows) == page_size:
+        last = [rows[-1][ordering.lstrip('-')] for ordering in orderings]
+        next_cursor = encode_cursor(orderings, [
+            0 if value is None and ordering.lstrip('-') in zero_when_null
+            else value
+            for ordering, value in zip(orderings, last)
+        ])
+
+    return rows, next_cursor
+
+
+def aggregate_in_database(queryset, selected_groupings, selected_aggregations,
+                          selected_orderings, params, page_size=None,
+                          page=None, cursor=None):
+    """
+    Computes, orders and pages the groups in SQL, with the number of groups
+    counted by a separate COUNT over the distinct group fields. Returns
+    None when the aggregations or orderings don't fit in one query
+    """
+    group_fields = get_group_fields(selected_groupings)
+    queryset = prepare_queryset(queryset, selected_groupings, params)
+
+    filtered, grouped = get_grouped_queryset(
+        queryset, selected_groupings, selected_aggregations, params)
+
+    if grouped is None:
+        return None
+
+    orderings = get_database_orderings(
+        get_result_names(grouped), selected_orderings, group_fields)
+
+    if orderings is None:
+        return None
+
+    results, next_cursor = get_database_page(
+        grouped, orderings, page_size, page, cursor,
+        zero_when_null=[
+            aggregation.annotate_name
+            for aggregation in selected_aggregations
+        ])
+
+    if page_size or cursor is not None:
+        count = filtered.values(*group_fields).order_by().distinct().count()
+    else:
+        count = len(results)
+
+    result = {
+        'count': count,
+        'results': fill_missing_aggregations(results, selected_aggregations),
+    }
+
+    if cursor is not None:
+        result['next_cursor'] = next_cursor
+
+    return result
+
+
 def aggregate(queryset, request, selected_groupings, selected_aggregations,
-              selected_orderings):
+              selected_orderings, page_size=None, page=None, cursor=None):
     """
         A view can call this function
+
+        With settings.AGGREGATION_DATABASE_PAGINATION the groups are ordered
+        and paged by the database when possible (see aggregate_in_database()),
+        otherwise all groups are queried and paged in Python. A {cursor}
+        (keyset pagination) is only supported by the database
     """
     # remove any existing ordering
     queryset = queryset.order_by()
@@ -252,6 +715,20 @@ def aggregate(queryset, request, selected_groupings, selected_aggregations,
     # IN filters
     queryset = apply_group_filters(queryset, selected_groupings, params)
 
+    if settings.AGGREGATION_DATABASE_PAGINATION:
+        result = aggregate_in_database(
+            queryset, selected_groupings, selected_aggregations,
+            selected_orderings, params, page_size, page, cursor)
+
+        if result is not None:
+            result['results'] = serialize_foreign_keys(
+                result['results'], selected_groupings, request)
+            return result
+
+    if cursor is not None:
+        raise ValueError(
+            "The field 'cursor' isn't supported for these aggregations")
+
     # from here, queryset is a list
     result = apply_annotations(
         queryset, selected_groupings, selected_aggregations, params
@@ -260,8 +737,8 @@ def aggregate(queryset, request, selected_groupings, selected_aggregations,
     # TODO: is this correct? - 2016-04-07
     count = len(result)
 
-    # TODO: Can we let db do the ordering? - 2016-04-07
     result = apply_ordering(result, selected_orderings)
+    result = apply_limit_offset(result, page_size, page)
     result = serialize_foreign_keys(result, selected_groupings, request)
 
     return {
@@ -1,3 +1,79 @@
 """
 Tests for the generic aggregation methods
 """
+from django.db.models import Count, Q, Sum
+from django.test import SimpleTestCase, TestCase
+
+from api.aggregation.aggregation import can_combine, get_database_page
+from iati.factory import iati_factory
+from iati.models import Activity, Result
+from iati.transaction.factories import TransactionFactory
+
+
+class CanCombineTestCase(SimpleTestCase):
+    """
+    Aggregations are only computed in one query when they join the same
+    one-to-many relations
+    """
+    targets = Sum('resultindicator__resultindicatorperiod__targets__value')
+    actuals = Sum('resultindicator__resultindicatorperiod__actuals__value')
+
+    def test_same_relations(self):
+        self.assertTrue(can_combine(Activity, [
+            Sum('transaction__value'),
+            Sum('transaction__value', filter=Q(
+                transaction__transaction_type__code='1')),
+        ]))
+
+    def test_different_relations(self):
+        self.assertFalse(can_combine(Result, [self.targets, self.actuals]))
+        self.assertFalse(can_combine(Activity, [
+            Sum('transaction__value'), Sum('budget__value'),
+        ]))
+
+    def test_relation_and_its_parent(self):
+        self.assertFalse(can_combine(Activity, [
+            Sum('transaction__value'), Count('id'),
+        ]))
+
+    def test_distinct_count(self):
+        self.assertTrue(can_combine(Result, [
+            self.targets, Count('activity', distinct=True),
+        ]))
+
+
+class DatabasePageTestCase(TestCase):
+    """
+    Groups of which the aggregation is null are ordered as 0
+    """
+
+    def setUp(self):
+        for iati_identifier, value in [('A', 10), ('B', None), ('C', 5)]:
+            activity = iati_factory.ActivityFactory.create(
+                iati_identifier=iati_identifier)
+
+            if value is not None:
+                TransactionFactory.create(activity=activity, value=value)
+
+        self.grouped = Activity.objects.values('iati_identifier').annotate(
+            value=Sum('transaction__value'))
+
+    def get_pages(self, orderings):
+        identifiers = []
+        cursor = ''
+
+        while cursor is not None:
+            rows, cursor = get_database_page(
+                self.grouped, orderings, page_size=2, cursor=cursor,
+                zero_when_null=['value'])
+            identifiers.extend(row['iati_identifier'] for row in rows)
+
+        return identifiers
+
+    def test_descending(self):
+        self.assertEqual(
+            self.get_pages(['-value', 'iati_identifier']), ['A', 'C', 'B'])
+
+    def test_ascending(self):
+        self.assertEqual(
+            self.get_pages(['value', 'iati_identifier']), ['B', 'C', 'A'])
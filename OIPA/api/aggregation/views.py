@@ -1,4 +1,4 @@
-from django.db.models import F, Q
+from django.db.models import Aggregate, F, Q
 from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
 from rest_framework_extensions.cache.decorators import cache_response
@@ -7,7 +7,7 @@ from rest_framework_extensions.key_constructor.constructors import (
     DefaultKeyConstructor
 )
 
-from api.aggregation.aggregation import aggregate
+from api.aggregation.aggregation import aggregate, apply_limit_offset
 
 
 class QueryParamsKeyConstructor(DefaultKeyConstructor):
@@ -19,24 +19,16 @@ class AggregationView(GenericAPIView):
     def apply_limit_offset_filters(self, results, page_size, page):
         """
         limit the results to the amount set by page_size
-
-        The results are all queried so this gives
-        at most a small performance boost
-        because there's less data to serialize.
         """
-        if page_size:
-
-            if not page:
-                page = 1
-
-            page_size = int(page_size)
-            page = int(page)
-
-            offset = (page * page_size) - page_size
-            offset_plus_limit = offset + page_size
-            return results[offset:offset_plus_limit]
+        return apply_limit_offset(results, page_size, page)
 
-        return results
+    def get_aggregation_source(self, queryset, groupings, aggregations):
+        """
+        Returns the queryset, groupings and aggregations to aggregate. Views
+        can override this to answer a request from another (pre-aggregated)
+        table
+        """
+        return queryset, groupings, aggregations
 
     @cache_response(key_func=QueryParamsKeyConstructor())
     def get(self, request, *args, **kwargs):
@@ -74,26 +66,36 @@ class AggregationView(GenericAPIView):
 
         selected_orderings = orderings
 
-        result = aggregate(
-            queryset,
-            request,
-            selected_groupings,
-            selected_aggregations,
-            selected_orderings,
-        )
-
-        page_size = params.get('page_size', None)
-        page = params.get('page', None)
-
-        result['results'] = \
-            self.apply_limit_offset_filters(result['results'], page_size, page)
+        queryset, selected_groupings, selected_aggregations = \
+            self.get_aggregation_source(
+                queryset, selected_groupings, selected_aggregations)
+
+        # the groups are ordered and paged by the database where possible,
+        # a cursor (keyset pagination, '' for the first page) is faster than
+        # page for deep pages:
+        try:
+            result = aggregate(
+                queryset,
+                request,
+                selected_groupings,
+                selected_aggregations,
+                selected_orderings,
+                page_size=params.get('page_size', None),
+                page=params.get('page', None),
+                cursor=params.get('cursor', None),
+            )
+        except ValueError as e:
+            return Response({'error_message': str(e)})
 
         # prevent on the Response
         # so can not direct to Response(result) if format apa oor None
         if self.request.GET.get('format', None) in ['api', None]:
-            return Response(
-                {'count': result['count'], 'result': result['results']}
-            )
+            response = {'count': result['count'], 'result': result['results']}
+
+            if 'next_cursor' in result:
+                response['next_cursor'] = result['next_cursor']
+
+            return Response(response)
 
         return Response(result)
 
@@ -253,19 +255,44 @@ class Aggregation():
         else:
             return queryset
 
+    def get_annotation(self, query_params=None, groupings=None):
+        if isfunc(self.annotate):
+            return self.annotate(query_params, groupings)
+
+        return self.annotate
+
     def apply_annotation(self, queryset, query_params=None, groupings=None):
         """
         apply the specified annotation to ${queryset}
         """
-
-        if isfunc(self.annotate):
-            annotate = self.annotate(query_params, groupings)
-        else:
-            annotate = self.annotate
+        annotate = self.get_annotation(query_params, groupings)
 
         annotation = dict([(self.annotate_name, annotate)])
         return queryset.annotate(**annotation)
 
+    def get_conditional_annotation(self, query_params=None, groupings=None):
+        """
+        Returns the annotation with the extra filter as its FILTER clause
+        (Sum(..., filter=Q(...))), so it can be computed in one query with
+        other aggregations. None when the annotation isn't an aggregate
+        """
+        annotate = self.get_annotation(query_params, groupings)
+
+        if not isinstance(annotate, Aggregate):
+            return None
+
+        if self.extra_filter is None:
+            return annotate
+
+        # don't change the annotation instances shared between requests:
+        annotate = annotate.copy()
+        if annotate.filter is None:
+            annotate.filter = self.extra_filter
+        else:
+            annotate.filter = annotate.filter & self.extra_filter
+
+        return annotate
+
 
 # TODO: seems unnescessary - 2016-04-11
 class Order:
@@ -1,8 +1,51 @@
-from rest_framework_extensions.key_constructor.bits import QueryParamsKeyBit
+from rest_framework_extensions.key_constructor.bits import (
+    KeyBitBase, QueryParamsKeyBit
+)
 from rest_framework_extensions.key_constructor.constructors import (
     DefaultKeyConstructor
 )
 
+from common.cache_tags import ALL_TAG, get_tag_versions
+
+# query parameter -> tag of the filtered values (see common/cache_tags.py)
+TAGGED_QUERY_PARAMS = {
+    'dataset_id': 'dataset',
+    'dataset_iati_id': 'dataset_iati_id',
+    'publisher_id': 'publisher',
+    'publisher_iati_id': 'publisher_iati_id',
+    'publisher_organisation_identifier': 'organisation_identifier',
+    'reporting_org_identifier': 'organisation_identifier',
+    'reporting_organisation_identifier': 'organisation_identifier',
+}
+
+
+def get_request_tags(query_params):
+    """
+    Returns the tags of the datasets and publishers a request filters on,
+    or ALL_TAG when it doesn't filter on any
+    """
+    tags = set()
+
+    for param, tag in TAGGED_QUERY_PARAMS.items():
+        for values in query_params.getlist(param):
+            tags.update(
+                '{}:{}'.format(tag, value)
+                for value in values.split(',') if value)
+
+    return sorted(tags) or [ALL_TAG]
+
+
+class DatasetTagsKeyBit(KeyBitBase):
+    """
+    The version stamps of the datasets and publishers the response depends
+    on. They change when one of those datasets is parsed, which expires the
+    cached response
+    """
+
+    def get_data(self, params, view_instance, view_method, request, args,
+                 kwargs):
+        return get_tag_versions(get_request_tags(request.query_params))
+
 
 class QueryParamsKeyConstructor(DefaultKeyConstructor):
     """
@@ -15,3 +58,4 @@ class QueryParamsKeyConstructor(DefaultKeyConstructor):
         list_cache_key_func = QueryParamsKeyConstructor()
     """
     all_query_params = QueryParamsKeyBit()
+    dataset_tags = DatasetTagsKeyBit()
@@ -8,7 +8,9 @@ from rest_framework.serializers import (
 
 from api.generics.serializers import DynamicFieldsModelSerializer
 from iati.models import Activity
-from iati_synchroniser.models import Dataset, DatasetNote, Publisher
+from iati_synchroniser.models import (
+    Dataset, DatasetNote, DatasetParseProfile, Publisher
+)
 
 
 class DatasetNoteSerializer(ModelSerializer):
@@ -25,6 +27,18 @@ class DatasetNoteSerializer(ModelSerializer):
             'variable')
 
 
+class DatasetParseProfileSerializer(ModelSerializer):
+    class Meta:
+        model = DatasetParseProfile
+        fields = (
+            'started',
+            'wall_time',
+            'query_count',
+            'activities_parsed',
+            'activities_skipped',
+            'stats')
+
+
 class SimplePublisherSerializer(DynamicFieldsModelSerializer):
     id = HiddenField(default=None)
     url = HyperlinkedIdentityField(view_name='publishers:publisher-detail')
@@ -77,6 +91,8 @@ class DatasetSerializer(DynamicFieldsModelSerializer):
     activity_count = SerializerMethodField()
     notes = HyperlinkedIdentityField(
         view_name='datasets:dataset-notes',)
+    parse_profiles = HyperlinkedIdentityField(
+        view_name='datasets:dataset-parse-profiles',)
 
     DatasetNoteSerializer(many=True, source="datasetnote_set")
 
@@ -104,6 +120,7 @@ class DatasetSerializer(DynamicFieldsModelSerializer):
             'sha1',
             'note_count',
             'notes',
+            'parse_profiles',
             'added_manually',
             'is_parsed',
             'export_in_progress',
@@ -3,6 +3,7 @@ from rest_framework import status
 from rest_framework.test import APITestCase
 
 from iati_synchroniser.factory import synchroniser_factory
+from iati_synchroniser.models import DatasetParseProfile
 
 
 class TestDatasetEndpoints(APITestCase):
@@ -26,3 +27,30 @@ class TestDatasetEndpoints(APITestCase):
         assert url == expect_url, msg.format(expect_url)
         response = self.client.get(url)
         self.assertTrue(status.is_success(response.status_code))
+
+    def test_dataset_parse_profiles_endpoint(self):
+        dataset = synchroniser_factory.DatasetFactory.create(name="dataset-4")
+        DatasetParseProfile.objects.create(
+            dataset=dataset,
+            wall_time=1.5,
+            query_count=10,
+            activities_parsed=1,
+            stats=[{
+                'kind': 'handler',
+                'name': 'iati_activities__iati_activity',
+                'calls': 1,
+                'seconds': 0.5,
+                'queries': 3,
+            }])
+        url = reverse('datasets:dataset-parse-profiles', args={dataset.id})
+
+        expect_url = '/api/datasets/' + str(dataset.id) + '/parse_profiles/'
+        self.assertEqual(url, expect_url)
+
+        response = self.client.get(url, {'format': 'json'})
+        self.assertTrue(status.is_success(response.status_code))
+
+        profile, = response.data['results']
+        self.assertEqual(profile['query_count'], 10)
+        self.assertEqual(
+            profile['stats'][0]['name'], 'iati_activities__iati_activity')
@@ -17,6 +17,9 @@ urlpatterns = [
     url(r'^(?P<pk>[^@$&+,/:;=?]+)/notes/',
         views.DatasetNotes.as_view(),
         name='dataset-notes'),
+    url(r'^(?P<pk>[^@$&+,/:;=?]+)/parse_profiles/',
+        views.DatasetParseProfiles.as_view(),
+        name='dataset-parse-profiles'),
 
     # TODO: temporary soln until we have implemented datasets properly -
     # 2016-10-25
@@ -14,15 +14,17 @@ from rest_framework_extensions.cache.mixins import CacheResponseMixin
 from api.aggregation.views import Aggregation, AggregationView, GroupBy
 from api.dataset.filters import DatasetFilter, NoteFilter
 from api.dataset.serializers import (
-    DatasetNoteSerializer, DatasetSerializer, SimpleDatasetSerializer,
-    SimplePublisherSerializer
+    DatasetNoteSerializer, DatasetParseProfileSerializer, DatasetSerializer,
+    SimpleDatasetSerializer, SimplePublisherSerializer
 )
 from api.export.views import IATIActivityList
 from api.generics.views import DynamicListView
 from api.publisher.permissions import OrganisationAdminGroupPermissions
 from iati.models import Activity
 from iati_organisation.models import Organisation
-from iati_synchroniser.models import Dataset, DatasetNote, Publisher
+from iati_synchroniser.models import (
+    Dataset, DatasetNote, DatasetParseProfile, Publisher
+)
 
 
 class DatasetPagination(pagination.PageNumberPagination):
@@ -251,6 +253,36 @@ class DatasetNotes(CacheResponseMixin, ListAPIView):
         return DatasetNote.objects.filter(dataset=pk).order_by('id')
 
 
+class DatasetParseProfiles(ListAPIView):
+    """
+    Returns the profiles of the parses of a dataset, latest first. Only
+    stored when the parser runs with profiling (IATI_PARSER_PROFILING, or
+    the parse_profile command).
+
+    Every profile has the totals of the parse and `stats`, the calls, time
+    (`seconds`) and database queries per function, slowest first. `kind` is
+    one of:
+
+    - `handler`: the parser method of an element
+    - `post_save`: a step after saving an activity
+    - `post_save_validator`: a validation after parsing the dataset
+    - `phase`: a phase of parsing a dataset, which includes the functions
+      above
+
+    ## URI Format
+
+    ```
+    /api/datasets/{dataset_id}/parse_profiles
+    ```
+    """
+
+    serializer_class = DatasetParseProfileSerializer
+
+    def get_queryset(self):
+        pk = self.kwargs.get('pk')
+        return DatasetParseProfile.objects.filter(dataset=pk)
+
+
 export_view = IATIActivityList.as_view()
 
 
@@ -1178,3 +1178,6 @@ class ActivityXMLSerializer(XMLMetaMixin, SkipNullMixin,
             'hierarchy',
             'linked_data_uri',
         )
+        # the items need their xml_meta, StreamingXMLRenderer caches the
+        # rendered XML instead:
+        list_serializer_class = serializers.ListSerializer
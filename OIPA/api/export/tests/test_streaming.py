@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+from lxml import etree
+from rest_framework.test import APIClient
+
+from api.export.serializers import ActivityXMLSerializer
+from api.renderers import StreamingXMLRenderer, XMLStreamBuffer
+from iati.factory import iati_factory
+from iati.models import Activity
+from task_queue.tasks import export_publisher_activities
+
+
+class StreamingXMLRendererTestCase(TestCase):
+
+    def setUp(self):
+        self.activities = [
+            iati_factory.ActivityFactory.create(
+                iati_identifier='IATI-stream-{}'.format(i),
+                normalized_iati_identifier='IATI-stream-{}'.format(i))
+            for i in range(3)
+        ]
+
+    def test_write_in_chunks(self):
+        renderer = StreamingXMLRenderer(chunk_size=2)
+        output = XMLStreamBuffer()
+        queryset = Activity.objects.order_by('iati_identifier')
+
+        chunks = list(renderer.write(
+            output, queryset, ActivityXMLSerializer))
+        self.assertEqual(len(chunks), 2)
+
+        xml = etree.fromstring(output.read())
+        self.assertEqual(xml.tag, 'iati-activities')
+        self.assertEqual(
+            [element.text for element in xml.iter('iati-identifier')],
+            ['IATI-stream-0', 'IATI-stream-1', 'IATI-stream-2'])
+
+    def test_stream_response(self):
+        response = APIClient().get(
+            '/api/export/activities/?format=xml&stream=1&page_size=1')
+
+        self.assertTrue(response.streaming)
+
+        xml = etree.fromstring(b''.join(response.streaming_content))
+        self.assertEqual(len(xml.findall('iati-activity')), 3)
+
+    def test_export_publisher_activities(self):
+        publisher = self.activities[0].publisher
+        Activity.objects.update(publisher=publisher, ready_to_publish=True)
+
+        export_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_root)
+
+        with override_settings(EXPORT_ROOT=export_root):
+            first_path = export_publisher_activities(publisher.id)
+            path = export_publisher_activities(publisher.id)
+
+        self.assertNotEqual(path, first_path)
+        # the earlier export is removed:
+        self.assertEqual(
+            os.listdir(os.path.join(export_root, str(publisher.id))),
+            [os.path.basename(path)])
+
+        with open(os.path.join(export_root, path), 'rb') as export_file:
+            xml = etree.fromstring(export_file.read())
+
+        self.assertEqual(len(xml.findall('iati-activity')), 3)
@@ -1,4 +1,8 @@
+import os
+
 import django_rq
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import authentication
 from rest_framework.generics import ListAPIView
@@ -12,7 +16,7 @@ from api.generics.filters import SearchFilter
 from api.generics.utils import get_serializer_fields
 from api.pagination import IatiXMLPagination
 from api.publisher.permissions import PublisherPermissions
-from api.renderers import XMLRenderer
+from api.renderers import StreamingXMLRenderer, XMLRenderer
 from common.util import difference
 from iati.models import Activity
 from iati_synchroniser.models import Dataset
@@ -21,7 +25,11 @@ from task_queue.tasks import export_publisher_activities
 
 class IATIActivityList(ListAPIView):
 
-    """IATI representation for activities"""
+    """IATI representation for activities
+
+    With `stream=1` (and format=xml) all filtered activities are streamed
+    in one response instead of a page of them.
+    """
 
     queryset = Activity.objects.all()
     filter_backends = (SearchFilter, DjangoFilterBackend,
@@ -57,6 +65,21 @@ class IATIActivityList(ListAPIView):
     def get_queryset(self):
         return super(IATIActivityList, self).get_queryset().prefetch_all()
 
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('stream') in ('1', 'true') and \
+                request.accepted_renderer.format == 'xml':
+            renderer = StreamingXMLRenderer()
+
+            return StreamingHttpResponse(
+                renderer.stream(
+                    self.filter_queryset(self.get_queryset()),
+                    self.get_serializer_class(),
+                    self.get_serializer_context()),
+                content_type='{}; charset={}'.format(
+                    renderer.media_type, renderer.charset))
+
+        return super(IATIActivityList, self).list(request, *args, **kwargs)
+
 
 class IATIActivityNextExportList(APIView):
     """IATI representation for activities"""
@@ -98,7 +121,11 @@ class IATIActivityNextExportList(APIView):
 
 
 class IATIActivityNextExportListResult(APIView):
-    """IATI representation for activities"""
+    """IATI representation for activities
+
+    The result of a completed export is the XML. With `download=1` the XML
+    file is returned instead, without reading it into memory.
+    """
 
     authentication_classes = (authentication.TokenAuthentication,)
     permission_classes = (PublisherPermissions, )
@@ -110,8 +137,6 @@ class IATIActivityNextExportListResult(APIView):
         job = queue.fetch_job(job_id)
 
         if job.is_finished:
-            ret = {'status': 'completed', 'result': job.return_value}
-
             try:
                 dataset = Dataset.objects.get(
                     publisher_id=publisher_id, filetype=1, added_manually=True)
@@ -124,6 +149,31 @@ class IATIActivityNextExportListResult(APIView):
             dataset.export_in_progress = False
             dataset.save()
 
+            # the job returns the path of the export, relative to
+            # EXPORT_ROOT:
+            path = os.path.join(settings.EXPORT_ROOT, job.return_value)
+
+            if not os.path.isfile(path):
+                return Response({
+                    'status': 'failed',
+                    'message': 'Export does not exist anymore'
+                })
+
+            if request.query_params.get('download') in ('1', 'true'):
+                response = FileResponse(
+                    open(path, 'rb'), content_type='application/xml')
+                response['Content-Disposition'] = \
+                    'attachment; filename="activities.xml"'
+                return response
+
+            with open(path, encoding='utf-8') as export_file:
+                ret = {
+                    'status': 'completed',
+                    'result': export_file.read(),
+                    'download': request.build_absolute_uri(
+                        request.path + '?download=1'),
+                }
+
         elif job.is_queued:
             ret = {'status': 'in-queue'}
         elif job.is_started:
@@ -1,8 +1,12 @@
 from collections import OrderedDict
 
+from django.conf import settings
+from django.db import models
 from rest_framework import serializers
 from rest_framework.fields import SkipField
 
+from common.fragment_cache import ActivityFragmentCache
+
 
 class XMLMetaMixin(object):
     def to_representation(self, *args, **kwargs):
@@ -74,6 +78,54 @@ class FilteredListSerializer(serializers.ListSerializer):
         return super(FilteredListSerializer, self).to_representation(queryset)
 
 
+class FragmentCacheListSerializer(serializers.ListSerializer):
+    """
+        Reuses the cached representations of the listed activities (see
+        common/fragment_cache.py) and only serializes the missing ones.
+    """
+
+    # request parameters which don't change the representation of an item:
+    uncached_params = ('page', 'page_size', 'cursor', 'count', 'format')
+
+    def get_fragment_variant(self):
+        request = self.context.get('request')
+        base_url = ''
+        params = []
+
+        if request is not None:
+            base_url = request.build_absolute_uri('/')
+            params = sorted(
+                (key, values) for key, values in request.query_params.lists()
+                if key not in self.uncached_params)
+
+        return repr((
+            self.child.__class__.__name__,
+            tuple(self.child.fields),
+            base_url,
+            params,
+        ))
+
+    def to_representation(self, data):
+        if not settings.ACTIVITY_FRAGMENT_CACHE:
+            return super(FragmentCacheListSerializer, self).to_representation(
+                data)
+
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        items = list(iterable)
+
+        fragment_cache = ActivityFragmentCache(self.get_fragment_variant())
+        fragments = fragment_cache.get_many(items)
+
+        missing = [
+            (item, self.child.to_representation(item))
+            for item in items if item.pk not in fragments
+        ]
+        fragment_cache.set_many(missing)
+        fragments.update((item.pk, fragment) for item, fragment in missing)
+
+        return [fragments[item.pk] for item in items]
+
+
 class FilterableModelSerializer(serializers.ModelSerializer):
 
     @classmethod
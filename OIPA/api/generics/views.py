@@ -106,6 +106,10 @@ class DynamicView(GenericAPIView):
             filter_fields.pop('page')
         if 'page_size' in filter_fields:
             filter_fields.pop('page_size')
+        if 'cursor' in filter_fields:
+            filter_fields.pop('cursor')
+        if 'count' in filter_fields:
+            filter_fields.pop('count')
         if 'ordering' in filter_fields:
             filter_fields.pop('ordering')
         if 'q'in filter_fields:
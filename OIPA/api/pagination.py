@@ -1,13 +1,252 @@
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
 
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from api.aggregation.aggregation import decode_cursor, encode_cursor
 
 # TODO: Include 'last' link, see
 # https://developer.github.com/guides/traversing-with-pagination/ -
 # 2016-01-20
 
 
-class CustomPagination(pagination.PageNumberPagination):
+def is_keyset_field(model, path):
+    """
+    Returns True if {path} is a field of {model}, or of a model related to
+    it through foreign keys / one-to-one relations, so it has a single
+    value per row
+    """
+    field = None
+
+    for name in path.split(LOOKUP_SEP):
+        if field is not None:
+            if not field.is_relation:
+                return False
+            model = field.related_model
+
+        try:
+            field = model._meta.pk if name == 'pk' \
+                else model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+
+        if field.many_to_many or field.one_to_many:
+            return False
+
+    return not field.is_relation
+
+
+def keyset_filter(orderings, values):
+    """
+    Returns the Q of the rows after {values} in the order of {orderings}.
+    Like in PostgreSQL, nulls come last in ascending and first in
+    descending order
+    """
+    conditions = []
+
+    for i, (ordering, value) in enumerate(zip(orderings, values)):
+        field = ordering.lstrip('-')
+        descending = ordering.startswith('-')
+        condition = Q()
+
+        for equal_ordering, equal_value in zip(orderings[:i], values[:i]):
+            equal_field = equal_ordering.lstrip('-')
+
+            if equal_value is None:
+                condition &= Q(**{equal_field + '__isnull': True})
+            else:
+                condition &= Q(**{equal_field: equal_value})
+
+        if value is None:
+            if not descending:
+                # nothing comes after null
+                continue
+            condition &= Q(**{field + '__isnull': False})
+        elif descending:
+            condition &= Q(**{field + '__lt': value})
+        else:
+            condition &= Q(**{field + '__gt': value}) | Q(
+                **{field + '__isnull': True})
+
+        conditions.append(condition)
+
+    if not conditions:
+        return Q(pk__in=[])
+
+    return reduce(or_, conditions)
+
+
+class KeysetPaginationMixin(object):
+    """
+    Adds two opt-in modes to page number pagination:
+
+    - `cursor` (empty for the first page): keyset pagination. The page
+      starts after the row of an opaque cursor token, on the ordering of
+      the queryset plus its primary key, instead of skipping the rows of
+      all previous pages. The count is only included with `count=true`.
+    - `count=false`: skips the COUNT(*) of page number pagination, the
+      next link is given when there's another row after the page.
+    """
+
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    mode = None
+    count = None
+    has_next = False
+    next_cursor = None
+
+    def get_count_param(self, request, default):
+        value = request.query_params.get(self.count_query_param)
+
+        if value is None:
+            return default
+
+        return value.lower() not in ('0', 'false')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        cursor = request.query_params.get(self.cursor_query_param)
+
+        if cursor is not None:
+            self.mode = 'cursor'
+            return self.paginate_keyset(queryset, request, cursor)
+
+        if not self.get_count_param(request, True):
+            self.mode = 'uncounted'
+            return self.paginate_uncounted(queryset, request)
+
+        return super(KeysetPaginationMixin, self).paginate_queryset(
+            queryset, request, view)
+
+    def get_keyset_orderings(self, queryset):
+        """
+        Returns the orderings of {queryset}, followed by its primary key
+        """
+        model = queryset.model
+        orderings = list(queryset.query.order_by) or list(
+            queryset.query.get_meta().ordering)
+
+        for ordering in orderings:
+            if not isinstance(ordering, str) or \
+                    not is_keyset_field(model, ordering.lstrip('-')):
+                raise ValidationError(
+                    "Ordering {} can't be used with a cursor".format(
+                        ordering))
+
+        pk_names = ('pk', model._meta.pk.name)
+        if not [o for o in orderings if o.lstrip('-') in pk_names]:
+            orderings.append('pk')
+
+        return orderings
+
+    def paginate_keyset(self, queryset, request, cursor):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        orderings = self.get_keyset_orderings(queryset)
+
+        if self.get_count_param(request, False):
+            self.count = queryset.count()
+
+        queryset = queryset.order_by(*orderings)
+
+        if cursor:
+            try:
+                values = decode_cursor(cursor, orderings)
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+
+            queryset = queryset.filter(keyset_filter(orderings, values))
+
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+
+        if self.has_next:
+            last = queryset.model._base_manager.filter(
+                pk=rows[-1].pk
+            ).values_list(*[o.lstrip('-') for o in orderings]).first()
+            self.next_cursor = encode_cursor(orderings, list(last))
+
+        return rows
+
+    def paginate_uncounted(self, queryset, request):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        try:
+            self.page_number = int(
+                request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+
+        if self.page_number < 1:
+            raise NotFound(self.invalid_page_message)
+
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(rows) > page_size
+
+        return rows[:page_size]
+
+    def get_next_link(self):
+        if self.mode is None:
+            return super(KeysetPaginationMixin, self).get_next_link()
+
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+
+        if self.mode == 'cursor':
+            return replace_query_param(
+                url, self.cursor_query_param, self.next_cursor)
+
+        return replace_query_param(
+            url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.mode is None:
+            return super(KeysetPaginationMixin, self).get_previous_link()
+
+        # cursors only go forward:
+        if self.mode == 'cursor' or self.page_number <= 1:
+            return None
+
+        url = self.request.build_absolute_uri()
+
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+
+        return replace_query_param(
+            url, self.page_query_param, self.page_number - 1)
+
+    def get_paginated_response(self, data):
+        if self.mode is None:
+            return super(KeysetPaginationMixin, self).get_paginated_response(
+                data)
+
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class CustomPagination(KeysetPaginationMixin,
+                       pagination.PageNumberPagination):
     page_size = 10  # default
     max_page_size = 20
     page_size_query_param = 'page_size'
@@ -17,7 +256,8 @@ class CustomTransactionPagination(CustomPagination):
     max_page_size = 20
 
 
-class IatiXMLPagination(pagination.PageNumberPagination):
+class IatiXMLPagination(KeysetPaginationMixin,
+                        pagination.PageNumberPagination):
     page_size = 10  # default
     max_page_size = 20
     page_size_query_param = 'page_size'
@@ -38,6 +38,7 @@ from api.iati.references import (
     SectorReference, TagReference, TitleReference, TotalBudgetOrgReference,
     TotalExpenditureOrgReference, TransactionReference, XmlLangReference
 )
+from common.fragment_cache import ActivityFragmentCache
 
 # TODO: Make this more generic - 2016-01-21
 
@@ -133,6 +134,144 @@ class XMLRenderer(BaseRenderer):
             pass
 
 
+class XMLStreamBuffer(object):
+    """
+    File-like object which collects the bytes written to it until they are
+    read.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    def read(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class StreamingXMLRenderer(XMLRenderer):
+    """
+    Writes the XML of a queryset incrementally (etree.xmlfile), a chunk of
+    instances at a time, instead of building the whole tree in memory.
+
+    The ids of the queryset are read with a server-side cursor and every
+    chunk is fetched with the prefetches of the queryset (e.g.
+    prefetch_all()), serialized and written, so memory use does not grow
+    with the number of instances.
+    """
+
+    chunk_size = 500
+
+    def __init__(self, chunk_size=None):
+        if chunk_size:
+            self.chunk_size = chunk_size
+
+    def iter_chunks(self, queryset):
+        """
+        Yields the instances of {queryset} in lists of chunk_size, in the
+        order of the queryset
+        """
+        pks = []
+
+        for pk in queryset.values_list('pk', flat=True).iterator(
+                chunk_size=self.chunk_size):
+            pks.append(pk)
+
+            if len(pks) >= self.chunk_size:
+                yield list(queryset.filter(pk__in=pks))
+                pks = []
+
+        if pks:
+            yield list(queryset.filter(pk__in=pks))
+
+    def render_items(self, instances, serializer_class, context=None):
+        """
+        Returns the serialized XML of each of {instances}
+        """
+        serializer = serializer_class(instances, many=True, context=context)
+        fragments = []
+
+        for item in serializer.data:
+            xml = etree.Element(self.item_tag_name)
+            self._to_xml(xml, item)
+            fragments.append(etree.tostring(xml, encoding=self.charset))
+
+        return fragments
+
+    def get_fragments(self, instances, serializer_class, context=None):
+        """
+        Returns the serialized XML of each of {instances}, from the fragment
+        cache (see common/fragment_cache.py) when it is on
+        """
+        if not settings.ACTIVITY_FRAGMENT_CACHE:
+            return self.render_items(instances, serializer_class, context)
+
+        fragment_cache = ActivityFragmentCache('xml:{}:{}'.format(
+            serializer_class.__name__, self.version))
+        fragments = fragment_cache.get_many(instances)
+
+        missing = [
+            instance for instance in instances
+            if instance.pk not in fragments
+        ]
+
+        if missing:
+            rendered = list(zip(missing, self.render_items(
+                missing, serializer_class, context)))
+            fragment_cache.set_many(rendered)
+            fragments.update(
+                (instance.pk, fragment) for instance, fragment in rendered)
+
+        return [fragments[instance.pk] for instance in instances]
+
+    def write(self, output, queryset, serializer_class, context=None):
+        """
+        Writes the XML of {queryset} to {output} (a file-like object).
+        Yields after every chunk has been written.
+        """
+        with etree.xmlfile(output, encoding=self.charset) as xf:
+            xf.write_declaration()
+
+            with xf.element(self.root_tag_name, version=self.version):
+                if hasattr(settings, 'EXPORT_COMMENT'):
+                    xf.write(
+                        etree.Comment(getattr(settings, 'EXPORT_COMMENT')),
+                        pretty_print=True)
+
+                for instances in self.iter_chunks(queryset):
+                    for fragment in self.get_fragments(
+                            instances, serializer_class, context):
+                        xf.write(etree.fromstring(fragment), pretty_print=True)
+
+                    xf.flush()
+                    yield
+
+    def stream(self, queryset, serializer_class, context=None):
+        """
+        Yields the XML of {queryset} in chunks of bytes, for a
+        StreamingHttpResponse
+        """
+        output = XMLStreamBuffer()
+
+        for _ in self.write(output, queryset, serializer_class, context):
+            data = output.read()
+            if data:
+                yield data
+
+        yield output.read()
+
+    def write_file(self, path, queryset, serializer_class, context=None):
+        """
+        Writes the XML of {queryset} to the file at {path}
+        """
+        with open(path, 'wb') as output:
+            for _ in self.write(output, queryset, serializer_class, context):
+                pass
+
+
 # TODO: test this, see: #958
 class PaginatedCSVRenderer(CSVRenderer):
     results_field = 'results'
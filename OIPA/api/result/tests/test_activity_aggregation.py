@@ -1,7 +1,7 @@
 import datetime
 from decimal import Decimal
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 
 from iati.factory import iati_factory
@@ -99,3 +99,19 @@ class ResultAggregationTestCase(TestCase):
         # self.assertEqual(results[0]['result_indicator_title'], 'a')
         self.assertEqual(results[0]['targets'], Decimal(130))
         self.assertEqual(results[0]['actuals'], Decimal(40))
+
+    @override_settings(
+        AGGREGATION_SINGLE_QUERY=True, AGGREGATION_DATABASE_PAGINATION=True)
+    def test_targets_actuals_single_query(self):
+        """targets and actuals are joined through different one-to-many
+        relations, so they aren't multiplied by each other's rows in one query
+        """
+        results = self.get_results(
+            group_by='result_indicator_title',
+            aggregations='actuals,targets,activity_count',
+            order_by='result_indicator_title')
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['targets'], Decimal(130))
+        self.assertEqual(results[0]['actuals'], Decimal(40))
+        self.assertEqual(results[0]['activity_count'], 1)
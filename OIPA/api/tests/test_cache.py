@@ -0,0 +1,74 @@
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+
+from api.cache import get_request_tags
+from common.cache_tags import (
+    ALL_TAG, get_dataset_tags, get_tag_versions, invalidate_dataset_tags
+)
+from iati.factory import iati_factory
+from iati_synchroniser.factory.synchroniser_factory import (
+    DatasetFactory, PublisherFactory
+)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+})
+class DatasetCacheTagsTestCase(TestCase):
+
+    def setUp(self):
+        self.dataset = DatasetFactory.create(
+            publisher=PublisherFactory.create(
+                iati_id='publisher-1', publisher_iati_id='NL-1'))
+        self.other_dataset = DatasetFactory.create(
+            publisher=PublisherFactory.create(
+                iati_id='publisher-2', publisher_iati_id='NL-2'))
+
+    def test_request_tags(self):
+        self.assertEqual(
+            get_request_tags(QueryDict('recipient_country=NL')), [ALL_TAG])
+        self.assertEqual(
+            get_request_tags(QueryDict(
+                'dataset_id=1,2&reporting_org_identifier=NL-1')),
+            ['dataset:1', 'dataset:2', 'organisation_identifier:NL-1'])
+
+    def test_invalidate_dataset_tags(self):
+        tags = [
+            'dataset:{}'.format(self.dataset.id),
+            'organisation_identifier:NL-2',
+            ALL_TAG,
+        ]
+        versions = get_tag_versions(tags)
+
+        invalidate_dataset_tags(self.dataset)
+        new_versions = get_tag_versions(tags)
+
+        self.assertNotEqual(new_versions[0], versions[0])
+        # other publishers' responses are kept:
+        self.assertEqual(new_versions[1], versions[1])
+        self.assertNotEqual(new_versions[2], versions[2])
+
+    def test_invalidate_previous_tags(self):
+        """
+        The tags of the activities removed by a reparse are expired too
+        """
+        activity = iati_factory.ActivityFactory.create(dataset=self.dataset)
+        iati_factory.ActivityReportingOrganisationFactory.create(
+            activity=activity,
+            organisation=iati_factory.OrganisationFactory.create(
+                organisation_identifier='NL-3'))
+
+        tags = ['organisation_identifier:NL-3']
+        versions = get_tag_versions(tags)
+        previous_tags = get_dataset_tags(self.dataset)
+        self.assertIn(tags[0], previous_tags)
+
+        activity.delete()
+        invalidate_dataset_tags(self.dataset, previous_tags)
+
+        self.assertNotEqual(get_tag_versions(tags), versions)
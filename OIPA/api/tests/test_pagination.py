@@ -0,0 +1,106 @@
+import datetime
+from urllib.parse import parse_qs, urlparse
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.pagination import CustomPagination
+from iati.factory.iati_factory import ActivityFactory
+from iati.models import Activity
+from iati.transaction.factories import (
+    TransactionFactory, TransactionTypeFactory
+)
+from iati.transaction.models import Transaction
+
+
+class KeysetPaginationTestCase(TestCase):
+
+    def setUp(self):
+        activity = ActivityFactory()
+        transaction_type = TransactionTypeFactory(code=1)
+
+        for value in (100, 150, 150, 200, 250):
+            TransactionFactory(
+                value=value,
+                activity=activity,
+                transaction_type=transaction_type)
+
+        self.queryset = Transaction.objects.order_by('-value')
+
+    def paginate(self, params):
+        request = Request(APIRequestFactory().get('/', params))
+        paginator = CustomPagination()
+        rows = paginator.paginate_queryset(self.queryset, request)
+
+        return rows, paginator.get_next_link(), paginator.count
+
+    def get_cursor(self, link):
+        return parse_qs(urlparse(link).query)['cursor'][0]
+
+    def test_cursor_pages(self):
+        values = []
+        params = {'cursor': '', 'page_size': 2}
+
+        while True:
+            rows, next_link, count = self.paginate(params)
+            values.extend(row.value for row in rows)
+            self.assertIsNone(count)
+
+            if next_link is None:
+                break
+
+            params['cursor'] = self.get_cursor(next_link)
+
+        self.assertEqual(values, [
+            t.value for t in self.queryset.order_by('-value', 'pk')])
+
+    def test_cursor_count(self):
+        rows, next_link, count = self.paginate(
+            {'cursor': '', 'page_size': 2, 'count': 'true'})
+
+        self.assertEqual(count, 5)
+
+    def test_uncounted_pages(self):
+        rows, next_link, count = self.paginate(
+            {'count': 'false', 'page_size': 2, 'page': 3})
+
+        self.assertEqual(len(rows), 1)
+        self.assertIsNone(next_link)
+        self.assertIsNone(count)
+
+
+class KeysetDatetimePaginationTestCase(TestCase):
+    """
+    Activities updated within the same millisecond
+    """
+
+    def setUp(self):
+        updated = datetime.datetime(2019, 1, 1, 12, 0, 0, 1000, timezone.utc)
+
+        for i in range(3):
+            ActivityFactory(
+                iati_identifier='IATI-{}'.format(i),
+                last_updated_datetime=updated + datetime.timedelta(
+                    microseconds=i * 100))
+
+    def test_cursor_pages(self):
+        queryset = Activity.objects.order_by('-last_updated_datetime')
+        identifiers = []
+        params = {'cursor': '', 'page_size': 1}
+
+        while True:
+            request = Request(APIRequestFactory().get('/', params))
+            paginator = CustomPagination()
+            rows = paginator.paginate_queryset(queryset, request)
+            identifiers.extend(row.iati_identifier for row in rows)
+            next_link = paginator.get_next_link()
+
+            if next_link is None:
+                break
+
+            params['cursor'] = parse_qs(
+                urlparse(next_link).query)['cursor'][0]
+
+        self.assertEqual(identifiers, ['IATI-2', 'IATI-1', 'IATI-0'])
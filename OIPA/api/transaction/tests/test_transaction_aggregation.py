@@ -1,10 +1,14 @@
 from decimal import Decimal
+from urllib.parse import urlencode
 
-from django.test import TestCase
+from django.db.models import Sum
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 
 from iati.factory import iati_factory
 from iati.transaction import factories as transaction_factory
+from iati.transaction.facts import refresh_transaction_facts
+from iati.transaction.models import Transaction, TransactionFact
 
 
 class TransactionAggregationTestCase(TestCase):
@@ -180,3 +184,77 @@ class TransactionAggregationTestCase(TestCase):
         self.assertTrue(len(results) == 2)
         self.assertEqual(results[0]['incoming_fund'], Decimal(67500))
         self.assertEqual(results[1]['incoming_fund'], Decimal(17500))
+
+    def test_multiple_aggregations_single_query(self):
+        """all aggregations in one query give the results of a query per
+        aggregation (commitments: none, so 0)
+        """
+        def get_results(single_query):
+            with override_settings(AGGREGATION_SINGLE_QUERY=single_query):
+                return self.get_results(
+                    group_by='recipient_country',
+                    aggregations='count,incoming_fund,commitment',
+                    order_by='recipient_country')
+
+        results = get_results(True)
+
+        self.assertEqual(results, get_results(False))
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]['incoming_fund'], Decimal(67500))
+        self.assertEqual(results[0]['commitment'], 0)
+
+    def test_recipient_country_pages(self):
+        """the groups are paged by page number or by cursor
+        """
+        url = '/api/transactions/aggregations/?' + urlencode({
+            'format': 'json',
+            'group_by': 'recipient_country',
+            'aggregations': 'incoming_fund',
+            'order_by': '-incoming_fund',
+            'page_size': 1,
+        })
+
+        response = self.api_client.get(url + '&page=2')
+
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(
+            response.data['results'][0]['incoming_fund'], Decimal(17500))
+
+        results = []
+        cursor = ''
+        while cursor is not None:
+            response = self.api_client.get(
+                url + '&' + urlencode({'cursor': cursor}))
+            results.extend(response.data['results'])
+            cursor = response.data['next_cursor']
+
+        self.assertEqual(
+            [result['incoming_fund'] for result in results],
+            [Decimal(67500), Decimal(17500)])
+
+
+@override_settings(TRANSACTION_FACTS=True)
+class TransactionFactAggregationTestCase(TransactionAggregationTestCase):
+    """
+    The same aggregations, answered from the TransactionFact table
+    """
+
+    def setUp(self):
+        super(TransactionFactAggregationTestCase, self).setUp()
+        refresh_transaction_facts()
+
+    def test_fact_values_add_up(self):
+        """the values of the rows of a transaction add up to its value
+        (t2: 2 sectors x 2 countries = 4 rows)
+        """
+        for transaction in Transaction.objects.all():
+            facts = TransactionFact.objects.filter(transaction=transaction)
+
+            self.assertEqual(
+                facts.aggregate(Sum('value'))['value__sum'],
+                transaction.value)
+
+        self.assertEqual(
+            TransactionFact.objects.filter(
+                transaction__value=10000).count(), 4)
@@ -30,7 +30,7 @@ from iati.models import (
     OrganisationType, PolicySignificance, Sector, TiedStatus
 )
 from iati.transaction.models import (
-    Transaction, TransactionSector, TransactionType
+    Transaction, TransactionFact, TransactionSector, TransactionType
 )
 
 
@@ -234,23 +234,24 @@ currencies = [
 ]
 
 
-def annotate_currency(query_params, groupings):
-    """
-    Choose the right currency field, and aggregate differently based on
-    group_by
-    """
+def get_currency_field(query_params):
     currency = query_params.get('convert_to')
-    currency_field = None
 
     if currency:
         currency = currency.lower()
 
     if currency is None or currency not in currencies:
-        currency_field = 'value'
-    else:
-        currency_field = currency + '_value'
+        return 'value'
 
-    annotation_components = F(currency_field)
+    return currency + '_value'
+
+
+def annotate_currency(query_params, groupings):
+    """
+    Choose the right currency field, and aggregate differently based on
+    group_by
+    """
+    annotation_components = F(get_currency_field(query_params))
 
     param_additions = []
 
@@ -282,6 +283,44 @@ def annotate_currency(query_params, groupings):
     return Sum(annotation_components)
 
 
+# TransactionFact weight of the split selected by a query param or group by:
+fact_weights = {
+    'recipient_country': 'recipient_country_weight',
+    'recipient_region': 'recipient_region_weight',
+    'sector': 'sector_weight',
+}
+
+# TransactionFact lookups of the filters on splits:
+fact_split_filters = {
+    'recipient_country': 'recipient_country__code__in',
+    'recipient_region': 'recipient_region__code__in',
+    'sector': 'sector__code__in',
+}
+
+
+def annotate_fact_currency(query_params, groupings):
+    """
+    annotate_currency() for TransactionFact rows: the value is multiplied
+    by the weights of the splits that are filtered on or grouped by
+    """
+    annotation_components = F(get_currency_field(query_params))
+
+    weight_fields = set(
+        fact_weights[param] for param in query_params
+        if param in fact_weights)
+
+    for grouping in groupings:
+        if grouping.query_param == 'sector_category':
+            weight_fields.add('sector_weight')
+        elif grouping.query_param in fact_weights:
+            weight_fields.add(fact_weights[grouping.query_param])
+
+    for weight_field in sorted(weight_fields):
+        annotation_components = annotation_components * F(weight_field)
+
+    return Sum(annotation_components)
+
+
 class TransactionAggregation(AggregationView):
     """
     Returns aggregations based on the item grouped by, and the selected
@@ -652,6 +691,110 @@ class TransactionAggregation(AggregationView):
         ),
     )
 
+    # Groupings on TransactionFact rows that differ from the ones above:
+    fact_groupings = (
+        GroupBy(
+            query_param="recipient_country",
+            fields="recipient_country",
+            queryset=Country.objects.all(),
+            serializer=CountrySerializer,
+            serializer_fields=('url', 'code', 'name', 'location', 'region'),
+            name_search_field='recipient_country__name',
+            renamed_name_search_field='recipient_country_name',
+        ),
+        GroupBy(
+            query_param="recipient_region",
+            fields="recipient_region",
+            queryset=Region.objects.all(),
+            serializer=RegionSerializer,
+            serializer_fields=('url', 'code', 'name', 'location'),
+            name_search_field="recipient_region__name",
+            renamed_name_search_field="recipient_region_name",
+        ),
+        GroupBy(
+            query_param="sector",
+            fields="sector",
+            queryset=Sector.objects.all(),
+            serializer=SectorSerializer,
+            serializer_fields=('url', 'code', 'name', 'location'),
+            name_search_field="sector__name",
+            renamed_name_search_field="sector_name",
+        ),
+        GroupBy(
+            query_param="sector_category",
+            fields="sector__category",
+            renamed_fields="sector_category",
+            queryset=Sector.objects.all(),
+            serializer=SectorSerializer,
+            serializer_fields=("code", "name"),
+        ),
+    )
+
+    # Groupings which need the transaction table (its transaction_date
+    # column would make the transaction_date_* groupings ambiguous):
+    fact_excluded_groupings = ('provider_org', 'receiver_org')
+
+    fact_aggregations = (
+        Aggregation(
+            query_param='count',
+            field='count',
+            annotate=Count('transaction', distinct=True),
+        ),
+    )
+
+    def get_fact_aggregation(self, aggregation):
+        if aggregation.annotate is annotate_currency:
+            return Aggregation(
+                query_param=aggregation.query_param,
+                field=aggregation.field,
+                annotate=annotate_fact_currency,
+                extra_filter=aggregation.extra_filter,
+            )
+
+        for fact_aggregation in self.fact_aggregations:
+            if fact_aggregation.query_param == aggregation.query_param:
+                return fact_aggregation
+
+        return aggregation
+
+    def get_aggregation_source(self, queryset, groupings, aggregations):
+        """
+        Aggregates the TransactionFact rows of the filtered transactions
+        instead of joining the transactions to their splits, when
+        settings.TRANSACTION_FACTS is on
+        """
+        if not settings.TRANSACTION_FACTS or any(
+                grouping.query_param in self.fact_excluded_groupings
+                for grouping in groupings):
+            return queryset, groupings, aggregations
+
+        facts = TransactionFact.objects.all()
+
+        if queryset.query.where:
+            facts = facts.filter(
+                transaction__in=queryset.order_by().values('pk'))
+
+        params = self.request.query_params
+
+        # only the rows of the selected splits, like the filter's join:
+        for query_param, lookup in fact_split_filters.items():
+            if params.get(query_param):
+                facts = facts.filter(
+                    **{lookup: params[query_param].split(',')})
+
+        fact_groupings = {
+            grouping.query_param: grouping
+            for grouping in self.fact_groupings
+        }
+
+        return (
+            facts,
+            [fact_groupings.get(grouping.query_param, grouping)
+             for grouping in groupings],
+            [self.get_fact_aggregation(aggregation)
+             for aggregation in aggregations],
+        )
+
     @method_decorator(
         cache_page(settings.CACHES.get('default').get('TIMEOUT'))
     )
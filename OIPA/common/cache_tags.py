@@ -0,0 +1,86 @@
+"""Version stamps of the datasets and publishers cached responses depend on.
+
+Every tag ('dataset:12', 'publisher:3', ...) has a version stamp in the API
+cache. The cache keys of the API responses include the stamps of the tags
+the response depends on (see api.cache.DatasetTagsKeyBit), so changing the
+stamps of a dataset's tags after it is parsed expires only the responses
+which depend on that dataset. Responses which aren't filtered by a dataset
+or publisher depend on ALL_TAG, which changes after every parse.
+"""
+import uuid
+
+from django.core.cache import caches
+from rest_framework_extensions.settings import extensions_api_settings
+
+# Tag of the responses which depend on all datasets:
+ALL_TAG = 'all'
+
+
+def get_cache():
+    return caches[extensions_api_settings.DEFAULT_USE_CACHE]
+
+
+def get_tag_key(tag):
+    return 'cache-tag:{}'.format(tag)
+
+
+def get_tag_versions(tags):
+    """
+    Returns the version stamps of {tags}, in the order of {tags}
+    """
+    keys = [get_tag_key(tag) for tag in tags]
+    versions = get_cache().get_many(keys)
+
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        get_cache().set_many(missing, None)
+        versions.update(missing)
+
+    return [versions[key] for key in keys]
+
+
+def invalidate_tags(tags):
+    """
+    Expires the cached responses which depend on any of {tags}
+    """
+    version = uuid.uuid4().hex
+
+    get_cache().set_many(
+        {get_tag_key(tag): version for tag in tags}, None)
+
+
+def get_dataset_tags(dataset):
+    """
+    Returns the tags of the responses which depend on {dataset}
+    """
+    from iati.models import ActivityReportingOrganisation
+
+    publisher = dataset.publisher
+    tags = {
+        ALL_TAG,
+        'dataset:{}'.format(dataset.id),
+        'dataset_iati_id:{}'.format(dataset.iati_id),
+        'publisher:{}'.format(publisher.id),
+        'publisher_iati_id:{}'.format(publisher.iati_id),
+        'organisation_identifier:{}'.format(publisher.publisher_iati_id),
+    }
+
+    tags.update(
+        'organisation_identifier:{}'.format(identifier)
+        for identifier in ActivityReportingOrganisation.objects.filter(
+            activity__dataset=dataset,
+            organisation__isnull=False,
+        ).values_list(
+            'organisation__organisation_identifier', flat=True).distinct()
+    )
+
+    return sorted(tags)
+
+
+def invalidate_dataset_tags(dataset, previous_tags=()):
+    """
+    Expires the cached responses which depend on {dataset}, now or before
+    it was parsed ({previous_tags}, see get_dataset_tags()): a reparse can
+    remove activities or change their reporting organisation
+    """
+    invalidate_tags(set(get_dataset_tags(dataset)) | set(previous_tags))
@@ -0,0 +1,124 @@
+"""Cache of the serialized representations (fragments) of activities.
+
+An activity only changes when its dataset is reparsed, so its JSON and IATI
+XML representations are cached per activity and reused by list endpoints
+and exports instead of running the nested serializers again. All fragments
+of an activity share one cache entry, keyed by the activity id and its
+last_updated_model, which holds a fragment per variant (serializer, fields,
+request parameters).
+
+The entry of an activity is dropped by the parser after the activity is
+saved (see post_save.invalidate_activity_fragments()), or after its links
+to the saved activity are updated (see
+post_save.invalidate_linking_activity_fragments()). Data which is
+changed without saving the activity (aggregations, converted values)
+invalidates all entries at once by changing the generation stamp in their
+keys.
+
+Only used when settings.ACTIVITY_FRAGMENT_CACHE is on.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework_extensions.settings import extensions_api_settings
+
+# Cache key of the generation stamp of all fragment keys:
+FRAGMENT_GENERATION_KEY = 'common.fragment_cache.generation'
+
+
+def get_cache():
+    return caches[extensions_api_settings.DEFAULT_USE_CACHE]
+
+
+def get_generation():
+    generation = get_cache().get(FRAGMENT_GENERATION_KEY)
+
+    if generation is None:
+        generation = '0'
+        get_cache().set(FRAGMENT_GENERATION_KEY, generation, None)
+
+    return generation
+
+
+def invalidate_all_fragments():
+    """
+    Drops the fragments of all activities
+    """
+    get_cache().set(FRAGMENT_GENERATION_KEY, str(time.time()), None)
+
+
+def get_fragment_key(generation, activity):
+    """
+    Returns the cache key of the fragments of {activity}, or None when the
+    activity can't be cached
+    """
+    if not activity.pk or not activity.last_updated_model:
+        return None
+
+    return 'activity-fragments:{}:{}:{}'.format(
+        generation, activity.pk, activity.last_updated_model.timestamp())
+
+
+def invalidate_activity_fragments(activities):
+    """
+    Drops the fragments of {activities}
+    """
+    generation = get_generation()
+    keys = [get_fragment_key(generation, activity) for activity in activities]
+
+    get_cache().delete_many([key for key in keys if key])
+
+
+class ActivityFragmentCache(object):
+    """
+    Reads and writes the fragments of one {variant} for a list of
+    activities, with one cache round trip each way.
+    """
+
+    def __init__(self, variant):
+        self.variant = variant
+        self.generation = get_generation()
+        # cache key -> entry (variant -> fragment) of the read activities
+        self.entries = {}
+
+    def get_many(self, activities):
+        """
+        Returns the cached fragments of {activities} as {activity pk:
+        fragment}
+        """
+        keys = {}
+
+        for activity in activities:
+            key = get_fragment_key(self.generation, activity)
+
+            if key:
+                keys[key] = activity.pk
+
+        self.entries = get_cache().get_many(list(keys))
+
+        return {
+            keys[key]: entry[self.variant]
+            for key, entry in self.entries.items()
+            if self.variant in entry
+        }
+
+    def set_many(self, fragments):
+        """
+        Caches {fragments}, a list of (activity, fragment)
+        """
+        entries = {}
+
+        for activity, fragment in fragments:
+            key = get_fragment_key(self.generation, activity)
+
+            if key:
+                entry = dict(self.entries.get(key, {}))
+                entry[self.variant] = fragment
+                entries[key] = entry
+
+        if entries:
+            get_cache().set_many(
+                entries,
+                settings.REST_FRAMEWORK_EXTENSIONS.get(
+                    'DEFAULT_CACHE_RESPONSE_TIMEOUT'))
@@ -1,8 +1,33 @@
 from django.core.cache import cache
 from django.core.management.base import BaseCommand
 
+from common.cache_tags import invalidate_dataset_tags
+from iati_synchroniser.models import Dataset
+
 
 class Command(BaseCommand):
-    def handle(self, *args, **kwargs):
+    """
+    Clear the cache, or only expire the cached API responses which depend on
+    one dataset
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dataset',
+            type=int,
+            dest='dataset_id',
+            default=None,
+            help='Only the API responses which depend on this dataset',
+        )
+
+    def handle(self, *args, **options):
+        if options['dataset_id']:
+            invalidate_dataset_tags(
+                Dataset.objects.get(pk=options['dataset_id']))
+            self.stdout.write(
+                'Expired cached responses of dataset {}\n'.format(
+                    options['dataset_id']))
+            return
+
         cache.clear()
         self.stdout.write('Cleared cache\n')
@@ -7,6 +7,7 @@ import psycopg2
 from django.db import connection
 from django.db.models import Q
 from django.utils.encoding import force_text, smart_text
+from psycopg2.extras import execute_values
 
 
 def get_or_none(model, *args, **kwargs):
@@ -76,3 +77,55 @@ def normalise_unicode_string(any_str):
         if isinstance(any_str, str):
             any_str = smart_text(any_str, 'utf-8')
     return any_str
+
+
+def bulk_upsert(model, instances, conflict_fields, batch_size=1000,
+                update_fields=None):
+    """
+    Inserts {instances} of {model}, updating the existing rows with the same
+    (unique) {conflict_fields} in place: INSERT ... ON CONFLICT DO UPDATE,
+    which bulk_create() can't do in this Django version. PostgreSQL only.
+
+    With {update_fields} only those fields of the existing rows are updated.
+    """
+    quote_name = connection.ops.quote_name
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+    conflict_columns = [
+        model._meta.get_field(name).column for name in conflict_fields
+    ]
+
+    if update_fields is None:
+        update_columns = [field.column for field in fields]
+    else:
+        update_columns = [
+            model._meta.get_field(name).column for name in update_fields
+        ]
+
+    sql = 'INSERT INTO {table} ({columns}) VALUES %s ' \
+        'ON CONFLICT ({conflict_columns}) DO UPDATE SET {updates}'.format(
+            table=quote_name(model._meta.db_table),
+            columns=', '.join(quote_name(field.column) for field in fields),
+            conflict_columns=', '.join(
+                quote_name(column) for column in conflict_columns),
+            updates=', '.join(
+                '{0} = EXCLUDED.{0}'.format(quote_name(column))
+                for column in update_columns
+                if column not in conflict_columns),
+        )
+
+    rows = [
+        tuple(
+            field.get_db_prep_save(getattr(instance, field.attname),
+                                   connection)
+            for field in fields)
+        for instance in instances
+    ]
+
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), batch_size):
+            execute_values(
+                cursor.cursor, sql, rows[i:i + batch_size],
+                page_size=batch_size)
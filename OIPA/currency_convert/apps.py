@@ -6,3 +6,8 @@ from django.apps import AppConfig
 class CurrencyConvertConfig(AppConfig):
     name = 'currency_convert'
     verbose_name = 'Exchange rates'
+
+    # pylint: disable=no-self-use
+    def ready(self):
+        # pylint: disable=unused-variable
+        import currency_convert.signals  # NOQA: F401
@@ -1,17 +1,12 @@
-from django.core.exceptions import ObjectDoesNotExist
-
-from currency_convert.models import MonthlyAverage
+from currency_convert.rate_table import rate_table
 
 
 def get_monthly_average(currency_iso, value_date):
-    try:
-        ma = MonthlyAverage.objects.get(
-            year=value_date.year,
-            month=value_date.month,
-            currency=currency_iso)
-        return ma.value
-    except ObjectDoesNotExist:
-        return False
+    return rate_table.get_rate(currency_iso, value_date)
+
+
+def get_rates_version():
+    return rate_table.get_rates_version()
 
 
 def currency_from_to(from_currency_iso, to_currency_iso, value_date, value):
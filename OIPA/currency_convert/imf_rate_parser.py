@@ -10,6 +10,7 @@ from django.utils.encoding import smart_text
 from lxml import etree
 
 from currency_convert.models import MonthlyAverage
+from currency_convert.rate_table import rate_table
 from iati_codelists.models import Currency
 
 
@@ -135,6 +136,9 @@ class RateParser():
                 obj.value = average_value
                 obj.save()
 
+        # let all processes reload their exchange rate tables:
+        rate_table.invalidate(publish=True)
+
     def ticks(self, dt):
         """
         calculate ticks. A single tick represents one hundred nanoseconds or
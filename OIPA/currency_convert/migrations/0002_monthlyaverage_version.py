@@ -0,0 +1,18 @@
+# Generated by Django 2.0.13 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currency_convert', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monthlyaverage',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -14,6 +14,9 @@ class MonthlyAverage(models.Model):
         null=True,
         blank=True,
         default=None)
+    # increases with every change of a rate, see currency_convert/signals.py
+    # and currency_convert/revaluation.py:
+    version = models.IntegerField(default=0)
 
     class Meta:
         unique_together = ("currency", "month", "year")
@@ -0,0 +1,156 @@
+"""Process wide table of the monthly average exchange rates to XDR.
+
+Loaded once from MonthlyAverage, instead of one query per conversion. Rates
+are kept per currency in a list indexed by month (counted from the first
+month with a rate for that currency).
+
+The table is reloaded after MonthlyAverage changes: right away in the
+process that saved the rates (see currency_convert/signals.py), and within
+RATE_TABLE_CHECK_INTERVAL seconds in other processes, through a version
+stamp in the default cache.
+"""
+import threading
+import time
+
+from django.core.cache import caches
+
+from currency_convert.models import MonthlyAverage
+
+# Cache key of the version stamp of the rates in the database:
+RATE_TABLE_VERSION_KEY = 'currency_convert.rate_table.version'
+
+# Seconds between checks of the version stamp:
+RATE_TABLE_CHECK_INTERVAL = 60
+
+
+def month_index(year, month):
+    return year * 12 + month - 1
+
+
+class RateTable(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # currency -> (month index of the first rate, [rate per month]):
+        self.rates = None
+        self.version = None
+        # highest MonthlyAverage.version of the loaded rates:
+        self.rates_version = 0
+        self.checked = 0
+
+    def invalidate(self, publish=False):
+        """
+        Drops the loaded rates. With publish=True, other processes reload
+        their rates too
+        """
+        self.rates = None
+
+        if publish:
+            caches['default'].set(
+                RATE_TABLE_VERSION_KEY, str(time.time()), None)
+
+    def load(self):
+        version = caches['default'].get(RATE_TABLE_VERSION_KEY)
+        monthly_averages = {}
+        rates_version = 0
+
+        for currency, year, month, value, rate_version in \
+                MonthlyAverage.objects.values_list(
+                    'currency_id', 'year', 'month', 'value', 'version'):
+            monthly_averages.setdefault(currency, {})[
+                month_index(year, month)] = value
+            rates_version = max(rates_version, rate_version)
+
+        rates = {}
+        for currency, by_month in monthly_averages.items():
+            first = min(by_month)
+            values = [None] * (max(by_month) - first + 1)
+
+            for index, value in by_month.items():
+                values[index - first] = value
+
+            rates[currency] = (first, values)
+
+        self.rates = rates
+        self.rates_version = rates_version
+        self.version = version
+        self.checked = time.time()
+
+    def get_rates(self):
+        if self.rates is not None \
+                and time.time() - self.checked > RATE_TABLE_CHECK_INTERVAL:
+            self.checked = time.time()
+
+            if caches['default'].get(RATE_TABLE_VERSION_KEY) != self.version:
+                self.rates = None
+
+        if self.rates is None:
+            with self.lock:
+                if self.rates is None:
+                    self.load()
+
+        return self.rates
+
+    def get_rates_version(self):
+        """
+        Returns the version stamp of the loaded rates, for values converted
+        with them (see currency_convert/revaluation.py)
+        """
+        self.get_rates()
+        return self.rates_version
+
+    def get_rate(self, currency_iso, value_date):
+        """
+        Returns the rate of {currency_iso} to XDR in the month of
+        {value_date}, or False when there's none
+        """
+        try:
+            first, values = self.get_rates()[currency_iso]
+        except KeyError:
+            return False
+
+        index = month_index(value_date.year, value_date.month) - first
+
+        if 0 <= index < len(values) and values[index] is not None:
+            return values[index]
+
+        return False
+
+    def to_xdr(self, currencies, value_dates, values):
+        """
+        Converts the {values} in {currencies} to XDR, at the rates of the
+        months of {value_dates}. Returns a list, with 0 where there's no
+        rate, like convert.to_xdr()
+        """
+        results = []
+
+        for currency_iso, value_date, value in zip(
+                currencies, value_dates, values):
+            if None in (currency_iso, value_date, value):
+                results.append(0)
+                continue
+
+            rate = self.get_rate(currency_iso, value_date)
+            results.append(value * rate if rate else 0)
+
+        return results
+
+    def from_xdr(self, currencies, value_dates, values):
+        """
+        Converts the XDR {values} to {currencies}, like convert.from_xdr()
+        """
+        results = []
+
+        for currency_iso, value_date, value in zip(
+                currencies, value_dates, values):
+            if None in (currency_iso, value_date, value):
+                results.append(0)
+                continue
+
+            rate = self.get_rate(currency_iso, value_date)
+            results.append(value / rate if rate else 0)
+
+        return results
+
+
+rate_table = RateTable()
@@ -0,0 +1,125 @@
+"""Recomputes the converted currency values of transactions and budgets.
+
+Every MonthlyAverage has a version, which increases whenever a rate changes
+(see currency_convert/signals.py), and every converted row is stamped with
+the highest version of the rates it was converted with (rates_version). A
+row is stale when one of the rates of its value date - of its own currency
+or of one of the target currencies - has a higher version than its stamp.
+
+revalue() recomputes the values of the stale rows of a table with one
+UPDATE joined against MonthlyAverage, using the same formulas as
+convert.currency_from_to(): value * rate to XDR, divided by the rate of the
+target currency, 0 when a rate is missing. XDR has no MonthlyAverage of its
+own, its rate to XDR is 1 (as in the parser, which keeps xdr_value = value).
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+
+from currency_convert.models import MonthlyAverage
+
+logger = logging.getLogger(__name__)
+
+# target currency -> column
+TARGET_CURRENCIES = (
+    ('USD', 'usd_value'),
+    ('EUR', 'eur_value'),
+    ('GBP', 'gbp_value'),
+    ('JPY', 'jpy_value'),
+    ('CAD', 'cad_value'),
+)
+
+# tables with converted values (value, currency_id and value_date columns):
+REVALUED_TABLES = (
+    'iati_transaction',
+    'iati_budget',
+)
+
+# XDR has no MonthlyAverage of its own:
+SOURCE_RATE_SQL = \
+    "CASE WHEN t.currency_id = 'XDR' THEN 1 ELSE source.value END"
+
+TARGET_RATE_SQL = \
+    "MAX(value) FILTER (WHERE currency_id = '{currency}') AS {column}"
+
+TARGET_VALUE_SQL = \
+    "CASE WHEN target.{column} <> 0 " \
+    "THEN COALESCE(t.value * {source_rate}, 0) / target.{column} " \
+    "ELSE 0 END AS {column}"
+
+REVALUE_SQL = """
+WITH target AS (
+    SELECT year, month,
+           {target_rates},
+           MAX(version) AS version
+    FROM currency_convert_monthlyaverage
+    WHERE currency_id IN ({target_currencies})
+    GROUP BY year, month
+),
+revalued AS (
+    SELECT t.id,
+           COALESCE(t.value * {source_rate}, 0) AS xdr_value,
+           {target_values}
+    FROM {table} t
+    LEFT JOIN currency_convert_monthlyaverage source
+        ON source.currency_id = t.currency_id
+        AND source.year = EXTRACT(YEAR FROM t.value_date)::integer
+        AND source.month = EXTRACT(MONTH FROM t.value_date)::integer
+    LEFT JOIN target
+        ON target.year = EXTRACT(YEAR FROM t.value_date)::integer
+        AND target.month = EXTRACT(MONTH FROM t.value_date)::integer
+    WHERE t.rates_version < GREATEST(source.version, target.version)
+)
+UPDATE {table} t
+SET xdr_value = revalued.xdr_value,
+    {target_assignments},
+    rates_version = %s
+FROM revalued
+WHERE t.id = revalued.id
+"""
+
+
+def get_revalue_sql(table):
+    return REVALUE_SQL.format(
+        table=table,
+        source_rate=SOURCE_RATE_SQL,
+        target_rates=',\n           '.join(
+            TARGET_RATE_SQL.format(currency=currency, column=column)
+            for currency, column in TARGET_CURRENCIES),
+        target_currencies=', '.join(
+            "'{}'".format(currency) for currency, column in TARGET_CURRENCIES),
+        target_values=',\n           '.join(
+            TARGET_VALUE_SQL.format(
+                column=column, source_rate=SOURCE_RATE_SQL)
+            for currency, column in TARGET_CURRENCIES),
+        target_assignments=',\n    '.join(
+            '{column} = revalued.{column}'.format(column=column)
+            for currency, column in TARGET_CURRENCIES),
+    )
+
+
+def revalue(tables=REVALUED_TABLES):
+    """
+    Recomputes the converted values of the stale rows of {tables}. Returns
+    the number of updated rows per table
+    """
+    updated = {}
+
+    if not settings.CONVERT_CURRENCIES:
+        return updated
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        rates_version = MonthlyAverage.objects.aggregate(
+            Max('version'))['version__max'] or 0
+
+        for table in tables:
+            cursor.execute(get_revalue_sql(table), [rates_version])
+            updated[table] = cursor.rowcount
+
+            logger.info(
+                "Revalued %s rows of %s (rates version %s)",
+                updated[table], table, rates_version)
+
+    return updated
@@ -0,0 +1,26 @@
+from django.db.models import Max, signals
+from django.dispatch import receiver
+
+from currency_convert.models import MonthlyAverage
+from currency_convert.rate_table import rate_table
+
+
+@receiver(signals.pre_save, sender=MonthlyAverage)
+def monthly_average_pre_save(sender, instance, **kwargs):
+    if instance.pk and MonthlyAverage.objects.filter(
+            pk=instance.pk, value=instance.value).exists():
+        return
+
+    # values converted with older rates are stale, see revaluation.py:
+    instance.version = (MonthlyAverage.objects.aggregate(
+        Max('version'))['version__max'] or 0) + 1
+
+
+@receiver(signals.post_save, sender=MonthlyAverage)
+def monthly_average_post_save(sender, instance, **kwargs):
+    rate_table.invalidate()
+
+
+@receiver(signals.post_delete, sender=MonthlyAverage)
+def monthly_average_post_delete(sender, instance, **kwargs):
+    rate_table.invalidate()
@@ -7,12 +7,14 @@ from django.test import TestCase
 from lxml.builder import E
 from mock import MagicMock, Mock
 
-from currency_convert import convert
+from currency_convert import convert, revaluation
 from currency_convert.factory.currency_convert_factory import (
     MonthlyAverageFactory
 )
 from currency_convert.imf_rate_parser import RateBrowser, RateParser
 from currency_convert.models import MonthlyAverage
+from currency_convert.rate_table import rate_table
+from iati.transaction.factories import TransactionFactory
 from iati_codelists.models import Currency
 
 
@@ -221,3 +223,110 @@ class ConvertTestCase(TestCase):
         value_date = datetime(1995, 1, 1)
         rate = convert.from_xdr('EUR', value_date, 100)
         self.assertEqual(rate, 0)
+
+
+class RateTableTestCase(TestCase):
+
+    def setUp(self):
+        self.currency, created = Currency.objects.get_or_create(
+            code='EUR', name='Euro')
+        MonthlyAverageFactory.create(
+            year=1994, month=1, currency=self.currency, value=1.5)
+        MonthlyAverageFactory.create(
+            year=1994, month=3, currency=self.currency, value=2)
+
+    def test_to_xdr(self):
+        """
+        Converts many values at once, with 0 where there's no rate
+        """
+        rates = rate_table.to_xdr(
+            ['EUR', 'EUR', 'EUR', 'USD', None],
+            [datetime(1994, 1, 5), datetime(1994, 2, 1),
+             datetime(1994, 3, 31), datetime(1994, 1, 1),
+             datetime(1994, 1, 1)],
+            [100, 100, 100, 100, 100])
+
+        self.assertEqual(rates, [150, 0, 200, 0, 0])
+
+    def test_from_xdr(self):
+        rates = rate_table.from_xdr(
+            ['EUR', 'EUR'],
+            [datetime(1994, 1, 1), datetime(1995, 1, 1)],
+            [150, 150])
+
+        self.assertEqual(rates, [100, 0])
+
+    def test_reload_after_save(self):
+        """
+        The table is reloaded when a monthly average changes
+        """
+        self.assertEqual(
+            rate_table.get_rate('EUR', datetime(1994, 1, 1)), Decimal('1.5'))
+
+        monthly_average = MonthlyAverage.objects.get(
+            year=1994, month=1, currency=self.currency)
+        monthly_average.value = 3
+        monthly_average.save()
+
+        self.assertEqual(
+            rate_table.get_rate('EUR', datetime(1994, 1, 1)), 3)
+
+
+class RevaluationTestCase(TestCase):
+
+    def setUp(self):
+        euro, created = Currency.objects.get_or_create(
+            code='EUR', name='Euro')
+        dollar, created = Currency.objects.get_or_create(
+            code='USD', name='US Dollar')
+
+        self.euro_rate = MonthlyAverageFactory.create(
+            year=1994, month=1, currency=euro, value=Decimal('1.5'))
+        MonthlyAverageFactory.create(
+            year=1994, month=1, currency=dollar, value=Decimal('0.5'))
+
+        self.transaction = TransactionFactory.create(
+            currency=euro, value=100, value_date=datetime(1994, 1, 10))
+
+    def test_revalue(self):
+        """
+        Stale rows are converted with the current rates and stamped, rows
+        converted with the current rates are left alone
+        """
+        updated = revaluation.revalue(tables=('iati_transaction',))
+        self.assertEqual(updated['iati_transaction'], 1)
+
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.xdr_value, 150)
+        self.assertEqual(self.transaction.usd_value, 300)
+        self.assertEqual(self.transaction.eur_value, 100)
+        self.assertEqual(
+            self.transaction.rates_version, self.euro_rate.version + 1)
+
+        updated = revaluation.revalue(tables=('iati_transaction',))
+        self.assertEqual(updated['iati_transaction'], 0)
+
+        self.euro_rate.value = 2
+        self.euro_rate.save()
+
+        updated = revaluation.revalue(tables=('iati_transaction',))
+        self.assertEqual(updated['iati_transaction'], 1)
+
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.usd_value, 400)
+
+    def test_revalue_xdr(self):
+        """
+        XDR amounts have no rate of their own, they are converted with a rate
+        of 1 instead of being zeroed
+        """
+        xdr, created = Currency.objects.get_or_create(
+            code='XDR', name='SDR')
+        transaction = TransactionFactory.create(
+            currency=xdr, value=100, value_date=datetime(1994, 1, 10))
+
+        revaluation.revalue(tables=('iati_transaction',))
+
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.xdr_value, 100)
+        self.assertEqual(transaction.usd_value, 200)
@@ -1,14 +1,39 @@
+from collections import defaultdict
+
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.db.models import Sum
 from django.db.utils import IntegrityError as Integrity
 
+from common.fragment_cache import invalidate_all_fragments
+from common.util import bulk_upsert
 from iati.models import (
-    Activity, ActivityAggregation, ActivityPlusChildAggregation,
+    Activity, ActivityAggregation, ActivityPlusChildAggregation, Budget,
     ChildAggregation
 )
 from iati.transaction.models import Transaction
 
+# transaction type code -> prefix of the aggregation fields
+TRANSACTION_TYPE_AGGREGATIONS = (
+    ('1', 'incoming_funds'),
+    ('2', 'commitment'),
+    ('3', 'disbursement'),
+    ('4', 'expenditure'),
+    ('5', 'interest_payment'),
+    ('6', 'loan_repayment'),
+    ('7', 'reimbursement'),
+    ('8', 'purchase_of_equity'),
+    ('9', 'sale_of_equity'),
+    ('10', 'credit_guarantee'),
+    ('11', 'incoming_commitment'),
+)
+
+AGGREGATION_TYPES = ['budget'] + [
+    aggregation_type
+    for code, aggregation_type in TRANSACTION_TYPE_AGGREGATIONS
+]
+
 
 class ActivityAggregationCalculation():
 
@@ -202,7 +227,8 @@ class ActivityAggregationCalculation():
                 relatedactivity__type=1,)\
             .filter(budget__currency__isnull=False)\
             .values_list('budget__currency')\
-            .annotate(total_budget=Sum('budget__value'))
+            .annotate(total_budget=Sum('budget__value'))\
+            .order_by()
 
     def calculate_child_transaction_aggregation(
             self,
@@ -336,15 +362,31 @@ class ActivityAggregationCalculation():
             aggregation_type):
         """
 
+        """
+        return self.set_total_aggregation(
+            activity.activity_aggregation,
+            activity.child_aggregation,
+            total_aggregation,
+            aggregation_type)
+
+    def set_total_aggregation(
+            self,
+            activity_aggregation,
+            child_aggregation,
+            total_aggregation,
+            aggregation_type):
+        """
+        Sets {aggregation_type} of {total_aggregation} to the sum of the
+        activity's own and its children's aggregation
         """
         activity_value = getattr(
-            activity.activity_aggregation, aggregation_type + '_value')
+            activity_aggregation, aggregation_type + '_value')
         activity_currency = getattr(
-            activity.activity_aggregation, aggregation_type + '_currency')
-        child_value = getattr(activity.child_aggregation,
+            activity_aggregation, aggregation_type + '_currency')
+        child_value = getattr(child_aggregation,
                               aggregation_type + '_value')
         child_currency = getattr(
-            activity.child_aggregation, aggregation_type + '_currency')
+            child_aggregation, aggregation_type + '_currency')
 
         total_aggregation_currency = None
 
@@ -411,3 +453,131 @@ class ActivityAggregationCalculation():
             total_aggregation.save()
         except IntegrityError:
             pass
+
+
+class BulkActivityAggregationCalculation(ActivityAggregationCalculation):
+    """
+    Calculates the aggregations of many activities at once: a few GROUP BY
+    (activity, transaction type, currency) queries per batch of activities
+    instead of about 25 queries per activity, written back with one
+    INSERT ... ON CONFLICT per aggregation model.
+
+    Use ActivityAggregationCalculation to update a single activity.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+
+    def parse_all_activity_aggregations(self):
+        self.calculate_aggregations(
+            Activity.objects.order_by('id').values_list('id', flat=True))
+
+    def parse_activity_aggregations_by_source(self, dataset_id):
+        activity_ids = set(Activity.objects.filter(
+            dataset__id=dataset_id).values_list('id', flat=True))
+
+        # parents of this dataset's activities, their child aggregations
+        # change too:
+        activity_ids.update(Activity.objects.filter(
+            ref_activity__current_activity__dataset__id=dataset_id,
+            ref_activity__type=1,
+        ).values_list('id', flat=True))
+
+        self.calculate_aggregations(sorted(activity_ids))
+
+    def calculate_aggregations(self, activity_ids):
+        activity_ids = list(activity_ids)
+
+        for i in range(0, len(activity_ids), self.batch_size):
+            self.calculate_batch(activity_ids[i:i + self.batch_size])
+
+        # the cached representations of the activities hold aggregations:
+        if settings.ACTIVITY_FRAGMENT_CACHE and activity_ids:
+            invalidate_all_fragments()
+
+    def calculate_batch(self, activity_ids):
+        identifiers = dict(Activity.objects.filter(
+            id__in=activity_ids).values_list('iati_identifier', 'id'))
+
+        own_totals = self.get_totals(
+            Budget.objects.filter(activity_id__in=activity_ids),
+            Transaction.objects.filter(activity_id__in=activity_ids),
+            'activity_id')
+
+        # children refer to their parent with a related-activity of type 1:
+        child_totals = self.get_totals(
+            Budget.objects.filter(
+                activity__relatedactivity__ref__in=list(identifiers),
+                activity__relatedactivity__type=1,
+                currency__isnull=False),
+            Transaction.objects.filter(
+                activity__relatedactivity__ref__in=list(identifiers),
+                activity__relatedactivity__type=1,
+                currency__isnull=False),
+            'activity__relatedactivity__ref')
+
+        activity_aggregations = []
+        child_aggregations = []
+        total_aggregations = []
+
+        for iati_identifier, activity_id in identifiers.items():
+            activity_aggregation = self.get_aggregation(
+                ActivityAggregation(activity_id=activity_id),
+                own_totals[activity_id])
+            child_aggregation = self.get_aggregation(
+                ChildAggregation(activity_id=activity_id),
+                child_totals[iati_identifier])
+
+            total_aggregation = ActivityPlusChildAggregation(
+                activity_id=activity_id)
+            for aggregation_type in AGGREGATION_TYPES:
+                self.set_total_aggregation(
+                    activity_aggregation,
+                    child_aggregation,
+                    total_aggregation,
+                    aggregation_type)
+
+            activity_aggregations.append(activity_aggregation)
+            child_aggregations.append(child_aggregation)
+            total_aggregations.append(total_aggregation)
+
+        with transaction.atomic():
+            bulk_upsert(ActivityAggregation, activity_aggregations,
+                        ['activity'])
+            bulk_upsert(ChildAggregation, child_aggregations, ['activity'])
+            bulk_upsert(ActivityPlusChildAggregation, total_aggregations,
+                        ['activity'])
+
+    def get_totals(self, budgets, transactions, group_by):
+        """
+        Returns {group_by value: {aggregation type: [(currency, sum)]}} for
+        the given budgets and transactions
+        """
+        transaction_types = dict(TRANSACTION_TYPE_AGGREGATIONS)
+        totals = defaultdict(lambda: defaultdict(list))
+
+        # (order_by() clears the default ordering, which would end up in
+        # the GROUP BY)
+        for key, currency, value in budgets.values_list(
+                group_by, 'currency').annotate(Sum('value')).order_by():
+            totals[key]['budget'].append((currency, value))
+
+        for key, transaction_type, currency, value in \
+                transactions.values_list(
+                    group_by, 'transaction_type', 'currency').annotate(
+                    Sum('value')).order_by():
+            if transaction_type in transaction_types:
+                totals[key][transaction_types[transaction_type]].append(
+                    (currency, value))
+
+        return totals
+
+    def get_aggregation(self, aggregation, totals):
+        for aggregation_type in AGGREGATION_TYPES:
+            self.set_aggregation(
+                aggregation,
+                aggregation_type + '_currency',
+                aggregation_type + '_value',
+                totals[aggregation_type])
+
+        return aggregation
@@ -370,111 +370,8 @@ class ActivityQuerySet(SearchQuerySet):
         return self.select_related('conditions')
 
     def prefetch_results(self):
-        from iati.models import Result, Narrative, ResultIndicatorPeriod, \
-            ResultIndicator, ResultIndicatorReference, \
-            ResultIndicatorPeriodTargetLocation, \
-            ResultIndicatorPeriodActualLocation, \
-            ResultIndicatorPeriodTargetDimension, \
-            ResultIndicatorPeriodActualDimension
-
-        title_prefetch = Prefetch(
-            'resulttitle__narratives',
-            queryset=Narrative.objects.all()
-            .select_related('language'))
-
-        description_prefetch = Prefetch(
-            'resultdescription__narratives',
-            queryset=Narrative.objects.all()
-            .select_related('language'))
-
-        indicator_reference_prefetch = Prefetch(
-            'resultindicatorreference_set',
-            queryset=ResultIndicatorReference.objects.all()
-            .select_related('vocabulary'))
-
-        indicator_title_prefetch = Prefetch(
-            'resultindicatortitle__narratives',
-            queryset=Narrative.objects.all()
-            .select_related('language'))
-
-        indicator_description_prefetch = Prefetch(
-            'resultindicatordescription__narratives',
-            queryset=Narrative.objects.all()
-            .select_related('language'))
-
-        indicator_period_target_location_prefetch = Prefetch(
-            'targets__resultindicatorperiodtargetlocation_set',
-            queryset=ResultIndicatorPeriodTargetLocation.objects.all()
-            .select_related('location'))
-
-        indicator_period_actual_location_prefetch = Prefetch(
-            'actuals__resultindicatorperiodactuallocation_set',
-            queryset=ResultIndicatorPeriodActualLocation.objects.all()
-            .select_related('location'))
-
-        indicator_period_target_dimension_prefetch = Prefetch(
-            'targets__resultindicatorperiodtargetdimension_set',
-            queryset=ResultIndicatorPeriodTargetDimension.objects.all()
-        )
-
-        indicator_period_actual_dimension_prefetch = Prefetch(
-            'actuals__resultindicatorperiodactualdimension_set',
-            queryset=ResultIndicatorPeriodActualDimension.objects.all()
-        )
-
-        indicator_period_target_comment_prefetch = Prefetch(
-            'targets__resultindicatorperiodtargetcomment_set__narratives',
-            queryset=Narrative.objects.all()
-            .select_related('language'))
-
-        indicator_period_actual_comment_prefetch = Prefetch(
-            'actuals__resultindicatorperiodactualcomment_set__narratives',
-            queryset=Narrative.objects.all()
-            .select_related('language'))
-
-        indicator_period_prefetch = Prefetch(
-            'resultindicatorperiod_set',
-            queryset=ResultIndicatorPeriod.objects.all()
-            .prefetch_related(
-                'targets__resultindicatorperiodtargetcomment_set',
-                'actuals__resultindicatorperiodactualcomment_set',
-            )
-            .prefetch_related(
-                indicator_period_target_location_prefetch,
-                indicator_period_actual_location_prefetch,
-                indicator_period_target_dimension_prefetch,
-                indicator_period_actual_dimension_prefetch,
-                indicator_period_target_comment_prefetch,
-                indicator_period_actual_comment_prefetch,
-            )
-        )
-
-        indicator_prefetch = Prefetch(
-            'resultindicator_set',
-            queryset=ResultIndicator.objects.all()
-            .select_related(
-                'measure',
-                'resultindicatortitle',
-                'resultindicatordescription',
-            )
-            .prefetch_related(
-                indicator_reference_prefetch,
-                indicator_title_prefetch,
-                indicator_description_prefetch,
-                indicator_period_prefetch,
-            )
-        )
-
         return self.prefetch_related(
-            Prefetch(
-                'result_set',
-                queryset=Result.objects.all()
-                .select_related('type', 'resulttitle', 'resultdescription')
-                .prefetch_related(
-                    title_prefetch,
-                    description_prefetch,
-                    indicator_prefetch
-                ))
+            Prefetch('result_set', queryset=get_result_queryset())
         )
 
     def prefetch_crs_add(self):
@@ -524,6 +421,115 @@ class ActivityQuerySet(SearchQuerySet):
         )
 
 
+def get_result_queryset():
+    """
+    Returns a Result queryset which prefetches the titles, descriptions and
+    indicators (with their periods) of the results
+    """
+    from iati.models import Result, Narrative, ResultIndicatorPeriod, \
+        ResultIndicator, ResultIndicatorReference, \
+        ResultIndicatorPeriodTargetLocation, \
+        ResultIndicatorPeriodActualLocation, \
+        ResultIndicatorPeriodTargetDimension, \
+        ResultIndicatorPeriodActualDimension
+
+    title_prefetch = Prefetch(
+        'resulttitle__narratives',
+        queryset=Narrative.objects.all()
+        .select_related('language'))
+
+    description_prefetch = Prefetch(
+        'resultdescription__narratives',
+        queryset=Narrative.objects.all()
+        .select_related('language'))
+
+    indicator_reference_prefetch = Prefetch(
+        'resultindicatorreference_set',
+        queryset=ResultIndicatorReference.objects.all()
+        .select_related('vocabulary'))
+
+    indicator_title_prefetch = Prefetch(
+        'resultindicatortitle__narratives',
+        queryset=Narrative.objects.all()
+        .select_related('language'))
+
+    indicator_description_prefetch = Prefetch(
+        'resultindicatordescription__narratives',
+        queryset=Narrative.objects.all()
+        .select_related('language'))
+
+    indicator_period_target_location_prefetch = Prefetch(
+        'targets__resultindicatorperiodtargetlocation_set',
+        queryset=ResultIndicatorPeriodTargetLocation.objects.all()
+        .select_related('location'))
+
+    indicator_period_actual_location_prefetch = Prefetch(
+        'actuals__resultindicatorperiodactuallocation_set',
+        queryset=ResultIndicatorPeriodActualLocation.objects.all()
+        .select_related('location'))
+
+    indicator_period_target_dimension_prefetch = Prefetch(
+        'targets__resultindicatorperiodtargetdimension_set',
+        queryset=ResultIndicatorPeriodTargetDimension.objects.all()
+    )
+
+    indicator_period_actual_dimension_prefetch = Prefetch(
+        'actuals__resultindicatorperiodactualdimension_set',
+        queryset=ResultIndicatorPeriodActualDimension.objects.all()
+    )
+
+    indicator_period_target_comment_prefetch = Prefetch(
+        'targets__resultindicatorperiodtargetcomment_set__narratives',
+        queryset=Narrative.objects.all()
+        .select_related('language'))
+
+    indicator_period_actual_comment_prefetch = Prefetch(
+        'actuals__resultindicatorperiodactualcomment_set__narratives',
+        queryset=Narrative.objects.all()
+        .select_related('language'))
+
+    indicator_period_prefetch = Prefetch(
+        'resultindicatorperiod_set',
+        queryset=ResultIndicatorPeriod.objects.all()
+        .prefetch_related(
+            'targets__resultindicatorperiodtargetcomment_set',
+            'actuals__resultindicatorperiodactualcomment_set',
+        )
+        .prefetch_related(
+            indicator_period_target_location_prefetch,
+            indicator_period_actual_location_prefetch,
+            indicator_period_target_dimension_prefetch,
+            indicator_period_actual_dimension_prefetch,
+            indicator_period_target_comment_prefetch,
+            indicator_period_actual_comment_prefetch,
+        )
+    )
+
+    indicator_prefetch = Prefetch(
+        'resultindicator_set',
+        queryset=ResultIndicator.objects.all()
+        .select_related(
+            'measure',
+            'resultindicatortitle',
+            'resultindicatordescription',
+        )
+        .prefetch_related(
+            indicator_reference_prefetch,
+            indicator_title_prefetch,
+            indicator_description_prefetch,
+            indicator_period_prefetch,
+        )
+    )
+
+    return Result.objects.all() \
+        .select_related('type', 'resulttitle', 'resultdescription') \
+        .prefetch_related(
+            title_prefetch,
+            description_prefetch,
+            indicator_prefetch
+        )
+
+
 class ActivityManager(SearchManagerMixIn, models.Manager):
 
     """Activity manager with search capabilities"""
@@ -1,25 +1,158 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 from functools import partial
 
 from django.conf import settings
 from django.contrib.postgres.search import SearchVector
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection
 
 from common.util import print_progress, setInterval
 from iati.models import (
-    Activity, ActivitySearch, BudgetItemDescription, Conditions,
-    ContactInfoDepartment, ContactInfoJobTitle, ContactInfoMailingAddress,
-    ContactInfoOrganisation, ContactInfoPersonName, CountryBudgetItem,
-    DocumentLinkTitle, ResultDescription, ResultIndicatorDescription,
-    ResultIndicatorTitle, ResultTitle
+    Activity, ActivityParticipatingOrganisation, ActivityPolicyMarker,
+    ActivityRecipientCountry, ActivityRecipientRegion,
+    ActivityReportingOrganisation, ActivitySearch, ActivitySector,
+    BudgetItemDescription, Conditions, ContactInfo, ContactInfoDepartment,
+    ContactInfoJobTitle, ContactInfoMailingAddress, ContactInfoOrganisation,
+    ContactInfoPersonName, CountryBudgetItem, Description, DocumentLink,
+    DocumentLinkTitle, Location, OtherIdentifier, RelatedActivity, Result,
+    ResultDescription, ResultIndicatorDescription, ResultIndicatorTitle,
+    ResultTitle, Title
 )
+from iati.parser.profiling import PHASE, profiled_step
 from iati.transaction.models import (
-    TransactionDescription, TransactionProvider, TransactionReceiver
+    Transaction, TransactionDescription, TransactionProvider,
+    TransactionReceiver
 )
 from iati_organisation.models import Organisation, OrganisationName
 from iati_synchroniser.models import Publisher
 
 
+# Number of activities reindexed per statement by reindex_all_activities()
+# and batched_reindexing():
+REINDEX_BATCH_SIZE = 500
+
+# ActivitySearch column -> (model, field of the activity id, text field) of
+# each kind of text in it, as collected by reindex_activity():
+COLUMN_SOURCES = OrderedDict([
+    ('title', [
+        (Title, 'activity_id', 'narratives__content'),
+    ]),
+    ('description', [
+        (Description, 'activity_id', 'narratives__content'),
+    ]),
+    ('reporting_org', [
+        (ActivityReportingOrganisation, 'activity_id', 'normalized_ref'),
+        (ActivityReportingOrganisation, 'activity_id', 'narratives__content'),
+        (Activity, 'id',
+         'publisher__organisation__name__narratives__content'),
+    ]),
+    ('participating_org', [
+        (ActivityParticipatingOrganisation, 'activity_id', 'normalized_ref'),
+        (ActivityParticipatingOrganisation, 'activity_id',
+         'narratives__content'),
+    ]),
+    ('recipient_country', [
+        (ActivityRecipientCountry, 'activity_id', 'country__code'),
+        (ActivityRecipientCountry, 'activity_id', 'country__name'),
+    ]),
+    ('recipient_region', [
+        (ActivityRecipientRegion, 'activity_id', 'region__code'),
+        (ActivityRecipientRegion, 'activity_id', 'region__name'),
+    ]),
+    ('sector', [
+        (ActivitySector, 'activity_id', 'sector__code'),
+        (ActivitySector, 'activity_id', 'sector__name'),
+    ]),
+    ('document_link', [
+        (DocumentLink, 'activity_id', 'url'),
+        (DocumentLink, 'activity_id', 'categories__name'),
+        (DocumentLink, 'activity_id',
+         'documentlinktitle__narratives__content'),
+    ]),
+    ('other_identifier', [
+        (OtherIdentifier, 'activity_id', 'owner_ref'),
+        (OtherIdentifier, 'activity_id', 'narratives__content'),
+    ]),
+    ('contact_info', [
+        (ContactInfo, 'activity_id', 'organisation__narratives__content'),
+        (ContactInfo, 'activity_id', 'department__narratives__content'),
+        (ContactInfo, 'activity_id', 'person_name__narratives__content'),
+        (ContactInfo, 'activity_id', 'job_title__narratives__content'),
+        (ContactInfo, 'activity_id',
+         'mailing_address__narratives__content'),
+    ]),
+    ('location', [
+        (Location, 'activity_id', 'ref'),
+    ]),
+    ('country_budget_items', [
+        (CountryBudgetItem, 'activity_id',
+         'budgetitem__description__narratives__content'),
+    ]),
+    ('policy_marker', [
+        (ActivityPolicyMarker, 'activity_id', 'narratives__content'),
+    ]),
+    ('transaction', [
+        (Transaction, 'activity_id', 'ref'),
+        (Transaction, 'activity_id', 'description__narratives__content'),
+        (Transaction, 'activity_id', 'provider_organisation__ref'),
+        (Transaction, 'activity_id',
+         'provider_organisation__narratives__content'),
+        (Transaction, 'activity_id', 'receiver_organisation__ref'),
+        (Transaction, 'activity_id',
+         'receiver_organisation__narratives__content'),
+    ]),
+    ('related_activity', [
+        (RelatedActivity, 'current_activity_id', 'ref'),
+    ]),
+    ('conditions', [
+        (Conditions, 'activity_id', 'condition__narratives__content'),
+    ]),
+    ('result', [
+        (Result, 'activity_id', 'resulttitle__narratives__content'),
+        (Result, 'activity_id', 'resultdescription__narratives__content'),
+        (Result, 'activity_id',
+         'resultindicator__resultindicatortitle__narratives__content'),
+        (Result, 'activity_id',
+         'resultindicator__resultindicatordescription__narratives__content'),
+        (Result, 'activity_id',
+         'resultindicator__resultindicatorperiod__targets__'
+         'resultindicatorperiodtargetcomment__narratives__content'),
+        (Result, 'activity_id',
+         'resultindicator__resultindicatorperiod__actuals__'
+         'resultindicatorperiodactualcomment__narratives__content'),
+    ]),
+])
+
+COLUMN_SQL = """
+search_{column} AS (
+    SELECT activity_id, string_agg(text, ' ') AS text
+    FROM ({sources}) AS source (activity_id, text)
+    GROUP BY activity_id
+)"""
+
+REINDEX_SQL = """
+WITH search_activity AS ({activities}),
+{columns}
+INSERT INTO iati_activitysearch (
+    activity_id, iati_identifier, {column_names}, last_reindexed,
+    search_vector_text
+)
+SELECT a.id, a.iati_identifier,
+       {column_values},
+       %s,
+       to_tsvector({vector})
+FROM search_activity a (id, iati_identifier)
+{joins}
+ON CONFLICT (activity_id) DO UPDATE SET
+    {updates}
+"""
+
+_local = threading.local()
+
+
 # TODO: prefetches - 2016-01-07
 def reindex_activity(activity):
     if hasattr(
@@ -27,6 +160,11 @@ def reindex_activity(activity):
     ) and getattr(settings, 'FTS_ENABLED') is False:
         return
 
+    # reindexed at the end of the batched_reindexing() block:
+    if get_batched_activity_ids() is not None:
+        get_batched_activity_ids().add(activity.id)
+        return
+
     try:
         activity_search = ActivitySearch.objects.get(activity=activity.id)
     except ObjectDoesNotExist:
@@ -311,12 +449,123 @@ def reindex_all_activities():
 
     setInterval(partial(print_progress, progress), 10)
 
-    for activity in Activity.objects.all().iterator():
-        reindex_activity(activity)
-        progress['offset'] += 1
+    activity_ids = list(
+        Activity.objects.order_by('id').values_list('id', flat=True))
+
+    for i in range(0, len(activity_ids), REINDEX_BATCH_SIZE):
+        batch = activity_ids[i:i + REINDEX_BATCH_SIZE]
+        reindex_activities(Activity.objects.filter(id__in=batch))
+        progress['offset'] += len(batch)
 
 
 def reindex_activity_by_source(dataset_id):
-    activities = Activity.objects.all().filter(dataset__id=dataset_id)
-    for activity in activities:
-        reindex_activity(activity)
+    reindex_activities(Activity.objects.filter(dataset__id=dataset_id))
+
+
+def get_column_sql(column, activities):
+    """
+    Returns the SQL (and its params) of the text of {column} per activity
+    """
+    sources = []
+    params = []
+
+    for model, activity_field, text_field in COLUMN_SOURCES[column]:
+        # greater than the empty string skips nulls and empty strings:
+        queryset = model.objects.filter(**{
+            activity_field + '__in': activities,
+            text_field + '__gt': '',
+        }).order_by().values_list(activity_field, text_field)
+
+        sql, source_params = queryset.query.sql_with_params()
+        sources.append(sql)
+        params.extend(source_params)
+
+    return COLUMN_SQL.format(
+        column=column,
+        sources=' UNION ALL '.join(sources),
+    ), params
+
+
+@profiled_step(PHASE)
+def reindex_activities(activities):
+    """
+    Rebuilds the ActivitySearch rows of {activities} (an Activity queryset)
+    with one INSERT ... ON CONFLICT DO UPDATE. The text columns are
+    aggregated with string_agg() from a query per kind of text, and the
+    search vector is computed in SQL the same way reindex_activity() does.
+    Returns the number of upserted rows
+    """
+    if hasattr(
+        settings, 'FTS_ENABLED'
+    ) and getattr(settings, 'FTS_ENABLED') is False:
+        return 0
+
+    activities = activities.order_by().values('pk')
+    sql, params = Activity.objects.filter(
+        pk__in=activities
+    ).order_by().values_list('id', 'iati_identifier').query.sql_with_params()
+    params = list(params)
+
+    columns = []
+    for column in COLUMN_SOURCES:
+        column_sql, column_params = get_column_sql(column, activities)
+        columns.append(column_sql)
+        params.extend(column_params)
+
+    values = [
+        "COALESCE(search_{0}.text, '')".format(column)
+        for column in COLUMN_SOURCES
+    ]
+
+    params.append(datetime.now())
+
+    with connection.cursor() as cursor:
+        cursor.execute(REINDEX_SQL.format(
+            activities=sql,
+            columns=','.join(columns),
+            column_names=', '.join(COLUMN_SOURCES),
+            column_values=',\n       '.join(values),
+            vector=" || ' ' || ".join(
+                ["COALESCE(a.iati_identifier, '')"] + values),
+            joins='\n'.join(
+                'LEFT JOIN search_{0} ON search_{0}.activity_id = a.id'.format(
+                    column) for column in COLUMN_SOURCES),
+            updates=',\n    '.join(
+                '{0} = EXCLUDED.{0}'.format(column) for column in [
+                    'iati_identifier'] + list(COLUMN_SOURCES) + [
+                    'last_reindexed', 'search_vector_text']),
+        ), params)
+
+        return cursor.rowcount
+
+
+def get_batched_activity_ids():
+    """
+    Returns the ids of the activities to reindex at the end of the active
+    batched_reindexing() block, or None
+    """
+    return getattr(_local, 'activity_ids', None)
+
+
+@contextmanager
+def batched_reindexing():
+    """
+    Collects the activities reindexed in the block and reindexes them at the
+    end, with reindex_activities() in batches. Nested blocks share the
+    outer one.
+    """
+    if get_batched_activity_ids() is not None:
+        yield
+        return
+
+    _local.activity_ids = set()
+
+    try:
+        yield
+    finally:
+        activity_ids = sorted(_local.activity_ids)
+        _local.activity_ids = None
+
+        for i in range(0, len(activity_ids), REINDEX_BATCH_SIZE):
+            reindex_activities(Activity.objects.filter(
+                id__in=activity_ids[i:i + REINDEX_BATCH_SIZE]))
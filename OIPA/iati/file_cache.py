@@ -0,0 +1,169 @@
+"""On-disk cache of dataset files, keyed by source URL.
+
+The body of a file is stored once under the sha1 of its content
+(objects/ab/abcdef...), with an index entry per URL (index/<sha1 of the
+URL>.json) holding the ETag and Last-Modified headers the server sent.
+These are sent back as If-None-Match / If-Modified-Since, so a file that
+didn't change costs a 304 response instead of a download.
+
+Enabled with settings.IATI_FILE_CACHE, see FileGrabber.get_dataset_file().
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Size of the chunks in which files are written to and read from the cache:
+CHUNK_SIZE = 1024 * 1024
+
+
+class CachedFile(object):
+    """
+    A file in the cache, with the parts of requests.Response the parser and
+    the validation use
+    """
+    status_code = 200
+
+    def __init__(self, path, sha1, not_modified=False):
+        self.path = path
+        # sha1 of the raw content:
+        self.sha1 = sha1
+        # True when the server answered 304 Not Modified:
+        self.not_modified = not_modified
+
+    @property
+    def content(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def iter_content(self, chunk_size=CHUNK_SIZE):
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def open(self):
+        return open(self.path, 'rb')
+
+    def close(self):
+        pass
+
+
+class FileCache(object):
+
+    def __init__(self, directory=None):
+        self.directory = directory or settings.IATI_FILE_CACHE_DIR
+
+    def _index_path(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, 'index', key + '.json')
+
+    def _object_path(self, sha1):
+        return os.path.join(self.directory, 'objects', sha1[:2], sha1)
+
+    def _write_json(self, path, data):
+        # write to a temporary file first, so other processes never read a
+        # half written entry:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+
+        os.replace(tmp_path, path)
+
+    def get_entry(self, url):
+        """
+        Returns the index entry of {url}, or None when it isn't cached
+        """
+        try:
+            with open(self._index_path(url)) as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return None
+
+        if not os.path.exists(self._object_path(entry['sha1'])):
+            return None
+
+        return entry
+
+    def conditional_headers(self, entry):
+        headers = {}
+
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        return headers
+
+    def get_file(self, entry, not_modified=False):
+        return CachedFile(
+            self._object_path(entry['sha1']), entry['sha1'], not_modified)
+
+    def store(self, url, response):
+        """
+        Writes the body of {response} (preferably streamed) to the cache and
+        returns it as a CachedFile
+        """
+        objects_dir = os.path.join(self.directory, 'objects')
+        os.makedirs(objects_dir, exist_ok=True)
+
+        hasher = hashlib.sha1()
+        fd, tmp_path = tempfile.mkstemp(dir=objects_dir)
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    hasher.update(chunk)
+                    f.write(chunk)
+
+            sha1 = hasher.hexdigest()
+            path = self._object_path(sha1)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        old_entry = self.get_entry(url)
+
+        self._write_json(self._index_path(url), {
+            'url': url,
+            'sha1': sha1,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        })
+
+        if old_entry and old_entry['sha1'] != sha1:
+            self._remove_unused_object(old_entry['sha1'])
+
+        return CachedFile(path, sha1)
+
+    def _remove_unused_object(self, sha1):
+        """
+        Removes the object {sha1} when no URL points to it anymore
+        """
+        index_dir = os.path.join(self.directory, 'index')
+
+        for name in os.listdir(index_dir):
+            try:
+                with open(os.path.join(index_dir, name)) as f:
+                    if json.load(f).get('sha1') == sha1:
+                        return
+            except (IOError, ValueError):
+                continue
+
+        try:
+            os.remove(self._object_path(sha1))
+        except OSError as e:
+            logger.info(e)
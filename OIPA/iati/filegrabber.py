@@ -5,6 +5,9 @@ from http.client import HTTPException
 
 import mechanicalsoup
 import requests
+from django.conf import settings
+
+from iati.file_cache import FileCache
 
 logger = logging.getLogger(__name__)
 
@@ -29,16 +32,23 @@ class FileGrabber():
 
         self.browser = browser
 
-    def get_the_file(self, url, try_number=0):
+    def get_the_file(self, url, try_number=0, stream=False, headers=None):
+        """
+        Returns the response for the given URL or None. With stream=True the
+        body is not read up front and can be consumed with iter_content()
+        """
         try:
-            response = self.browser.get(url, timeout=10)
+            response = self.browser.get(
+                url, timeout=10, stream=stream, headers=headers)
             self.browser.close()
             return response
 
         except requests.exceptions.SSLError as e:
             logger.info('%s (%s)' % (e, type(e)) + " in get_the_file: " + url)
             try:
-                resp = self.browser.get(url, timeout=10, verify=False)
+                resp = self.browser.get(
+                    url, timeout=10, verify=False, stream=stream,
+                    headers=headers)
                 self.browser.close()
                 return resp
             except Exception as e:
@@ -47,18 +57,50 @@ class FileGrabber():
         except urllib.error.HTTPError as e:
             logger.info('HTTPError (url=' + url + ') = ' + str(e.code))
             if try_number < 2:
-                return self.get_the_file(url, try_number + 1)
+                return self.get_the_file(
+                    url, try_number + 1, stream, headers)
             else:
                 return None
         except urllib.error.URLError as e:
             logger.info('URLError (url=' + url + ') = ' + str(e.reason))
             if try_number < 2:
-                return self.get_the_file(url, try_number + 1)
+                return self.get_the_file(
+                    url, try_number + 1, stream, headers)
         except HTTPException as e:
             logger.info('HTTPException reading url ' + url)
             if try_number < 2:
-                return self.get_the_file(url, try_number + 1)
+                return self.get_the_file(
+                    url, try_number + 1, stream, headers)
         except Exception as e:
             logger.info('%s (%s)' % (e, type(e)) + " in get_the_file: " + url)
             if try_number < 2:
-                return self.get_the_file(url, try_number + 1)
+                return self.get_the_file(
+                    url, try_number + 1, stream, headers)
+
+    def get_dataset_file(self, url, stream=False):
+        """
+        Returns the response for the given dataset URL or None.
+
+        With settings.IATI_FILE_CACHE the file is fetched with a conditional
+        GET and a CachedFile from the on-disk cache is returned instead (see
+        iati/file_cache.py), so an unchanged file isn't downloaded again
+        """
+        if not settings.IATI_FILE_CACHE:
+            return self.get_the_file(url, stream=stream)
+
+        cache = FileCache()
+        entry = cache.get_entry(url)
+        headers = cache.conditional_headers(entry) if entry else None
+
+        response = self.get_the_file(url, stream=True, headers=headers)
+
+        if response is not None and response.status_code == 304 and entry:
+            return cache.get_file(entry, not_modified=True)
+
+        if response is None or response.status_code != 200:
+            return response
+
+        try:
+            return cache.store(url, response)
+        finally:
+            response.close()
@@ -0,0 +1,195 @@
+from collections import Counter
+from timeit import default_timer
+
+from django.core.management.base import BaseCommand, CommandError
+from lxml import etree
+from lxml.builder import E
+
+from iati.parser.dispatch import DispatchTable
+from iati.parser.IATI_2_03 import Parse as IATI_203_Parser
+
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+
+def narrative(text, lang='en'):
+    return E('narrative', text, **{XML_LANG: lang})
+
+
+def build_sample_activity(i):
+    """A 2.03 activity using the elements of the 2.03 parser tests"""
+    activity = E(
+        'iati-activity',
+        E('iati-identifier', 'AA-AAA-123456789-{}'.format(i)),
+        E('reporting-org', narrative('Reporting org'),
+          ref='AA-AAA-123456789', type='40'),
+        E('title', narrative('Title'), narrative('Titre', 'fr')),
+        E('description', narrative('Description'), type='1'),
+        E('description', narrative('Objectives'), type='2'),
+        E('activity-status', code='2'),
+        E('activity-date', narrative('Start'), type='1',
+          **{'iso-date': '2012-04-15'}),
+        E('activity-date', type='3', **{'iso-date': '2016-12-31'}),
+        E('contact-info', E('organisation', narrative('Agency')),
+          E('email', 'info@example.org'), type='1'),
+        E('recipient-country', narrative('Afghanistan'), code='AF',
+          percentage='100'),
+        E('sector', narrative('Sector'), code='11110', percentage='50',
+          vocabulary='1'),
+        E('sector', code='11111', percentage='50', vocabulary='1'),
+        E('default-aid-type', code='A01', vocabulary='1'),
+        **{
+            'last-updated-datetime': '2014-09-10T07:15:37Z',
+            'default-currency': 'EUR',
+            XML_LANG: 'en',
+        }
+    )
+
+    for role in ('1', '2', '4'):
+        activity.append(E(
+            'participating-org', narrative('Organisation'),
+            ref='BB-BBB-123456789', role=role, type='40'))
+
+    for year in ('2014', '2015'):
+        activity.append(E(
+            'budget',
+            E('period-start', **{'iso-date': year + '-01-01'}),
+            E('period-end', **{'iso-date': year + '-12-31'}),
+            E('value', '3000', **{'value-date': year + '-01-01'}),
+            type='1', status='1'))
+
+    for transaction_type in ('1', '2', '3', '4') * 3:
+        activity.append(E(
+            'transaction',
+            E('transaction-type', code=transaction_type),
+            E('transaction-date', **{'iso-date': '2014-01-01'}),
+            E('value', '1000', **{'value-date': '2014-01-01'}),
+            E('description', narrative('Transaction')),
+            E('provider-org', narrative('Provider'),
+              ref='BB-BBB-123456789',
+              **{'provider-activity-id': 'BB-BBB-123456789-1234AA'}),
+            E('receiver-org', narrative('Receiver'),
+              ref='AA-AAA-123456789',
+              **{'receiver-activity-id': 'AA-AAA-123456789-1234'}),
+            E('sector', code='11110', vocabulary='1'),
+            ref='1234'))
+
+    activity.append(E(
+        'result',
+        E('title', narrative('Result')),
+        E('description', narrative('Result description')),
+        E('indicator',
+          E('title', narrative('Indicator')),
+          E('baseline', E('comment', narrative('Baseline')),
+            year='2012', value='10', **{'iso-date': '2012-01-01'}),
+          E('period',
+            E('period-start', **{'iso-date': '2013-01-01'}),
+            E('period-end', **{'iso-date': '2013-03-31'}),
+            E('target', E('comment', narrative('Target')), value='10'),
+            E('actual', E('comment', narrative('Actual')), value='11')),
+          measure='1', ascending='1'),
+        type='1', **{'aggregation-status': '1'}))
+
+    return activity
+
+
+def build_sample_file(activities):
+    root = E('iati-activities', version='2.03')
+
+    for i in range(activities):
+        root.append(build_sample_activity(i))
+
+    return root
+
+
+def counting_parser_class(parser_class):
+    """Returns a subclass of {parser_class} of which all handlers only count
+    their calls, so only the dispatch itself is measured
+    """
+
+    def make_handler(name):
+        def handler(self, element):
+            self.calls[name] += 1
+        return handler
+
+    attrs = {
+        name: make_handler(name)
+        for name in DispatchTable(parser_class).handlers
+    }
+
+    return type(
+        'Counting' + parser_class.__name__, (parser_class,), attrs)
+
+
+class Command(BaseCommand):
+    help = 'Compares the dispatch table in IatiParser.parse() with the ' \
+           'xpath based dispatch in IatiParser.parse_by_xpath() (2.03)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            dest='file',
+            default=None,
+            help='IATI 2.03 activity file to use instead of the generated '
+                 'sample file',
+        )
+        parser.add_argument(
+            '--activities',
+            dest='activities',
+            type=int,
+            default=1000,
+            help='Number of activities in the generated sample file',
+        )
+        parser.add_argument(
+            '--repeat',
+            dest='repeat',
+            type=int,
+            default=3,
+            help='Number of runs per dispatch method (the best one counts)',
+        )
+
+    def run(self, parser, method):
+        parse = getattr(parser, method)
+        best = None
+
+        for i in range(self.repeat):
+            parser.calls = Counter()
+            start = default_timer()
+
+            for element in parser.root.getchildren():
+                parse(element)
+
+            elapsed = default_timer() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        return best, parser.calls
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+
+        if options['file']:
+            parser = etree.XMLParser(huge_tree=True)
+            root = etree.parse(options['file'], parser).getroot()
+        else:
+            root = build_sample_file(options['activities'])
+
+        elements = sum(1 for e in root.iter())
+        parser = counting_parser_class(IATI_203_Parser)(root)
+
+        xpath_time, xpath_calls = self.run(parser, 'parse_by_xpath')
+        table_time, table_calls = self.run(parser, 'parse')
+
+        if xpath_calls != table_calls:
+            raise CommandError(
+                'Dispatch methods called different handlers: {}'.format(
+                    (xpath_calls - table_calls) + (table_calls - xpath_calls)
+                )
+            )
+
+        self.stdout.write(
+            '{} elements, {} handler calls, best of {} runs'.format(
+                elements, sum(table_calls.values()), self.repeat))
+        self.stdout.write(
+            'xpath dispatch:  {:.3f}s'.format(xpath_time))
+        self.stdout.write(
+            'table dispatch:  {:.3f}s ({:.1f}x)'.format(
+                table_time, xpath_time / table_time if table_time else 0))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from iati.activity_aggregation_calculation import (
+    BulkActivityAggregationCalculation
+)
+
+
+class Command(BaseCommand):
+    """
+    (Re)calculate the activity, child and activity plus child aggregations
+    of all activities, or of the activities of one dataset
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dataset',
+            type=int,
+            dest='dataset_id',
+            default=None,
+            help='Only the activities of this dataset (and their parents)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            dest='batch_size',
+            default=1000,
+            help='Number of activities per batch of queries',
+        )
+
+    def handle(self, *args, **options):
+        aac = BulkActivityAggregationCalculation(
+            batch_size=options['batch_size'])
+
+        if options['dataset_id']:
+            aac.parse_activity_aggregations_by_source(options['dataset_id'])
+        else:
+            aac.parse_all_activity_aggregations()
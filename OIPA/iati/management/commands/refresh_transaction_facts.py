@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from iati.models import Activity
+from iati.transaction.facts import refresh_transaction_facts
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the TransactionFact rows of all transactions, or of the
+    transactions of one dataset
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dataset',
+            type=int,
+            dest='dataset_id',
+            default=None,
+            help='Only the transactions of the activities of this dataset',
+        )
+
+    def handle(self, *args, **options):
+        if options['dataset_id']:
+            row_count = refresh_transaction_facts(
+                Activity.objects.filter(dataset_id=options['dataset_id']))
+        else:
+            row_count = refresh_transaction_facts()
+
+        self.stdout.write('{} transaction fact rows'.format(row_count))
@@ -0,0 +1,19 @@
+# Generated by Django 2.0.13 on 2026-10-18 12:00
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iati', '0069_auto_20200225_1416'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='xml_hashes',
+            field=django.contrib.postgres.fields.jsonb.JSONField(default=None, null=True),
+        ),
+    ]
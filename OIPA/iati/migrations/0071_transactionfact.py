@@ -0,0 +1,40 @@
+# Generated by Django 2.0.13 on 2026-10-18 12:00
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geodata', '0006_auto_20200424_1113'),
+        ('iati_codelists', '0016_auto_20200310_1138'),
+        ('iati', '0070_activity_xml_hashes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionFact',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_date', models.DateField(db_index=True)),
+                ('sector_weight', models.DecimalField(decimal_places=10, max_digits=20, null=True)),
+                ('recipient_country_weight', models.DecimalField(decimal_places=10, max_digits=20, null=True)),
+                ('recipient_region_weight', models.DecimalField(decimal_places=10, max_digits=20, null=True)),
+                ('value', models.DecimalField(decimal_places=7, default=Decimal('0'), max_digits=20)),
+                ('xdr_value', models.DecimalField(decimal_places=7, default=Decimal('0'), max_digits=20)),
+                ('usd_value', models.DecimalField(decimal_places=7, default=Decimal('0'), max_digits=20)),
+                ('eur_value', models.DecimalField(decimal_places=7, default=Decimal('0'), max_digits=20)),
+                ('gbp_value', models.DecimalField(decimal_places=7, default=Decimal('0'), max_digits=20)),
+                ('jpy_value', models.DecimalField(decimal_places=7, default=Decimal('0'), max_digits=20)),
+                ('cad_value', models.DecimalField(decimal_places=7, default=Decimal('0'), max_digits=20)),
+                ('activity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='iati.Activity')),
+                ('recipient_country', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='geodata.Country')),
+                ('recipient_region', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='geodata.Region')),
+                ('sector', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='iati_codelists.Sector')),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facts', to='iati.Transaction')),
+                ('transaction_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='iati_codelists.TransactionType')),
+            ],
+        ),
+    ]
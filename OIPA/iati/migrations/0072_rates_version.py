@@ -0,0 +1,23 @@
+# Generated by Django 2.0.13 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iati', '0071_transactionfact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='budget',
+            name='rates_version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='rates_version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
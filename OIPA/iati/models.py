@@ -5,6 +5,7 @@ from django.contrib.contenttypes.fields import (
 )
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.db.models import PointField
+from django.contrib.postgres.fields import JSONField
 from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVectorField
 from django.db import models
@@ -215,6 +216,10 @@ class Activity(models.Model):
     # is this activity changed from the originally parsed version?
     modified = models.BooleanField(default=False, db_index=True)
 
+    # hashes of the activity XML and its sections, used by the incremental
+    # update mode of the parser (see iati/parser/activity_hash.py):
+    xml_hashes = JSONField(null=True, default=None)
+
     objects = ActivityManager(
         fields=('title', 'description'),  # fields on the model
         config='pg_catalog.simple',  # default dictionary to use
@@ -1369,6 +1374,8 @@ class Budget(models.Model):
         max_digits=20, decimal_places=7, default=Decimal(0))
     cad_value = models.DecimalField(
         max_digits=20, decimal_places=7, default=Decimal(0))
+    # MonthlyAverage.version of the rates the values were converted with:
+    rates_version = models.IntegerField(default=0)
 
     def __unicode__(self,):
         return "value: %s - period_start: %s - period_end: %s" % (
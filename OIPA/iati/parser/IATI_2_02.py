@@ -2053,6 +2053,7 @@ class Parse(IatiParser):
                 budget.currency_id, 'JPY', budget.value_date, budget.value)
             budget.cad_value = convert.currency_from_to(
                 budget.currency_id, 'CAD', budget.value_date, budget.value)
+            budget.rates_version = convert.get_rates_version()
 
         return element
 
@@ -2420,6 +2421,7 @@ class Parse(IatiParser):
             transaction.cad_value = convert.currency_from_to(
                 transaction.currency_id, 'CAD', transaction.value_date,
                 transaction.value)
+            transaction.rates_version = convert.get_rates_version()
 
         return element
 
@@ -4167,6 +4169,7 @@ class Parse(IatiParser):
         post_save.update_activity_search_index(activity)
         post_save.set_sector_transaction(activity)
         post_save.set_sector_budget(activity)
+        post_save.invalidate_activity_fragments(activity)
 
     def post_save_file(self, dataset):
         """Perform all actions that need to happen after a single IATI
@@ -10,7 +10,7 @@ from currency_convert import convert
 from geodata.models import Country, Region
 # FIXME:
 from iati import models
-from iati.parser import post_save, post_save_validators
+from iati.parser import activity_hash, post_save, post_save_validators
 from iati.parser.exceptions import (
     FieldValidationError, IgnoredVocabularyError, NoUpdateRequired,
     ParserError, RequiredFieldError
@@ -196,6 +196,22 @@ class Parse(IatiParser):
             # TransactionProvider are not deleted atm - 2015-10-01
             # TODO: do this after activity is parsed along with other saves?
 
+        xml_hashes = None
+
+        if settings.IATI_PARSER_INCREMENTAL_UPDATE:
+            xml_hashes = activity_hash.hash_activity(element)
+
+            if (old_activity
+                    and not self.force_reparse and not old_activity.modified
+                    and old_activity.dataset_id == self.dataset.id):
+                changed_sections = activity_hash.get_changed_sections(
+                    old_activity.xml_hashes, xml_hashes)
+
+                if changed_sections is not None:
+                    return self.update_activity_sections(
+                        element, old_activity, changed_sections, xml_hashes,
+                        last_updated_datetime, default_lang_code)
+
         if old_activity:
             old_activity.delete()
 
@@ -220,6 +236,7 @@ class Parse(IatiParser):
         activity.published = True
         activity.ready_to_publish = True
         activity.modified = False
+        activity.xml_hashes = xml_hashes
 
         # for later reference
         self.default_lang = default_lang_code
@@ -232,6 +249,42 @@ class Parse(IatiParser):
         self.register_model('Activity', activity)
         return element
 
+    def update_activity_sections(self, element, activity, changed_sections,
+                                 xml_hashes, last_updated_datetime,
+                                 default_lang_code):
+        """Incremental update of an existing activity, of which only the
+        sections in {changed_sections} (see activity_hash.SECTIONS) changed.
+
+        The rows of those sections are deleted and only their elements are
+        left in {element} to be parsed again, the activity itself and all
+        other related models are kept. Raises NoUpdateRequired when no
+        section changed.
+        """
+        if not changed_sections:
+            # only the last-updated-datetime moved:
+            models.Activity.objects.filter(pk=activity.pk).update(
+                last_updated_datetime=last_updated_datetime,
+                xml_hashes=xml_hashes)
+            raise NoUpdateRequired('activity', 'activity XML is unchanged')
+
+        for section in changed_sections:
+            tags, related_sets = activity_hash.SECTIONS[section]
+
+            for related_set in related_sets:
+                getattr(activity, related_set).all().delete()
+
+        activity_hash.remove_unchanged_children(element, changed_sections)
+
+        activity.last_updated_datetime = last_updated_datetime
+        activity.xml_hashes = xml_hashes
+        activity.save()
+
+        # for later reference
+        self.default_lang = default_lang_code
+
+        self.register_model('Activity', activity)
+        return element
+
     def iati_activities__iati_activity__iati_identifier(self, element):
         """
         attributes:
@@ -2151,6 +2204,7 @@ class Parse(IatiParser):
                 budget.currency_id, 'JPY', budget.value_date, budget.value)
             budget.cad_value = convert.currency_from_to(
                 budget.currency_id, 'CAD', budget.value_date, budget.value)
+            budget.rates_version = convert.get_rates_version()
 
         return element
 
@@ -2517,6 +2571,7 @@ class Parse(IatiParser):
             transaction.cad_value = convert.currency_from_to(
                 transaction.currency_id, 'CAD', transaction.value_date,
                 transaction.value)
+            transaction.rates_version = convert.get_rates_version()
 
         return element
 
@@ -5572,6 +5627,7 @@ class Parse(IatiParser):
         # post_save.set_sector_transaction(activity)
 
         post_save.set_sector_budget(activity)
+        post_save.invalidate_activity_fragments(activity)
 
     def post_save_file(self, dataset):
         """Perform all actions that need to happen after a single IATI
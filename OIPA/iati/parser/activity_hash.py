@@ -0,0 +1,90 @@
+"""Hashes of the canonical XML of an iati-activity and its sections.
+
+Used by the incremental update mode of the parser
+(settings.IATI_PARSER_INCREMENTAL_UPDATE): an activity of which no hash
+changed is kept as is, even when its last-updated-datetime moved, and an
+activity of which only some sections changed only gets those sections
+rewritten.
+"""
+import hashlib
+from collections import OrderedDict
+
+from lxml import etree
+
+# Sections of iati-activity which can be rewritten on their own:
+# section name -> (child element tags, related sets on Activity to delete).
+# Locations and results form one section, because result periods reference
+# locations (and cascade with them).
+SECTIONS = OrderedDict([
+    ('transaction', (('transaction',), ('transaction_set',))),
+    ('budget', (('budget',), ('budget_set',))),
+    ('result', (('location', 'result'), ('result_set', 'location_set'))),
+])
+
+# Attributes which don't change the content of an activity:
+IGNORED_ATTRIBUTES = ('last-updated-datetime',)
+
+SECTION_BY_TAG = {
+    tag: section
+    for section, (tags, related_sets) in SECTIONS.items()
+    for tag in tags
+}
+
+
+def canonical_xml(element):
+    return etree.tostring(
+        element, method='c14n', with_comments=False, with_tail=False)
+
+
+def hash_activity(element):
+    """Returns a dict of sha1 hashes of the iati-activity {element}:
+
+    'activity' -- the whole activity (ignoring IGNORED_ATTRIBUTES)
+    'other' -- the attributes and all children outside of SECTIONS
+    one key per section in SECTIONS
+    """
+    hashers = OrderedDict(
+        (section, hashlib.sha1()) for section in SECTIONS.keys())
+    hashers['other'] = hashlib.sha1()
+
+    for name, value in sorted(element.attrib.items()):
+        if name not in IGNORED_ATTRIBUTES:
+            hashers['other'].update(
+                '{}="{}"'.format(name, value).encode('utf-8'))
+
+    for child in element.iterchildren(tag=etree.Element):
+        section = SECTION_BY_TAG.get(child.tag, 'other')
+        hashers[section].update(canonical_xml(child))
+
+    hashes = OrderedDict(
+        (section, hasher.hexdigest()) for section, hasher in hashers.items())
+
+    activity_hasher = hashlib.sha1()
+    for section_hash in hashes.values():
+        activity_hasher.update(section_hash.encode('utf-8'))
+    hashes['activity'] = activity_hasher.hexdigest()
+
+    return hashes
+
+
+def get_changed_sections(old_hashes, new_hashes):
+    """Returns the list of sections that changed between {old_hashes} and
+    {new_hashes} (empty when nothing changed), or None when the activity
+    has to be parsed as a whole
+    """
+    if not old_hashes or old_hashes.get('other') != new_hashes['other']:
+        return None
+
+    return [
+        section for section in SECTIONS.keys()
+        if old_hashes.get(section) != new_hashes[section]
+    ]
+
+
+def remove_unchanged_children(element, changed_sections):
+    """Removes all children of {element} outside of {changed_sections}, so
+    the parser only walks the sections that are rewritten
+    """
+    for child in element.getchildren():
+        if SECTION_BY_TAG.get(child.tag) not in changed_sections:
+            element.remove(child)
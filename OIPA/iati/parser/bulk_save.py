@@ -0,0 +1,196 @@
+"""Batched alternative for IatiParser.save_all_models().
+
+Instead of one INSERT per model, the models in the parser's model store are
+grouped by class and the classes are put in dependency order (a class comes
+after the classes it has a foreign key to, narratives come after the objects
+they describe). Every level is saved with one bulk_create() per class, which
+assigns the primary keys the next level needs.
+"""
+import logging
+from collections import OrderedDict
+from timeit import default_timer
+
+from django.db import transaction
+from django.db.models.fields.related import ForeignKey, OneToOneField
+
+log = logging.getLogger(__name__)
+
+
+class ModelSaveStats(object):
+    """Insert counts and timings per model class, summed over a dataset"""
+
+    def __init__(self):
+        self.stats = OrderedDict()
+
+    def add(self, model_name, seconds, inserted=0, updated=0, failed=0):
+        stat = self.stats.setdefault(model_name, {
+            'inserted': 0,
+            'updated': 0,
+            'failed': 0,
+            'seconds': 0.0,
+        })
+        stat['inserted'] += inserted
+        stat['updated'] += updated
+        stat['failed'] += failed
+        stat['seconds'] += seconds
+
+    def report(self):
+        lines = []
+
+        for model_name, stat in sorted(
+                self.stats.items(), key=lambda item: -item[1]['seconds']):
+            lines.append(
+                '{}: {} inserted, {} updated, {} failed in {:.3f}s'.format(
+                    model_name,
+                    stat['inserted'],
+                    stat['updated'],
+                    stat['failed'],
+                    stat['seconds']))
+
+        return '\n'.join(lines)
+
+
+def get_dependencies(model, model_classes):
+    """Returns the classes in {model_classes} {model} has to be saved after"""
+    dependencies = set()
+
+    for field in model._meta.fields:
+        if isinstance(field, (ForeignKey, OneToOneField)):
+            related_model = field.related_model
+
+            if related_model in model_classes \
+                    and related_model is not model.__class__:
+                dependencies.add(related_model)
+
+    # generic foreign key of (Organisation)Narrative, see
+    # IatiParser.update_related():
+    related_object = getattr(model, '_related_object', None)
+    if related_object is not None \
+            and related_object.__class__ is not model.__class__:
+        dependencies.add(related_object.__class__)
+
+    return dependencies
+
+
+def get_save_levels(models):
+    """Groups {models} by class and sorts the classes in dependency order.
+
+    Returns a list of (level, in_cycle) tuples. Every level is an
+    OrderedDict of model class to a list of models, where all classes only
+    depend on earlier levels. Classes in a dependency cycle end up in the
+    last level, with in_cycle set.
+    """
+    by_class = OrderedDict()
+    seen = set()
+
+    for model in models:
+        # the same model can be registered under multiple keys:
+        if id(model) in seen:
+            continue
+        seen.add(id(model))
+
+        by_class.setdefault(model.__class__, []).append(model)
+
+    dependencies = {}
+    for model_class, class_models in by_class.items():
+        dependencies[model_class] = set()
+        for model in class_models:
+            dependencies[model_class] |= get_dependencies(model, by_class)
+
+    levels = []
+    done = set()
+
+    while len(done) < len(by_class):
+        level = OrderedDict(
+            (model_class, class_models)
+            for model_class, class_models in by_class.items()
+            if model_class not in done
+            and dependencies[model_class] <= done
+        )
+        in_cycle = False
+
+        if not level:
+            level = OrderedDict(
+                (model_class, class_models)
+                for model_class, class_models in by_class.items()
+                if model_class not in done
+            )
+            in_cycle = True
+
+        levels.append((level, in_cycle))
+        done.update(level.keys())
+
+    return levels
+
+
+def save_one_by_one(parser, model_class, models, stats):
+    start = default_timer()
+    inserted = updated = failed = 0
+
+    for model in models:
+        adding = model.pk is None
+
+        try:
+            parser.update_related(model)
+            model.save()
+        except Exception as e:
+            log.exception(e)
+            failed += 1
+            continue
+
+        if adding:
+            inserted += 1
+        else:
+            updated += 1
+
+    stats.add(
+        model_class.__name__, default_timer() - start,
+        inserted=inserted, updated=updated, failed=failed)
+
+
+def bulk_save_models(parser, models, stats):
+    """Saves {models} (from parser.model_store) level by level, with one
+    bulk_create() per model class for new models. Models which are already
+    saved and classes bulk_create() can't handle are saved one by one.
+    """
+    for level, in_cycle in get_save_levels(models):
+        for model_class, class_models in level.items():
+            new_models = [m for m in class_models if m.pk is None]
+            saved_models = [m for m in class_models if m.pk is not None]
+
+            if saved_models:
+                save_one_by_one(parser, model_class, saved_models, stats)
+
+            if not new_models:
+                continue
+
+            # multi-table inheritance can't be bulk created, and models in
+            # a dependency cycle need each other's primary keys:
+            if model_class._meta.parents or in_cycle:
+                save_one_by_one(parser, model_class, new_models, stats)
+                continue
+
+            start = default_timer()
+
+            try:
+                for model in new_models:
+                    parser.update_related(model)
+
+                # a savepoint, so a failing batch doesn't break the
+                # surrounding transaction:
+                with transaction.atomic():
+                    model_class.objects.bulk_create(new_models)
+
+            except Exception as e:
+                log.exception(e)
+
+                # find (and skip) the offending models, like the regular
+                # save does:
+                for model in new_models:
+                    model.pk = None
+                save_one_by_one(parser, model_class, new_models, stats)
+                continue
+
+            stats.add(
+                model_class.__name__, default_timer() - start,
+                inserted=len(new_models))
@@ -0,0 +1,60 @@
+class DispatchTable(object):
+    """Maps element paths to the handler methods of one parser class.
+
+    Handler methods are named after the path of the element they parse,
+    f. ex. iati_activities__iati_activity__title. Instead of generating that
+    name from the xpath of every element, the parser walks the tree carrying
+    the name of the parent and looks up (parent name, child tag) here. The
+    result of each lookup is memoized, so every distinct path is only
+    computed once per parser class.
+    """
+
+    def __init__(self, parser_class):
+        self.handlers = set()
+        # names of all handlers and of all paths leading to a handler.
+        # Elements outside of these are skipped with their children:
+        self.prefixes = set()
+        self.children = {}
+
+        for name in dir(parser_class):
+            if name.startswith('_') or '__' not in name:
+                continue
+            if not callable(getattr(parser_class, name)):
+                continue
+
+            self.handlers.add(name)
+
+            parts = name.split('__')
+            for i in range(1, len(parts) + 1):
+                self.prefixes.add('__'.join(parts[:i]))
+
+    def is_handler(self, function_name):
+        return function_name in self.handlers
+
+    def is_on_path(self, function_name):
+        return function_name in self.prefixes
+
+    def get_child_function_name(self, function_name, tag):
+        """Returns the function name for a child element with {tag} of the
+        element with {function_name}, or None when no handler exists on or
+        below that path
+        """
+        key = (function_name, tag)
+
+        try:
+            return self.children[key]
+        except KeyError:
+            pass
+
+        child_function_name = None
+        # namespaced tags ({uri}name) never have a handler:
+        if not tag.startswith('{'):
+            child_function_name = '{}__{}'.format(
+                function_name, tag.replace('-', '_'))
+
+            if child_function_name not in self.prefixes:
+                child_function_name = None
+
+        self.children[key] = child_function_name
+
+        return child_function_name
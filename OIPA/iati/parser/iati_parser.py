@@ -3,6 +3,7 @@ import logging
 import re
 from collections import OrderedDict
 from decimal import Decimal, InvalidOperation
+from timeit import default_timer
 
 import dateutil.parser
 from django.conf import settings
@@ -11,10 +12,13 @@ from django.db.models.fields.related import ForeignKey, OneToOneField
 from lxml import etree
 
 from common.util import findnth_occurence_in_string, normalise_unicode_string
+from iati.parser.bulk_save import ModelSaveStats, bulk_save_models
+from iati.parser.dispatch import DispatchTable
 from iati.parser.exceptions import (
     FieldValidationError, IgnoredVocabularyError, NoUpdateRequired,
     ParserError, RequiredFieldError, ValidationError
 )
+from iati.parser.profiling import HANDLER, PHASE, activated, measure
 from iati_codelists import models as codelist_models
 from iati_synchroniser.models import DatasetNote
 from solr.datasetnote.tasks import DatasetNoteTaskIndexing
@@ -45,6 +49,14 @@ class IatiParser(object):
         # commit to db on exit
         self.model_store = OrderedDict()
         self.root = root
+        # insert counts and timings of save_all_models() per model class:
+        self.save_stats = ModelSaveStats()
+        # top level elements which were (not) updated by parse_and_save():
+        self.activities_parsed = 0
+        self.activities_skipped = 0
+        # ParserProfile of the dataset, when profiling (set by ParseManager,
+        # see iati/parser/profiling.py):
+        self.profile = None
 
     def check_registration_agency_validity(self, element_name, element, ref):
         reg_agency_found = False
@@ -189,31 +201,114 @@ class IatiParser(object):
         self.parse_activities(root)
 
     def parse_activities(self, root):
+        """Parse and save all top level elements of {root}, then run
+        post_save_dataset()
         """
+        with activated(self.profile):
+            for e in root.getchildren():
+                self.parse_and_save(e)
 
+            self.post_save_dataset()
+
+    def parse_activities_iteratively(self, source, tag='iati-activity'):
+        """Streaming variant of parse_activities().
+
+        Uses etree.iterparse() on the end events of {tag} elements, so every
+        activity (or organisation) is parsed and saved as soon as it is
+        complete, and cleared from the tree afterwards. Peak memory follows
+        the largest activity instead of the whole file.
+
+        Keyword arguments:
+        source -- a filename or a file object opened in binary mode
+        tag -- the tag of the top level elements to parse
+        """
+        with activated(self.profile):
+            self._parse_iteratively(source, tag)
+
+    def _parse_iteratively(self, source, tag):
+        context = etree.iterparse(
+            source, events=('end',), tag=tag, huge_tree=True)
+
+        try:
+            for event, element in context:
+                # getpath() in parse() is resolved against the tree being
+                # built by iterparse:
+                self.root = element.getroottree().getroot()
+                self.parse_and_save(element)
+
+                # drop the element and everything parsed before it:
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+        except etree.XMLSyntaxError as e:
+            log.exception(e)
+            self.append_error(
+                'XMLSyntaxError',
+                'n/a',
+                'n/a',
+                "This file contains XML syntax errors or it's not an XML "
+                "file",
+                e.lineno,
+                e.msg,
+                'n/a')
+
+            # everything after the error was never seen, so removed
+            # activities can't be determined:
+            self.post_save_dataset(delete_removed=False)
+            return
+
+        self.post_save_dataset()
+
+    def parse_and_save(self, element):
+        """Parse a single top level element (iati-activity or
+        iati-organisation) and save it, if it was updated
         """
-        for e in root.getchildren():
-            self.model_store = OrderedDict()
-            parsed = self.parse(e)
-            # only save if the activity is updated
+        self.model_store = OrderedDict()
+        with measure(self.profile, PHASE, 'parse'):
+            parsed = self.parse(element)
+        # only save if the activity is updated
 
-            if parsed:
+        if parsed:
+            with measure(self.profile, PHASE, 'save_all_models'):
                 self.save_all_models()
+            with measure(self.profile, PHASE, 'post_save_models'):
                 self.post_save_models()
+            self.activities_parsed += 1
+        else:
+            self.activities_skipped += 1
 
-        self.post_save_file(self.dataset)
+    def post_save_dataset(self, delete_removed=True):
+        """Perform all actions that need to happen after all elements of a
+        dataset have been parsed.
+
+        Keyword arguments:
+        delete_removed -- run post_save_file(), which deletes activities that
+        weren't found in the dataset any longer
+        """
+        if delete_removed:
+            with measure(self.profile, PHASE, 'post_save_file'):
+                self.post_save_file(self.dataset)
+
+        log.info(
+            "Saved models of dataset %s:\n%s",
+            self.dataset.name if self.dataset else None,
+            self.save_stats.report())
 
         if settings.ERROR_LOGS_ENABLED:
-            self.post_save_validators(self.dataset)
+            with measure(self.profile, PHASE, 'post_save_validators'):
+                self.post_save_validators(self.dataset)
 
-            # TODO - only delete errors on activities that were updated
-            self.dataset.note_count = len(self.errors)
-            self.dataset.save()
+            with measure(self.profile, PHASE, 'save_dataset_notes'):
+                # TODO - only delete errors on activities that were updated
+                self.dataset.note_count = len(self.errors)
+                self.dataset.save()
 
-            DatasetNote.objects.filter(dataset=self.dataset).delete()
-            DatasetNote.objects.bulk_create(self.errors)
+                DatasetNote.objects.filter(dataset=self.dataset).delete()
+                DatasetNote.objects.bulk_create(self.errors)
 
-            DatasetNoteTaskIndexing().run_from_dataset(dataset=self.dataset)
+                DatasetNoteTaskIndexing().run_from_dataset(
+                    dataset=self.dataset)
 
     def post_save_models(self):
         print("override in children")
@@ -267,6 +362,10 @@ class IatiParser(object):
     def parse(self, element):
         """All of the methods from specific parser file (i. e. IATI_2_03.py)
         get called in this method
+
+        The handler of every element is looked up in the DispatchTable of
+        the parser class, carrying the function name of the parent along
+        while walking the tree.
         """
         if element is None:
             return
@@ -278,66 +377,121 @@ class IatiParser(object):
         x_path = self.root.getroottree().getpath(element)
         function_name = self.generate_function_name(x_path)
 
-        if hasattr(self, function_name)\
-                and callable(getattr(self, function_name)):
-            element_method = getattr(self, function_name)
+        return self._dispatch(
+            element, function_name, self.get_dispatch_table())
 
-            try:
-                element_method(element)
-            except RequiredFieldError as e:
-                log.exception(e)
-                self.append_error(
-                    'RequiredFieldError',
-                    e.model,
-                    e.field,
-                    e.message,
-                    element.sourceline,
-                    None)
-                return
-            except FieldValidationError as e:
-                log.exception(e)
-                self.append_error(
-                    'FieldValidationError',
-                    e.model,
-                    e.field,
-                    e.message,
-                    element.sourceline,
-                    e.variable,
-                    e.iati_id)
-                return
-            except ValidationError as e:
-                log.exception(e)
-                self.append_error(
-                    'FieldValidationError',
-                    e.model,
-                    e.field,
-                    e.message,
-                    element.sourceline,
-                    None,
-                    e.iati_id)
-                return
-            except IgnoredVocabularyError as e:
-                # not implemented, ignore for now
+    def _dispatch(self, element, function_name, dispatch_table):
+        if dispatch_table.is_handler(function_name):
+            if not self.call_handler(getattr(self, function_name), element):
                 return
-            except ParserError as e:
-                log.exception(e)
-                self.append_error(
-                    'ParserError',
-                    'TO DO',
-                    'TO DO',
-                    e.message,
-                    None,
-                    element.sourceline)
-                return
-            except NoUpdateRequired as e:
-                # do nothing, go to next activity
-                return
-            except Exception as e:
-                log.exception(e)
+
+        for e in element.getchildren():
+            # comments, processing instructions and entities:
+            if not isinstance(e.tag, str):
+                continue
+
+            child_function_name = dispatch_table.get_child_function_name(
+                function_name, e.tag)
+
+            if child_function_name is not None:
+                self._dispatch(e, child_function_name, dispatch_table)
+
+        return True
+
+    @classmethod
+    def get_dispatch_table(cls):
+        # built once per parser class (not inherited, subclasses add
+        # handlers):
+        if '_dispatch_table' not in cls.__dict__:
+            cls._dispatch_table = DispatchTable(cls)
+        return cls._dispatch_table
+
+    def parse_by_xpath(self, element):
+        """Reference implementation of parse(), which generates the function
+        name from the xpath of every element. Kept for comparison (see the
+        benchmark_parser_dispatch management command)
+        """
+        if element is None:
+            return
+        if type(element).__name__ != '_Element':
+            return
+        if element.tag == etree.Comment:
+            return
+
+        x_path = self.root.getroottree().getpath(element)
+        function_name = self.generate_function_name(x_path)
+
+        if hasattr(self, function_name)\
+                and callable(getattr(self, function_name)):
+            if not self.call_handler(getattr(self, function_name), element):
                 return
 
         for e in element.getchildren():
-            self.parse(e)
+            self.parse_by_xpath(e)
+
+        return True
+
+    def call_handler(self, handler, element):
+        """Calls the parser method for {element}, logs parser errors.
+        Returns False when the element (and its children) should be skipped
+        """
+        try:
+            if self.profile is None:
+                handler(element)
+            else:
+                with self.profile.measure(HANDLER, handler.__name__):
+                    handler(element)
+        except RequiredFieldError as e:
+            log.exception(e)
+            self.append_error(
+                'RequiredFieldError',
+                e.model,
+                e.field,
+                e.message,
+                element.sourceline,
+                None)
+            return False
+        except FieldValidationError as e:
+            log.exception(e)
+            self.append_error(
+                'FieldValidationError',
+                e.model,
+                e.field,
+                e.message,
+                element.sourceline,
+                e.variable,
+                e.iati_id)
+            return False
+        except ValidationError as e:
+            log.exception(e)
+            self.append_error(
+                'FieldValidationError',
+                e.model,
+                e.field,
+                e.message,
+                element.sourceline,
+                None,
+                e.iati_id)
+            return False
+        except IgnoredVocabularyError as e:
+            # not implemented, ignore for now
+            return False
+        except ParserError as e:
+            log.exception(e)
+            self.append_error(
+                'ParserError',
+                'TO DO',
+                'TO DO',
+                e.message,
+                None,
+                element.sourceline)
+            return False
+        except NoUpdateRequired as e:
+            # do nothing, go to next activity
+            return False
+        except Exception as e:
+            log.exception(e)
+            return False
 
         return True
 
@@ -404,10 +558,21 @@ class IatiParser(object):
                 setattr(model, field.name, getattr(model, field.name))
 
     def save_all_models(self):
+        if settings.IATI_PARSER_BULK_SAVE:
+            models = [
+                model for model_list in self.model_store.values()
+                for model in model_list
+            ]
+            bulk_save_models(self, models, self.save_stats)
+            return
+
         # TODO: problem: assigning unsaved model to foreign key results in
         # error because field_id has not been set (see: https://git.io/fbphN)
         for model_list in self.model_store.items():
             for model in model_list[1]:
+                start = default_timer()
+                adding = model.pk is None
+
                 try:
                     self.update_related(model)
 
@@ -415,7 +580,14 @@ class IatiParser(object):
 
                 except Exception as e:
                     log.exception(e)
-                    pass
+                    self.save_stats.add(
+                        model.__class__.__name__, default_timer() - start,
+                        failed=1)
+                    continue
+
+                self.save_stats.add(
+                    model.__class__.__name__, default_timer() - start,
+                    inserted=int(adding), updated=int(not adding))
 
     def remove_brackets(self, function_name):
         result = ""
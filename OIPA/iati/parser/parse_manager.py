@@ -1,4 +1,7 @@
+import datetime
 import hashlib
+import logging
+import tempfile
 from io import BytesIO
 
 from django import db
@@ -6,17 +9,35 @@ from django.conf import settings
 from django.utils.encoding import smart_text
 from lxml import etree
 
+from common.cache_tags import get_dataset_tags, invalidate_dataset_tags
+from iati.activity_search_indexes import batched_reindexing
+from iati.file_cache import CachedFile
 from iati.filegrabber import FileGrabber
+from iati.models import Activity
 from iati.parser import schema_validators
+from iati.parser.profiling import PHASE, ParserProfile, activated, measure
 from iati.parser.IATI_1_03 import Parse as IATI_103_Parser
 from iati.parser.IATI_1_05 import Parse as IATI_105_Parser
 from iati.parser.IATI_2_01 import Parse as IATI_201_Parser
 from iati.parser.IATI_2_02 import Parse as IATI_202_Parser
 from iati.parser.IATI_2_03 import Parse as IATI_203_Parser
+from iati.searchable_activities import (
+    get_dataset_descendants, update_dataset_searchable_activities
+)
+from iati.transaction.facts import (
+    refresh_dataset_transaction_facts, refresh_transaction_facts
+)
 from iati_organisation.parser.organisation_1_05 import Parse as Org_1_05_Parser
 from iati_organisation.parser.organisation_2_01 import Parse as Org_2_01_Parser
 from iati_organisation.parser.organisation_2_02 import Parse as Org_2_02_Parser
 from iati_organisation.parser.organisation_2_03 import Parse as Org_2_03_Parser
+from solr.indexing_buffer import buffered_indexing
+from traceability.incremental import ChainSnapshot, update_dataset_chains
+
+logger = logging.getLogger(__name__)
+
+# Size of the chunks in which a dataset is written to disk in streaming mode:
+STREAM_CHUNK_SIZE = 1024 * 1024
 
 
 class ParserDisabledError(Exception):
@@ -25,9 +46,17 @@ class ParserDisabledError(Exception):
 
 
 class ParseManager():
-    def __init__(self, dataset, root=None, force_reparse=False):
+    def __init__(self, dataset, root=None, force_reparse=False,
+                 streaming=None, profiling=None):
         """
         Given a IATI dataset, prepare an IATI parser
+
+        With streaming=True (defaults to settings.IATI_PARSER_STREAMING) the
+        file is written to a temporary file and parsed with etree.iterparse
+        instead of being loaded in memory as a whole
+
+        With profiling=True (defaults to settings.IATI_PARSER_PROFILING)
+        parse_all() stores a DatasetParseProfile of the parse
         """
 
         if settings.IATI_PARSER_DISABLED:
@@ -39,6 +68,12 @@ class ParseManager():
         self.force_reparse = force_reparse
         self.hash_changed = True
         self.valid_dataset = True
+        self.streaming = settings.IATI_PARSER_STREAMING \
+            if streaming is None else streaming
+        self.profiling = settings.IATI_PARSER_PROFILING \
+            if profiling is None else profiling
+        # temporary file the dataset is streamed from (streaming mode only):
+        self.source = None
 
         if root is not None:
             self.root = root
@@ -46,7 +81,8 @@ class ParseManager():
             return
 
         file_grabber = FileGrabber()
-        response = file_grabber.get_the_file(self.url)
+        response = file_grabber.get_dataset_file(
+            self.url, stream=self.streaming)
 
         from iati_synchroniser.models import DatasetNote
         if not response or response.status_code != 200:
@@ -69,6 +105,17 @@ class ParseManager():
             self.dataset.save()
             return
 
+        # a file from the file cache (settings.IATI_FILE_CACHE) which didn't
+        # change since the last parse doesn't have to be read at all:
+        if getattr(response, 'sha1', None) == self.dataset.sha1 \
+                and not self.force_reparse:
+            self.hash_changed = False
+            return
+
+        if self.streaming:
+            self._prepare_streaming_source(response)
+            return
+
         # 1. Turn bytestring into string (treat it using specified encoding):
         try:
             iati_file = smart_text(response.content, 'utf-8')
@@ -80,16 +127,7 @@ class ParseManager():
         # 2. Encode the string to use for hashing:
         hasher = hashlib.sha1()
         hasher.update(iati_file.encode('utf-8'))
-        sha1 = hasher.hexdigest()
-
-        if dataset.sha1 == sha1:
-            # dataset did not change, no need to reparse normally
-            self.hash_changed = False
-        else:
-            dataset.sha1 = sha1
-
-            # Save a sha1 in the first time of the process parse
-            dataset.save()
+        self._update_sha1(hasher.hexdigest())
 
         try:
             parser = etree.XMLParser(huge_tree=True)
@@ -102,28 +140,109 @@ class ParseManager():
 
         # TODO: when moving error messages to frontend, create a separate error
         # for wrong file type:
-        except etree.XMLSyntaxError as e:
-            self.valid_dataset = False
-            DatasetNote.objects.filter(dataset=self.dataset).delete()
-            note = DatasetNote(
-                dataset=self.dataset,
-                iati_identifier="n/a",
-                model="n/a",
-                field="n/a",
-                message="This file contains XML syntax errors or it's not an "
-                        "XML file",
-                exception_type='XMLSyntaxError',
-                line_number=None
-            )
-            note.save()
-            self.dataset.note_count = 1
+        except etree.XMLSyntaxError:
+            self._set_xml_syntax_error()
+            return
 
-            # If not the XML should not have a sha1
-            self.dataset.sha1 = ''
+    def _update_sha1(self, sha1):
+        if self.dataset.sha1 == sha1:
+            # dataset did not change, no need to reparse normally
+            self.hash_changed = False
+        else:
+            self.dataset.sha1 = sha1
 
+            # Save a sha1 in the first time of the process parse
             self.dataset.save()
+
+    def _set_xml_syntax_error(self):
+        from iati_synchroniser.models import DatasetNote
+
+        self.valid_dataset = False
+        DatasetNote.objects.filter(dataset=self.dataset).delete()
+        note = DatasetNote(
+            dataset=self.dataset,
+            iati_identifier="n/a",
+            model="n/a",
+            field="n/a",
+            message="This file contains XML syntax errors or it's not an "
+                    "XML file",
+            exception_type='XMLSyntaxError',
+            line_number=None
+        )
+        note.save()
+        self.dataset.note_count = 1
+
+        # If not the XML should not have a sha1
+        self.dataset.sha1 = ''
+
+        self.dataset.save()
+
+    def _prepare_streaming_source(self, response):
+        """
+        Writes the response body to a temporary file (hashing it on the way)
+        and prepares the parser from the root element only. A file from the
+        file cache is read in place.
+        """
+        if isinstance(response, CachedFile):
+            self.source = response.open()
+            sha1 = response.sha1
+        else:
+            self.source = tempfile.TemporaryFile()
+            hasher = hashlib.sha1()
+
+            for chunk in response.iter_content(
+                    chunk_size=STREAM_CHUNK_SIZE):
+                hasher.update(chunk)
+                self.source.write(chunk)
+
+            sha1 = hasher.hexdigest()
+
+        # XXX: the raw bytes are hashed here, which equals the hash of the
+        # non-streaming mode for utf-8 files (re-encoding is a no-op)
+        self._update_sha1(sha1)
+
+        try:
+            self.root = self._read_root_element()
+            self.parser = self._prepare_parser(self.root, self.dataset)
+        except etree.XMLSyntaxError:
+            self._close_source()
+            self._set_xml_syntax_error()
             return
 
+        if settings.ERROR_LOGS_ENABLED:
+            # XSD validation needs the whole tree in memory:
+            logger.info(
+                "Skipping XSD validation of %s in streaming mode", self.url)
+
+    def _read_root_element(self):
+        """
+        Returns an empty copy of the root element of the streamed file
+        (iati-activities or iati-organisations), without building the tree
+        """
+        self.source.seek(0)
+        context = etree.iterparse(
+            self.source, events=('start',), huge_tree=True)
+
+        for event, element in context:
+            root = etree.Element(
+                element.tag, dict(element.attrib), nsmap=element.nsmap)
+            break
+
+        del context
+        self.source.seek(0)
+
+        return root
+
+    def _close_source(self):
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+
+    def _element_tag(self):
+        if self.dataset.filetype == 2:
+            return 'iati-organisation'
+        return 'iati-activity'
+
     def _prepare_parser(self, root, dataset):
         """
             Prepares the parser, given the lxml activity file root
@@ -173,6 +292,9 @@ class ParseManager():
         parser.dataset = dataset
         parser.publisher = dataset.publisher
 
+        if self.profiling:
+            parser.profile = ParserProfile()
+
         return parser
 
     def xsd_validate(self):
@@ -188,25 +310,98 @@ class ParseManager():
 
         # only start parsing when the file changed (or on force)
         if (self.force_reparse or self.hash_changed) and self.valid_dataset:
-            self.parser.load_and_parse(self.root)
+            profile = self.parser.profile
+            started = datetime.datetime.now()
+
+            chain_snapshot = None
+            if settings.TRACEABILITY_INCREMENTAL_CHAINS \
+                    and self.dataset.filetype == 1:
+                chain_snapshot = ChainSnapshot(self.dataset)
+
+            # the tags of the cached responses which depend on the
+            # activities as they are before parsing:
+            previous_tags = get_dataset_tags(self.dataset)
+
+            # the activities which may lose their searchable parent:
+            searchable_descendants = None
+            if settings.ROOT_ORGANISATIONS and self.dataset.filetype == 1:
+                searchable_descendants = get_dataset_descendants(
+                    self.dataset)
+
+            with activated(profile):
+                self._parse_and_index(profile)
+
+                if settings.TRANSACTION_FACTS and \
+                        self.dataset.filetype == 1:
+                    with measure(profile, PHASE,
+                                 'refresh_dataset_transaction_facts'):
+                        refresh_dataset_transaction_facts(self.dataset)
+
+                if chain_snapshot is not None:
+                    with measure(profile, PHASE, 'update_dataset_chains'):
+                        update_dataset_chains(chain_snapshot)
+
+                if searchable_descendants is not None:
+                    with measure(profile, PHASE,
+                                 'update_dataset_searchable_activities'):
+                        update_dataset_searchable_activities(
+                            self.dataset, searchable_descendants)
+
+                # expire the cached API responses which depend on the
+                # dataset:
+                invalidate_dataset_tags(self.dataset, previous_tags)
+
+            if profile is not None:
+                self._save_profile(profile, started)
+
+        self._close_source()
 
         # Throw away query logs when in debug mode to prevent memory from
         # overflowing
         if settings.DEBUG:
             db.reset_queries()
 
+    def _parse_and_index(self, profile):
+        # index the saved activities in Solr and in the full text search
+        # table in batches at the end:
+        with buffered_indexing(), batched_reindexing():
+            with measure(profile, PHASE, 'parse_activities'):
+                if self.source is not None:
+                    self.parser.parse_activities_iteratively(
+                        self.source, tag=self._element_tag())
+                else:
+                    self.parser.load_and_parse(self.root)
+
+    def _save_profile(self, profile, started):
+        from iati_synchroniser.models import DatasetParseProfile
+
+        DatasetParseProfile.objects.create(
+            dataset=self.dataset,
+            started=started,
+            wall_time=profile.wall_time,
+            query_count=profile.query_count,
+            activities_parsed=self.parser.activities_parsed,
+            activities_skipped=self.parser.activities_skipped,
+            stats=profile.as_list())
+
     def parse_activity(self, activity_id):
         """
         Parse only one activity with {activity_id}
         """
 
-        try:
-            (activity,) = self.root.xpath(
-                '//iati-activity/iati-identifier[text()="{}"]'.format(
-                    activity_id
+        if self.source is not None:
+            activity = self._find_activity_iteratively(activity_id)
+        else:
+            try:
+                (activity,) = self.root.xpath(
+                    '//iati-activity/iati-identifier[text()="{}"]'.format(
+                        activity_id
+                    )
                 )
-            )
-        except ValueError:
+            except ValueError:
+                activity = None
+
+        if activity is None:
             raise ValueError(
                 "Activity {} doesn't exist in {}".format(
                     activity_id, self.url
@@ -217,3 +412,31 @@ class ParseManager():
         self.parser.parse(activity.getparent())
         self.parser.save_all_models()
         self.parser.post_save_models()
+
+        if settings.TRANSACTION_FACTS:
+            refresh_transaction_facts(Activity.objects.filter(
+                iati_identifier=activity_id))
+
+        self._close_source()
+
+    def _find_activity_iteratively(self, activity_id):
+        """
+        Returns the iati-identifier element of activity {activity_id} from
+        the streamed file, or None. Activities before it are cleared.
+        """
+        self.source.seek(0)
+        context = etree.iterparse(
+            self.source, events=('end',), tag='iati-activity',
+            huge_tree=True)
+
+        for event, element in context:
+            iati_identifier = element.find('iati-identifier')
+
+            if iati_identifier is not None \
+                    and iati_identifier.text == activity_id:
+                self.parser.root = element.getroottree().getroot()
+                return iati_identifier
+
+            element.clear()
+
+        return None
@@ -4,20 +4,58 @@ Methods triggered after activity has been parsed
 
 from decimal import Decimal
 
+from django.conf import settings
+
+from common import fragment_cache
 from iati import activity_search_indexes, models
 from iati.activity_aggregation_calculation import (
     ActivityAggregationCalculation
 )
+from iati.parser.profiling import POST_SAVE, profiled_step
 from iati.transaction import models as transaction_models
 
 
+def get_linking_activity_ids(queryset, activity_field):
+    """
+    Returns the ids of the activities ({activity_field}) of the rows of
+    {queryset}, of which the fragments are dropped after the rows are
+    updated (see invalidate_linking_activity_fragments())
+    """
+    if not settings.ACTIVITY_FRAGMENT_CACHE:
+        return []
+
+    return list(queryset.values_list(activity_field, flat=True).distinct())
+
+
+def invalidate_linking_activity_fragments(activity, activity_ids):
+    """
+    Drop the cached serialized representations of the activities
+    {activity_ids}, of which a link to {activity} was updated without saving
+    them
+    """
+    if settings.ACTIVITY_FRAGMENT_CACHE and activity_ids:
+        fragment_cache.invalidate_activity_fragments(
+            models.Activity.objects.filter(
+                id__in=activity_ids
+            ).exclude(
+                id=activity.id
+            ).only('id', 'last_updated_model'))
+
+
+@profiled_step(POST_SAVE)
 def set_related_activities(activity):
     """ update related-activity references to this activity """
-    models.RelatedActivity.objects.filter(
-        ref=activity.iati_identifier).update(
-        ref_activity=activity)
+    related_activities = models.RelatedActivity.objects.filter(
+        ref=activity.iati_identifier).exclude(ref_activity=activity)
+    linking_activity_ids = get_linking_activity_ids(
+        related_activities, 'current_activity_id')
 
+    related_activities.update(ref_activity=activity)
 
+    invalidate_linking_activity_fragments(activity, linking_activity_ids)
+
+
+@profiled_step(POST_SAVE)
 def set_participating_organisation_activity_id(participating_organisation):
     """ update activity_id references to this activity """
     # TODO: add reverse relation for participating organisation activity_id
@@ -25,18 +63,28 @@ def set_participating_organisation_activity_id(participating_organisation):
     pass
 
 
+@profiled_step(POST_SAVE)
 def set_transaction_provider_receiver_activity(activity):
     """ update transaction-provider, transaction-receiver references to this
     activity """
-    transaction_models.TransactionProvider.objects.filter(
+    providers = transaction_models.TransactionProvider.objects.filter(
         provider_activity_ref=activity.iati_identifier
-    ).update(provider_activity=activity)
-
-    transaction_models.TransactionReceiver.objects.filter(
+    ).exclude(provider_activity=activity)
+    receivers = transaction_models.TransactionReceiver.objects.filter(
         receiver_activity_ref=activity.iati_identifier
-    ).update(receiver_activity=activity)
+    ).exclude(receiver_activity=activity)
+
+    linking_activity_ids = get_linking_activity_ids(
+        providers, 'transaction__activity_id') + get_linking_activity_ids(
+        receivers, 'transaction__activity_id')
+
+    providers.update(provider_activity=activity)
+    receivers.update(receiver_activity=activity)
 
+    invalidate_linking_activity_fragments(activity, linking_activity_ids)
 
+
+@profiled_step(POST_SAVE)
 def set_derived_activity_dates(activity):
     """Set derived activity dates
 
@@ -57,6 +105,7 @@ def set_derived_activity_dates(activity):
     activity.save()
 
 
+@profiled_step(POST_SAVE)
 def set_activity_aggregations(activity):
     """
     set total activity aggregations for the different transaction types and
@@ -66,6 +115,7 @@ def set_activity_aggregations(activity):
     aac.parse_activity_aggregations(activity)
 
 
+@profiled_step(POST_SAVE)
 def update_activity_search_index(activity):
     """
     Update the Postgres FTS indexes
@@ -73,6 +123,16 @@ def update_activity_search_index(activity):
     activity_search_indexes.reindex_activity(activity)
 
 
+@profiled_step(POST_SAVE)
+def invalidate_activity_fragments(activity):
+    """
+    Drop the cached serialized representations of the activity
+    """
+    if settings.ACTIVITY_FRAGMENT_CACHE:
+        fragment_cache.invalidate_activity_fragments([activity])
+
+
+@profiled_step(POST_SAVE)
 def set_country_region_transaction(activity):
     """
     IATI business rule: If transaction/recipient-country AND/OR
@@ -155,6 +215,7 @@ def set_country_region_transaction(activity):
                 trr.save()
 
 
+@profiled_step(POST_SAVE)
 def set_sector_transaction(activity):
     """
     IATI business rule: If this element is used then ALL transaction elements
@@ -219,6 +280,7 @@ def set_sector_transaction(activity):
                     ).save()
 
 
+@profiled_step(POST_SAVE)
 def set_sector_budget(activity):
     """
     Purpose:
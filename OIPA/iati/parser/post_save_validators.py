@@ -4,9 +4,11 @@ from iati.models import (
     Activity, ActivityParticipatingOrganisation, RelatedActivity,
     ResultIndicatorReference, ResultReference
 )
+from iati.parser.profiling import POST_SAVE_VALIDATOR, profiled_step
 from iati.transaction.models import TransactionProvider, TransactionReceiver
 
 
+@profiled_step(POST_SAVE_VALIDATOR)
 def identifier_correct_prefix(self, a):
     """
     Rule: Must be prefixed with either the current org ref for the reporting
@@ -33,6 +35,7 @@ def identifier_correct_prefix(self, a):
         a.iati_identifier)
 
 
+@profiled_step(POST_SAVE_VALIDATOR)
 def geo_percentages_add_up(self, a):
     """
     Rule: Percentages for all reported countries and regions must add up to
@@ -62,6 +65,7 @@ def geo_percentages_add_up(self, a):
             a.iati_identifier)
 
 
+@profiled_step(POST_SAVE_VALIDATOR)
 def sector_percentages_add_up(self, a):
     """
     Rule: Percentages for all reported sectors must add up to 100%
@@ -80,6 +84,7 @@ def sector_percentages_add_up(self, a):
             a.iati_identifier)
 
 
+@profiled_step(POST_SAVE_VALIDATOR)
 def use_sector_or_transaction_sector(self, a):
     """
     Rules:
@@ -120,6 +125,7 @@ def use_sector_or_transaction_sector(self, a):
             a.iati_identifier)
 
 
+@profiled_step(POST_SAVE_VALIDATOR)
 def use_direct_geo_or_transaction_geo(self, a):
     """
     A supranational geopolitical region that will benefit from this
@@ -165,6 +171,7 @@ def use_direct_geo_or_transaction_geo(self, a):
             a.iati_identifier)
 
 
+@profiled_step(POST_SAVE_VALIDATOR)
 def transactions_at_multiple_levels(self, dataset):
     """
     Rule: If multiple hierarchy levels are reported then financial transactions
@@ -193,6 +200,7 @@ def transactions_at_multiple_levels(self, dataset):
             "dataset validation error")
 
 
+@profiled_step(POST_SAVE_VALIDATOR)
 def unfound_identifiers(self, dataset):
 
     for ra in RelatedActivity.objects.filter(
@@ -256,6 +264,7 @@ def unfound_identifiers(self, dataset):
 
 
 # TODO: test:
+@profiled_step(POST_SAVE_VALIDATOR)
 def use_result_reference_or_indicator_reference(self, activity):
     '''New (optional) <reference> element for <result> element in IATI v. 2.03
 
@@ -284,6 +293,7 @@ def use_result_reference_or_indicator_reference(self, activity):
 
 
 # TODO: test:
+@profiled_step(POST_SAVE_VALIDATOR)
 def one_aid_type_for_each_vocabulary(self, activity):
     '''On a Activity transaction level, multiple AidTypes can be reported, but
     different vocabularies have to be used
@@ -0,0 +1,163 @@
+"""Opt-in profiling of the parser (settings.IATI_PARSER_PROFILING).
+
+A ParserProfile records the wall time, the number of calls and the number of
+database queries of every element handler (by function name), post-save step
+and post-save validator, and of the phases of parsing a dataset
+(save_all_models(), post_save_models(), ...). Queries are counted with an
+execute wrapper on the database connection, so DEBUG doesn't have to be on.
+
+The profile of a parser is active while its dataset is parsed. The functions
+in post_save.py and post_save_validators.py, which don't get the parser,
+find it with get_active_profile() (see profiled_step()). ParseManager stores
+the profile of every parse as a DatasetParseProfile.
+"""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from timeit import default_timer
+
+from django.db import connection
+
+# kinds of measured functions:
+HANDLER = 'handler'
+POST_SAVE = 'post_save'
+POST_SAVE_VALIDATOR = 'post_save_validator'
+PHASE = 'phase'
+
+_local = threading.local()
+
+
+def get_active_profile():
+    return getattr(_local, 'profile', None)
+
+
+class ParserProfile(object):
+    """Calls, time and queries per measured function of one parse"""
+
+    def __init__(self):
+        # (kind, name) -> {'calls', 'seconds', 'queries'}:
+        self.stats = OrderedDict()
+        # totals while the profile was active:
+        self.wall_time = 0.0
+        self.query_count = 0
+
+    def count_query(self, execute, sql, params, many, context):
+        self.query_count += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def activate(self):
+        """Makes this the active profile and counts the queries run in the
+        meantime. Activating the active profile again does nothing"""
+        previous = get_active_profile()
+
+        if previous is self:
+            yield self
+            return
+
+        _local.profile = self
+        start = default_timer()
+
+        try:
+            with connection.execute_wrapper(self.count_query):
+                yield self
+        finally:
+            self.wall_time += default_timer() - start
+            _local.profile = previous
+
+    @contextmanager
+    def measure(self, kind, name):
+        """Adds a call of {name} and its time and queries to the stats.
+        Measurements may be nested, the time and queries of the inner ones
+        are included in the outer ones"""
+        start = default_timer()
+        query_count = self.query_count
+
+        try:
+            yield
+        finally:
+            self.add(
+                kind,
+                name,
+                default_timer() - start,
+                self.query_count - query_count)
+
+    def add(self, kind, name, seconds, queries=0, calls=1):
+        stat = self.stats.setdefault((kind, name), {
+            'calls': 0,
+            'seconds': 0.0,
+            'queries': 0,
+        })
+        stat['calls'] += calls
+        stat['seconds'] += seconds
+        stat['queries'] += queries
+
+    def as_list(self):
+        """Returns the stats as a list of dicts, slowest first"""
+        return [
+            OrderedDict([
+                ('kind', kind),
+                ('name', name),
+                ('calls', stat['calls']),
+                ('seconds', round(stat['seconds'], 6)),
+                ('queries', stat['queries']),
+            ])
+            for (kind, name), stat in sorted(
+                self.stats.items(), key=lambda item: -item[1]['seconds'])
+        ]
+
+
+def report(stats, limit=None):
+    """Formats {stats} (see ParserProfile.as_list()) as lines of text"""
+    lines = []
+
+    for stat in stats[:limit]:
+        lines.append(
+            '{kind}: {name}: {calls} calls, {queries} queries in '
+            '{seconds:.3f}s'.format(**stat))
+
+    return '\n'.join(lines)
+
+
+@contextmanager
+def activated(profile):
+    """ParserProfile.activate() of {profile}, if it isn't None"""
+    if profile is None:
+        yield
+        return
+
+    with profile.activate():
+        yield
+
+
+@contextmanager
+def measure(profile, kind, name):
+    """ParserProfile.measure() of {profile}, if it isn't None"""
+    if profile is None:
+        yield
+        return
+
+    with profile.measure(kind, name):
+        yield
+
+
+def profiled_step(kind):
+    """Decorator measuring the calls of a function in the active profile,
+    if there is one"""
+    def decorator(func):
+        name = func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = get_active_profile()
+
+            if profile is None:
+                return func(*args, **kwargs)
+
+            with profile.measure(kind, name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -2,19 +2,22 @@
 # Unit tests for new functionality in IATI v. 2.03 parser #
 ###########################################################
 
+import copy
 import datetime
 from decimal import Decimal
 from unittest import skip
 
 import dateutil.parser
 # Runs each test in a transaction and flushes database
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from lxml.builder import E
 
 from iati.factory import iati_factory
+from iati.models import Activity
+from iati.parser import activity_hash
 from iati.parser.exceptions import (
-    FieldValidationError, IgnoredVocabularyError, ParserError,
-    RequiredFieldError
+    FieldValidationError, IgnoredVocabularyError, NoUpdateRequired,
+    ParserError, RequiredFieldError
 )
 from iati.parser.IATI_2_03 import Parse as Parser_203
 from iati.parser.parse_manager import ParseManager
@@ -6727,3 +6730,91 @@ class ActivityFssForecastTestCase(TestCase):
         self.assertEqual(self.currency, fss_forecast.currency)
         self.assertEqual(value_date, fss_forecast.value_date)
         self.assertEqual(self.fss, fss_forecast.fss)
+
+
+class ActivityIncrementalUpdateTestCase(TestCase):
+    """
+    Incremental update mode (IATI_PARSER_INCREMENTAL_UPDATE): only rewrite
+    the sections of an activity of which the XML changed
+    """
+
+    def setUp(self):
+        xml_file_attrs = {
+            "generated-datetime": datetime.datetime.now().isoformat(),
+            "version": '2.03',
+        }
+        self.iati_203_XML_file = E("iati-activities", **xml_file_attrs)
+
+        dummy_source = synchroniser_factory.DatasetFactory.create()
+
+        self.parser_203 = ParseManager(
+            dataset=dummy_source,
+            root=self.iati_203_XML_file,
+        ).get_parser()
+
+        version = VersionFactory(code='2.03')
+
+        self.activity = iati_factory.ActivityFactory.create(
+            iati_standard_version=version,
+            dataset=dummy_source,
+            last_updated_datetime=datetime.datetime(2019, 1, 1),
+            xml_hashes=activity_hash.hash_activity(
+                self.activity_element('2019-01-01T00:00:00', '100')
+            ),
+        )
+        iati_factory.BudgetFactory.create(activity=self.activity)
+        TransactionFactory.create(activity=self.activity)
+
+    def activity_element(self, last_updated_datetime, budget_value,
+                         title='Title'):
+        return E(
+            'iati-activity',
+            E('iati-identifier', 'IATI-0001'),
+            E('title', E('narrative', title)),
+            E('budget', E('value', budget_value)),
+            E('transaction', E('value', '200')),
+            **{'last-updated-datetime': last_updated_datetime}
+        )
+
+    @override_settings(IATI_PARSER_INCREMENTAL_UPDATE=True)
+    def test_unchanged_activity_is_kept(self):
+        element = self.activity_element('2019-02-01T00:00:00', '100')
+
+        with self.assertRaises(NoUpdateRequired):
+            self.parser_203.iati_activities__iati_activity(element)
+
+        activity = Activity.objects.get(iati_identifier='IATI-0001')
+        self.assertEqual(activity.pk, self.activity.pk)
+        self.assertEqual(
+            activity.last_updated_datetime, datetime.datetime(2019, 2, 1))
+        self.assertEqual(activity.budget_set.count(), 1)
+
+    @override_settings(IATI_PARSER_INCREMENTAL_UPDATE=True)
+    def test_only_changed_section_is_rewritten(self):
+        element = self.activity_element('2019-02-01T00:00:00', '300')
+        # the handler prunes the element, the hashes are of the whole one:
+        expected_hashes = activity_hash.hash_activity(copy.deepcopy(element))
+
+        self.parser_203.iati_activities__iati_activity(element)
+
+        # only the budget is left to be parsed again:
+        self.assertEqual(
+            [child.tag for child in element.getchildren()], ['budget'])
+
+        activity = self.parser_203.get_model('Activity')
+        self.assertEqual(activity.pk, self.activity.pk)
+        self.assertEqual(activity.budget_set.count(), 0)
+        self.assertEqual(activity.transaction_set.count(), 1)
+        self.assertEqual(activity.xml_hashes, expected_hashes)
+
+    @override_settings(IATI_PARSER_INCREMENTAL_UPDATE=True)
+    def test_changed_activity_is_recreated(self):
+        element = self.activity_element(
+            '2019-02-01T00:00:00', '100', title='Other title')
+
+        self.parser_203.iati_activities__iati_activity(element)
+
+        activity = self.parser_203.get_model('Activity')
+        self.assertNotEqual(activity.pk, self.activity.pk)
+        self.assertEqual(len(element.getchildren()), 4)
+        self.assertIsNotNone(activity.xml_hashes)
@@ -0,0 +1,139 @@
+"""Sets Activity.is_searchable from settings.ROOT_ORGANISATIONS.
+
+An activity is searchable when one of its reporting organisations is a root
+organisation, or when it received funds (a transaction provider activity)
+from a searchable activity. Both variants are one UPDATE with a recursive CTE
+over the transaction provider graph:
+
+- update_searchable_activities() recalculates all activities (the
+  set_searchable_activities command),
+- update_dataset_searchable_activities() only recalculates the activities
+  reachable from the activities of a parsed dataset, before and after parsing
+  it (see ParseManager.parse_all()). The flags of all other activities can't
+  have changed, so the searchable provider activities outside of that
+  subgraph are used as extra roots.
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# The children of the activities in {cte} along the transaction provider
+# graph:
+CHILDREN_SQL = """
+    SELECT t.activity_id
+    FROM iati_transaction t
+    JOIN iati_transactionprovider p ON p.transaction_id = t.id
+    JOIN {cte} ON p.provider_activity_id = {cte}.id"""
+
+ROOT_ACTIVITY_SQL = """
+    EXISTS (
+        SELECT 1 FROM iati_activityreportingorganisation ro
+        WHERE ro.activity_id = a.id AND ro.ref = ANY(%(roots)s::text[])
+    )"""
+
+UPDATE_SQL = """
+WITH RECURSIVE searchable(id) AS (
+    SELECT a.id FROM iati_activity a
+    WHERE {root_activity}
+    UNION{children}
+)
+UPDATE iati_activity
+SET is_searchable = (id IN (SELECT id FROM searchable))
+WHERE is_searchable <> (id IN (SELECT id FROM searchable))
+""".format(
+    root_activity=ROOT_ACTIVITY_SQL,
+    children=CHILDREN_SQL.format(cte='searchable'),
+)
+
+DESCENDANTS_SQL = """
+WITH RECURSIVE reachable(id) AS (
+    SELECT a.id FROM iati_activity a
+    WHERE a.dataset_id = %(dataset)s OR a.id = ANY(%(activities)s::integer[])
+    UNION{children}
+)"""
+
+DATASET_DESCENDANTS_SQL = DESCENDANTS_SQL.format(
+    children=CHILDREN_SQL.format(cte='reachable'),
+) + """
+SELECT id FROM reachable
+"""
+
+DATASET_UPDATE_SQL = DESCENDANTS_SQL.format(
+    children=CHILDREN_SQL.format(cte='reachable'),
+) + """,
+searchable(id) AS (
+    SELECT a.id FROM iati_activity a
+    JOIN reachable ON reachable.id = a.id
+    WHERE {root_activity} OR EXISTS (
+        SELECT 1
+        FROM iati_transaction t
+        JOIN iati_transactionprovider p ON p.transaction_id = t.id
+        JOIN iati_activity provider ON provider.id = p.provider_activity_id
+        WHERE t.activity_id = a.id
+        AND provider.is_searchable
+        AND provider.id NOT IN (SELECT id FROM reachable)
+    )
+    UNION{children}
+)
+UPDATE iati_activity
+SET is_searchable = (id IN (SELECT id FROM searchable))
+WHERE id IN (SELECT id FROM reachable)
+AND is_searchable <> (id IN (SELECT id FROM searchable))
+""".format(
+    root_activity=ROOT_ACTIVITY_SQL,
+    children=CHILDREN_SQL.format(cte='searchable'),
+)
+
+
+def update_searchable_activities():
+    """
+    Sets all activities which are (funded by) an activity of one of
+    settings.ROOT_ORGANISATIONS searchable, and all others non searchable.
+    Returns the number of changed activities
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(UPDATE_SQL, {'roots': settings.ROOT_ORGANISATIONS})
+        row_count = cursor.rowcount
+
+    logger.info("Changed is_searchable of %s activities", row_count)
+
+    return row_count
+
+
+def get_dataset_descendants(dataset):
+    """
+    Returns the ids of the activities of {dataset} and of all activities
+    they (indirectly) provide funds to. Taken before parsing {dataset}, for
+    update_dataset_searchable_activities()
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(DATASET_DESCENDANTS_SQL, {
+            'dataset': dataset.id,
+            'activities': [],
+        })
+        return [row[0] for row in cursor.fetchall()]
+
+
+def update_dataset_searchable_activities(dataset, previous_descendants=()):
+    """
+    Recalculates is_searchable of the activities of {dataset} and of all
+    activities they (indirectly) provide funds to, now or before parsing
+    {dataset} ({previous_descendants}, see get_dataset_descendants()).
+    Returns the number of changed activities
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(DATASET_UPDATE_SQL, {
+            'dataset': dataset.id,
+            'activities': list(previous_descendants),
+            'roots': settings.ROOT_ORGANISATIONS,
+        })
+        row_count = cursor.rowcount
+
+    logger.info(
+        "Changed is_searchable of %s activities after parsing dataset %s",
+        row_count, dataset.name)
+
+    return row_count
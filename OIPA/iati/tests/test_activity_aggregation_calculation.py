@@ -0,0 +1,92 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from iati.activity_aggregation_calculation import (
+    ActivityAggregationCalculation, BulkActivityAggregationCalculation
+)
+from iati.factory import iati_factory
+from iati.models import (
+    ActivityAggregation, ActivityPlusChildAggregation, ChildAggregation
+)
+from iati.transaction.factories import (
+    TransactionFactory, TransactionTypeFactory
+)
+from iati_synchroniser.factory.synchroniser_factory import DatasetFactory
+
+
+class BulkActivityAggregationCalculationTestCase(TestCase):
+    """
+    The set based calculation gives the same aggregations as the per
+    activity calculation
+    """
+
+    def setUp(self):
+        self.dataset = DatasetFactory.create(name='dataset-child')
+
+        self.parent = iati_factory.ActivityFactory.create(
+            iati_identifier='IATI-0001')
+        self.child = iati_factory.ActivityFactory.create(
+            iati_identifier='IATI-0002',
+            dataset=self.dataset,
+            hierarchy=2)
+
+        iati_factory.RelatedActivityFactory.create(
+            current_activity=self.child,
+            ref_activity=self.parent,
+            ref=self.parent.iati_identifier)
+
+        commitment = TransactionTypeFactory.create(code='2')
+
+        iati_factory.BudgetFactory.create(activity=self.parent, value=100)
+        iati_factory.BudgetFactory.create(activity=self.child, value=50)
+        TransactionFactory.create(activity=self.parent, value=200)
+        TransactionFactory.create(
+            activity=self.child, transaction_type=commitment, value=20)
+        TransactionFactory.create(
+            activity=self.child, transaction_type=commitment, value=30)
+
+    def get_aggregations(self):
+        return [
+            list(model.objects.order_by('activity_id').values(
+                'activity_id', 'budget_value', 'budget_currency',
+                'incoming_funds_value', 'commitment_value',
+                'commitment_currency'))
+            for model in (ActivityAggregation, ChildAggregation,
+                          ActivityPlusChildAggregation)
+        ]
+
+    def test_parse_activity_aggregations_by_source(self):
+        BulkActivityAggregationCalculation(
+        ).parse_activity_aggregations_by_source(self.dataset.id)
+        bulk_aggregations = self.get_aggregations()
+
+        # the parent's aggregations are updated too:
+        self.assertEqual(
+            ChildAggregation.objects.get(
+                activity=self.parent).commitment_value,
+            Decimal(50))
+        self.assertEqual(
+            ActivityPlusChildAggregation.objects.get(
+                activity=self.parent).budget_value,
+            Decimal(150))
+
+        aac = ActivityAggregationCalculation()
+        aac.parse_activity_aggregations(self.parent)
+        aac.parse_activity_aggregations(self.child)
+
+        self.assertEqual(bulk_aggregations, self.get_aggregations())
+
+    def test_parse_all_activity_aggregations_again(self):
+        """
+        Existing aggregations are updated in place
+        """
+        aac = BulkActivityAggregationCalculation(batch_size=1)
+        aac.parse_all_activity_aggregations()
+        aac.parse_all_activity_aggregations()
+
+        self.assertEqual(ActivityAggregation.objects.count(), 2)
+        self.assertEqual(
+            ActivityAggregation.objects.get(
+                activity=self.child).commitment_value,
+            Decimal(50))
@@ -0,0 +1,52 @@
+from django.test import TestCase, override_settings
+
+from iati.activity_search_indexes import (
+    COLUMN_SOURCES, batched_reindexing, reindex_activities, reindex_activity
+)
+from iati.factory.utils import _create_test_activity
+from iati.models import Activity, ActivitySearch
+
+
+@override_settings(FTS_ENABLED=True)
+class ReindexActivitiesTestCase(TestCase):
+
+    def setUp(self):
+        self.activity = _create_test_activity(
+            id='100000', iati_identifier='100000')
+
+    def get_words(self):
+        activity_search = ActivitySearch.objects.values().get(
+            activity=self.activity)
+
+        return {
+            column: sorted(activity_search[column].split())
+            for column in COLUMN_SOURCES
+        }
+
+    def test_same_text_as_reindex_activity(self):
+        reindex_activity(self.activity)
+        expected = self.get_words()
+
+        ActivitySearch.objects.all().delete()
+        self.assertEqual(reindex_activities(
+            Activity.objects.filter(pk=self.activity.pk)), 1)
+
+        self.assertEqual(self.get_words(), expected)
+
+    def test_upsert_and_search(self):
+        reindex_activities(Activity.objects.all())
+        reindex_activities(Activity.objects.all())
+
+        self.assertEqual(ActivitySearch.objects.filter(
+            activity=self.activity).count(), 1)
+        self.assertTrue(ActivitySearch.objects.filter(
+            activity=self.activity,
+            search_vector_text='100000').exists())
+
+    def test_batched_reindexing(self):
+        with batched_reindexing():
+            reindex_activity(self.activity)
+            self.assertFalse(ActivitySearch.objects.exists())
+
+        self.assertTrue(ActivitySearch.objects.filter(
+            activity=self.activity).exists())
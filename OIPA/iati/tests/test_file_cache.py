@@ -0,0 +1,84 @@
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+from mock import MagicMock
+
+from iati.file_cache import CachedFile, FileCache
+from iati.filegrabber import FileGrabber
+
+URL = 'http://example.com/activities.xml'
+
+
+def response(status_code=200, content=b'', headers=None):
+    return MagicMock(
+        status_code=status_code,
+        headers=headers or {},
+        iter_content=MagicMock(return_value=iter([content])))
+
+
+class FileCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = FileCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_store(self):
+        cached_file = self.cache.store(URL, response(
+            content=b'<iati-activities/>',
+            headers={'ETag': '"abc"', 'Last-Modified': 'Mon, 01 Jan 2018'}))
+
+        self.assertEqual(cached_file.content, b'<iati-activities/>')
+
+        entry = self.cache.get_entry(URL)
+        self.assertEqual(entry['sha1'], cached_file.sha1)
+        self.assertEqual(self.cache.conditional_headers(entry), {
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Mon, 01 Jan 2018',
+        })
+
+    def test_store_changed_file(self):
+        """
+        The old content is removed when no URL points to it anymore
+        """
+        old_file = self.cache.store(URL, response(content=b'old'))
+        new_file = self.cache.store(URL, response(content=b'new'))
+
+        self.assertEqual(self.cache.get_entry(URL)['sha1'], new_file.sha1)
+        self.assertRaises(IOError, lambda: old_file.content)
+
+
+class FileGrabberCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_grabber = FileGrabber()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_dataset_file(self):
+        """
+        The second request is conditional, a 304 is answered from the cache
+        """
+        with override_settings(
+                IATI_FILE_CACHE=True, IATI_FILE_CACHE_DIR=self.directory):
+            self.file_grabber.get_the_file = MagicMock(return_value=response(
+                content=b'<iati-activities/>', headers={'ETag': '"abc"'}))
+            first = self.file_grabber.get_dataset_file(URL)
+
+            self.file_grabber.get_the_file = MagicMock(
+                return_value=response(status_code=304))
+            second = self.file_grabber.get_dataset_file(URL)
+
+        self.file_grabber.get_the_file.assert_called_once_with(
+            URL, stream=True, headers={'If-None-Match': '"abc"'})
+
+        self.assertIsInstance(second, CachedFile)
+        self.assertFalse(first.not_modified)
+        self.assertTrue(second.not_modified)
+        self.assertEqual(second.sha1, first.sha1)
+        self.assertEqual(second.content, b'<iati-activities/>')
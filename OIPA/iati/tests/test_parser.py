@@ -6,11 +6,14 @@ from unittest import skip
 import pytest
 from django.core import management
 from django.test import TestCase as DjangoTestCase
+from lxml import etree
 from lxml.builder import E
+from mock import MagicMock
 
 import iati_codelists.models as codelist_models
 from iati.factory import iati_factory
 from iati.models import Activity
+from iati.parser.dispatch import DispatchTable
 from iati.parser.IATI_2_01 import Parse as Parser_201
 from iati.parser.iati_parser import IatiParser
 
@@ -134,6 +137,57 @@ class IatiParserTestCase(DjangoTestCase):
         primary_name = self.parser.get_primary_name(narrative, primary_name)
         self.assertEqual(primary_name, "new narrative")
 
+    def test_dispatch_table_child_function_name(self):
+        dispatch_table = DispatchTable(Parser_201)
+
+        self.assertTrue(
+            dispatch_table.is_handler('iati_activities__iati_activity'))
+        self.assertEqual(
+            dispatch_table.get_child_function_name(
+                'iati_activities__iati_activity', 'reporting-org'),
+            'iati_activities__iati_activity__reporting_org')
+        # no handler on or below this path:
+        self.assertIsNone(dispatch_table.get_child_function_name(
+            'iati_activities__iati_activity', 'unknown-element'))
+        self.assertIsNone(dispatch_table.get_child_function_name(
+            'iati_activities__iati_activity', '{http://example.org}title'))
+
+    def test_parse_dispatches_like_parse_by_xpath(self):
+        """
+        The dispatch table should call the same handlers, in the same order
+        as the xpath based dispatch
+        """
+        root = E('iati-activities', version='2.01')
+        activity = E(
+            'iati-activity',
+            E('iati-identifier', 'IATI-0001'),
+            E('title', E('narrative', 'title')),
+            E('unknown-element', E('narrative', 'ignored')),
+        )
+        activity.append(etree.Comment('comment'))
+        root.append(activity)
+
+        handler_names = [
+            'iati_activities__iati_activity',
+            'iati_activities__iati_activity__iati_identifier',
+            'iati_activities__iati_activity__title',
+            'iati_activities__iati_activity__title__narrative',
+        ]
+
+        calls = {}
+        for method in ('parse', 'parse_by_xpath'):
+            parser = Parser_201(root)
+            handler = MagicMock()
+
+            for name in handler_names:
+                setattr(parser, name, getattr(handler, name))
+
+            self.assertTrue(getattr(parser, method)(activity))
+            calls[method] = [call[0] for call in handler.mock_calls]
+
+        self.assertEqual(calls['parse'], handler_names)
+        self.assertEqual(calls['parse'], calls['parse_by_xpath'])
+
     @skip('NotImplemented')
     def test_save_model_saves_model(self):
         raise NotImplementedError()
@@ -0,0 +1,78 @@
+from django.test import TestCase
+
+from iati import models
+from iati.factory import iati_factory
+from iati.parser.bulk_save import (
+    ModelSaveStats, bulk_save_models, get_save_levels
+)
+from iati.parser.IATI_2_03 import Parse as Parser_203
+from iati_codelists.factory import codelist_factory
+
+
+class BulkSaveTestCase(TestCase):
+    """
+    Batched alternative for IatiParser.save_all_models()
+    """
+
+    def setUp(self):
+        self.activity = iati_factory.ActivityFactory.create()
+        self.language = codelist_factory.LanguageFactory.create()
+
+        self.title = models.Title(activity=self.activity)
+        self.descriptions = [
+            models.Description(activity=self.activity) for i in range(3)
+        ]
+
+        self.narratives = []
+        for parent in [self.title] + self.descriptions:
+            narrative = models.Narrative(
+                activity=self.activity,
+                language=self.language,
+                content='narrative')
+            setattr(narrative, '_related_object', parent)
+            self.narratives.append(narrative)
+
+    def test_get_save_levels(self):
+        """
+        Classes come after the classes they depend on, also when
+        registered in a different order
+        """
+        levels = get_save_levels(
+            self.narratives + self.descriptions + [self.title, self.activity]
+        )
+
+        self.assertEqual(
+            [list(level.keys()) for level, in_cycle in levels],
+            [
+                [models.Activity],
+                [models.Description, models.Title],
+                [models.Narrative],
+            ]
+        )
+        self.assertFalse(any(in_cycle for level, in_cycle in levels))
+
+    def test_bulk_save_models(self):
+        parser = Parser_203(None)
+        stats = ModelSaveStats()
+
+        bulk_save_models(
+            parser,
+            [self.activity, self.title] + self.descriptions + self.narratives,
+            stats)
+
+        self.assertEqual(models.Description.objects.count(), 3)
+        self.assertIsNotNone(self.title.pk)
+
+        for narrative in self.narratives:
+            self.assertIsNotNone(narrative.pk)
+
+        self.assertEqual(
+            self.title.narratives.get().pk, self.narratives[0].pk)
+        self.assertEqual(
+            models.Narrative.objects.filter(
+                related_object_id__in=[d.pk for d in self.descriptions]
+            ).count(), 3)
+
+        self.assertEqual(stats.stats['Description']['inserted'], 3)
+        self.assertEqual(stats.stats['Narrative']['inserted'], 4)
+        self.assertEqual(stats.stats['Activity']['updated'], 1)
@@ -1,14 +1,15 @@
 from decimal import Decimal
 from unittest import skip
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from mock import patch
 
 from iati.factory import iati_factory
 from iati.models import BudgetSector, Sector
 from iati.parser import post_save
 from iati.parser.IATI_2_01 import Parse as Parser_201
 from iati.transaction.factories import (
-    TransactionFactory, TransactionTypeFactory
+    TransactionFactory, TransactionProviderFactory, TransactionTypeFactory
 )
 from iati.transaction.models import (
     TransactionRecipientCountry, TransactionRecipientRegion, TransactionSector
@@ -374,3 +375,54 @@ class PostSaveActivityTestCase(TestCase):
         BudgetSector.objects.filter(
             sector=self.s4, budget=self.budget2)[0]
         self.assertEqual(round(ts2.percentage), 25)
+
+
+@override_settings(ACTIVITY_FRAGMENT_CACHE=True)
+class PostSaveLinkedActivityFragmentsTestCase(TestCase):
+    """
+    The fragments of the activities of which a link to the parsed activity
+    is updated are dropped
+    """
+
+    def setUp(self):
+        self.activity = iati_factory.ActivityFactory.create(
+            iati_identifier='IATI-0001')
+        self.related = iati_factory.ActivityFactory.create(
+            iati_identifier='IATI-0002')
+        self.funded = iati_factory.ActivityFactory.create(
+            iati_identifier='IATI-0003')
+
+        iati_factory.RelatedActivityFactory.create(
+            current_activity=self.related,
+            ref_activity=None,
+            ref='IATI-0001')
+        TransactionProviderFactory.create(
+            transaction=TransactionFactory.create(activity=self.funded),
+            provider_activity=None,
+            provider_activity_ref='IATI-0001')
+
+    def get_invalidated(self, post_save_function):
+        with patch('iati.parser.post_save.fragment_cache.'
+                   'invalidate_activity_fragments') as invalidate:
+            post_save_function(self.activity)
+
+        return [
+            activity.pk
+            for call in invalidate.call_args_list
+            for activity in call[0][0]
+        ]
+
+    def test_set_related_activities(self):
+        self.assertEqual(
+            self.get_invalidated(post_save.set_related_activities),
+            [self.related.pk])
+
+        # links which didn't change don't drop fragments:
+        self.assertEqual(
+            self.get_invalidated(post_save.set_related_activities), [])
+
+    def test_set_transaction_provider_receiver_activity(self):
+        self.assertEqual(
+            self.get_invalidated(
+                post_save.set_transaction_provider_receiver_activity),
+            [self.funded.pk])
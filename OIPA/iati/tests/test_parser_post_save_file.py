@@ -1,6 +1,8 @@
 import datetime
+from io import BytesIO
 
 from django.test import TestCase
+from lxml import etree
 from lxml.builder import E
 from mock import MagicMock
 
@@ -65,3 +67,46 @@ class PostSaveFileTestCase(TestCase):
         self.parser.parse_activities(root)
 
         self.assertEqual(Activity.objects.count(), 1)
+
+    def test_delete_removed_activities_iteratively(self):
+        """Streaming parsing should remove activities that are not in the
+        source any longer, same as parse_activities()
+        """
+        root = E('iati-activities', version='2.01')
+        xml_activity = E('iati-activity')
+        xml_activity.append(E('title', 'Title of activity 1'))
+        xml_activity.append(E('iati-identifier', 'IATI-0001'))
+        root.append(xml_activity)
+
+        self.parser = Parser_201(None)
+        self.parser.dataset = self.dataset
+        self.parser.update_activity_search_index = MagicMock()
+        self.parser.post_save_models = MagicMock()
+
+        self.parser.parse_start_datetime = datetime.datetime.now()
+        self.parser.parse_activities_iteratively(
+            BytesIO(etree.tostring(root)))
+
+        self.assertEqual(Activity.objects.count(), 1)
+        self.assertEqual(
+            Activity.objects.get().iati_identifier, 'IATI-0001')
+
+    def test_parse_activities_iteratively_syntax_error(self):
+        """Activities after a syntax error are never seen, so nothing should
+        be deleted
+        """
+        source = BytesIO(
+            b'<iati-activities version="2.01">'
+            b'<iati-activity><iati-identifier>IATI-0001</iati-identifier>'
+            b'</iati-activity><iati-activity>'
+        )
+
+        self.parser = Parser_201(None)
+        self.parser.dataset = self.dataset
+        self.parser.parse_and_save = MagicMock()
+
+        self.parser.parse_start_datetime = datetime.datetime.now()
+        self.parser.parse_activities_iteratively(source)
+
+        self.assertEqual(self.parser.parse_and_save.call_count, 1)
+        self.assertEqual(Activity.objects.count(), 2)
@@ -0,0 +1,109 @@
+import datetime
+
+from django.test import TestCase
+from lxml.builder import E
+from mock import MagicMock
+
+from iati.models import Activity
+from iati.parser.IATI_2_01 import Parse as Parser_201
+from iati.parser.profiling import (
+    HANDLER, PHASE, POST_SAVE, ParserProfile, get_active_profile,
+    profiled_step
+)
+from iati_codelists.factory.codelist_factory import VersionFactory
+from iati_synchroniser.factory.synchroniser_factory import DatasetFactory
+
+
+@profiled_step(POST_SAVE)
+def count_activities():
+    return Activity.objects.count()
+
+
+class ParserProfileTestCase(TestCase):
+
+    def get_stat(self, profile, kind, name):
+        return dict(profile.stats)[(kind, name)]
+
+    def test_profiled_step(self):
+        """A decorated function is only measured in the active profile,
+        with the queries it ran
+        """
+        profile = ParserProfile()
+
+        self.assertEqual(count_activities(), 0)
+        self.assertEqual(profile.stats, {})
+
+        with profile.activate():
+            self.assertIs(get_active_profile(), profile)
+            count_activities()
+            count_activities()
+
+        self.assertIsNone(get_active_profile())
+
+        stat = self.get_stat(profile, POST_SAVE, 'count_activities')
+        self.assertEqual(stat['calls'], 2)
+        self.assertEqual(stat['queries'], 2)
+        self.assertEqual(profile.query_count, 2)
+        self.assertGreater(profile.wall_time, 0)
+
+    def test_nested_measurements(self):
+        profile = ParserProfile()
+
+        with profile.activate():
+            with profile.measure(PHASE, 'outer'):
+                with profile.measure(PHASE, 'inner'):
+                    Activity.objects.count()
+                Activity.objects.count()
+
+        self.assertEqual(self.get_stat(profile, PHASE, 'inner')['queries'], 1)
+        self.assertEqual(self.get_stat(profile, PHASE, 'outer')['queries'], 2)
+        self.assertEqual(
+            [stat['name'] for stat in profile.as_list()], ['outer', 'inner'])
+
+
+class ParseProfilingTestCase(TestCase):
+
+    def setUp(self):
+        self.dataset = DatasetFactory.create(name='source_reference')
+        VersionFactory(code='2.01')
+
+    def parse(self, profile):
+        root = E('iati-activities', version='2.01')
+        xml_activity = E('iati-activity')
+        xml_activity.append(E('iati-identifier', 'IATI-0001'))
+        xml_activity.append(E('title', E('narrative', 'Title')))
+        root.append(xml_activity)
+
+        parser = Parser_201(root)
+        parser.dataset = self.dataset
+        parser.profile = profile
+        # post_save_models() uses postgres fts:
+        parser.post_save_models = MagicMock()
+
+        parser.parse_start_datetime = datetime.datetime.now()
+        parser.parse_activities(root)
+
+        return parser
+
+    def test_parse_activities(self):
+        """Element handlers and phases of the parse should be measured"""
+        profile = ParserProfile()
+        self.parse(profile)
+
+        self.assertEqual(Activity.objects.count(), 1)
+
+        stats = dict(profile.stats)
+        self.assertEqual(
+            stats[(HANDLER, 'iati_activities__iati_activity')]['calls'], 1)
+        self.assertEqual(stats[(
+            HANDLER, 'iati_activities__iati_activity__iati_identifier'
+        )]['calls'], 1)
+        self.assertEqual(stats[(PHASE, 'parse')]['calls'], 1)
+        self.assertGreater(stats[(PHASE, 'save_all_models')]['queries'], 0)
+        self.assertGreater(profile.query_count, 0)
+
+    def test_parse_activities_without_profile(self):
+        parser = self.parse(None)
+
+        self.assertIsNone(parser.profile)
+        self.assertEqual(Activity.objects.count(), 1)
@@ -3,8 +3,13 @@ from django.test import TestCase
 
 from iati.factory import iati_factory
 from iati.management.commands.set_searchable_activities import Command
+from iati.models import Activity
+from iati.searchable_activities import (
+    get_dataset_descendants, update_dataset_searchable_activities
+)
 from iati.transaction import factories as transaction_factory
 from iati_codelists.factory import codelist_factory
+from iati_synchroniser.factory.synchroniser_factory import DatasetFactory
 
 
 class SearchableActivitiesTestCase(TestCase):
@@ -20,6 +25,7 @@ class SearchableActivitiesTestCase(TestCase):
         # -one reporting-org GB-1
         # -one GB-1 searchable
         # -one non searchable
+        # -one funded by the GB-1 searchable one
 
         version = codelist_factory.VersionFactory(code='2.01')
         self.first_activity = iati_factory.ActivityFactory.create(
@@ -63,11 +69,24 @@ class SearchableActivitiesTestCase(TestCase):
             transaction=transaction
         )
 
+        self.fourth_activity = iati_factory.ActivityFactory.create(
+            iati_identifier='GB-CHC-3',
+            iati_standard_version=self.first_activity.iati_standard_version)
+        transaction_factory.TransactionProviderFactory.create(
+            ref="GB-CHC-1",
+            normalized_ref="GB-CHC-1",
+            provider_activity=self.second_activity,
+            provider_activity_ref="GB-CHC-1",
+            transaction=transaction_factory.TransactionFactory.create(
+                activity=self.fourth_activity,
+            )
+        )
+
     def test_update_searchable_activities(self):
         """
         Test if root organisations projects are set as searchable.
-        This tests both update_searchable_activities and
-        set_children_searchable.
+        This also tests that the activities they (indirectly) fund are set
+        as searchable.
         """
         self.command.update_searchable_activities()
 
@@ -79,3 +98,31 @@ class SearchableActivitiesTestCase(TestCase):
 
         self.third_activity.refresh_from_db()
         self.assertFalse(self.third_activity.is_searchable)
+
+        self.fourth_activity.refresh_from_db()
+        self.assertTrue(self.fourth_activity.is_searchable)
+
+    def test_update_dataset_searchable_activities(self):
+        """
+        Test if the activities funded by a reparsed dataset are updated
+        """
+        self.command.update_searchable_activities()
+
+        dataset = DatasetFactory.create()
+        Activity.objects.filter(pk=self.second_activity.pk).update(
+            dataset=dataset)
+        descendants = get_dataset_descendants(dataset)
+
+        self.assertEqual(set(descendants), {
+            self.second_activity.id, self.fourth_activity.id})
+
+        # the activity was removed from the dataset:
+        self.second_activity.delete()
+
+        update_dataset_searchable_activities(dataset, descendants)
+
+        self.first_activity.refresh_from_db()
+        self.assertTrue(self.first_activity.is_searchable)
+
+        self.fourth_activity.refresh_from_db()
+        self.assertFalse(self.fourth_activity.is_searchable)
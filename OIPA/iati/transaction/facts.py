@@ -0,0 +1,119 @@
+"""Refreshes the TransactionFact table.
+
+The fact rows of a set of activities are deleted and inserted again with one
+INSERT ... SELECT, which joins the transactions to their sector, recipient
+country and recipient region splits. Run after a dataset is parsed (see
+ParseManager.parse_all()) when settings.TRANSACTION_FACTS is on, or for all
+activities with the refresh_transaction_facts command.
+"""
+import logging
+
+from django.db import connection, transaction
+
+from iati.models import Activity
+
+logger = logging.getLogger(__name__)
+
+# Value columns copied (divided by the number of rows) from the transaction:
+VALUE_FIELDS = (
+    'value',
+    'xdr_value',
+    'usd_value',
+    'eur_value',
+    'gbp_value',
+    'jpy_value',
+    'cad_value',
+)
+
+# split (alias, table, column) per kind of split:
+SPLITS = (
+    ('fact_sector', 'iati_transactionsector', 'sector_id'),
+    ('fact_country', 'iati_transactionrecipientcountry', 'country_id'),
+    ('fact_region', 'iati_transactionrecipientregion', 'region_id'),
+)
+
+SPLIT_SQL = """
+{alias} AS (
+    SELECT split.transaction_id,
+           split.{column},
+           split.percentage / 100 * COUNT(*) OVER w AS weight,
+           COUNT(*) OVER w AS splits
+    FROM {table} split
+    WHERE split.transaction_id IN (SELECT id FROM fact_transaction)
+    WINDOW w AS (PARTITION BY split.transaction_id)
+)"""
+
+REFRESH_SQL = """
+WITH fact_transaction AS (
+    SELECT t.id, t.activity_id, t.transaction_type_id, t.transaction_date,
+           {transaction_values}
+    FROM iati_transaction t
+    {where}
+),
+{splits}
+INSERT INTO iati_transactionfact (
+    transaction_id, activity_id, transaction_type_id, transaction_date,
+    sector_id, recipient_country_id, recipient_region_id,
+    sector_weight, recipient_country_weight, recipient_region_weight,
+    {value_fields}
+)
+SELECT t.id, t.activity_id, t.transaction_type_id, t.transaction_date,
+       fact_sector.sector_id, fact_country.country_id,
+       fact_region.region_id,
+       fact_sector.weight, fact_country.weight, fact_region.weight,
+       {fact_values}
+FROM fact_transaction t
+LEFT JOIN fact_sector ON fact_sector.transaction_id = t.id
+LEFT JOIN fact_country ON fact_country.transaction_id = t.id
+LEFT JOIN fact_region ON fact_region.transaction_id = t.id
+"""
+
+
+def get_refresh_sql(where=''):
+    rows = ' * '.join(
+        'COALESCE({}.splits, 1)'.format(alias) for alias, _, _ in SPLITS)
+
+    return REFRESH_SQL.format(
+        transaction_values=', '.join(
+            't.{}'.format(field) for field in VALUE_FIELDS),
+        where=where,
+        splits=','.join(
+            SPLIT_SQL.format(alias=alias, table=table, column=column)
+            for alias, table, column in SPLITS),
+        value_fields=', '.join(VALUE_FIELDS),
+        fact_values=', '.join(
+            't.{field} / ({rows})'.format(field=field, rows=rows)
+            for field in VALUE_FIELDS),
+    )
+
+
+def refresh_transaction_facts(activities=None):
+    """
+    Rebuilds the fact rows of the transactions of {activities} (an Activity
+    queryset), or of all transactions. Returns the number of rows inserted
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        if activities is None:
+            cursor.execute('DELETE FROM iati_transactionfact')
+            cursor.execute(get_refresh_sql())
+        else:
+            sql, params = activities.order_by().values(
+                'id').query.sql_with_params()
+
+            cursor.execute(
+                'DELETE FROM iati_transactionfact '
+                'WHERE activity_id IN ({})'.format(sql), params)
+            cursor.execute(
+                get_refresh_sql('WHERE t.activity_id IN ({})'.format(sql)),
+                params)
+
+        row_count = cursor.rowcount
+
+    logger.info("Refreshed %s transaction fact rows", row_count)
+
+    return row_count
+
+
+def refresh_dataset_transaction_facts(dataset):
+    return refresh_transaction_facts(
+        Activity.objects.filter(dataset=dataset))
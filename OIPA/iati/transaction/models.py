@@ -42,6 +42,8 @@ class Transaction(models.Model):
         max_digits=20, decimal_places=7, default=Decimal(0))
     cad_value = models.DecimalField(
         max_digits=20, decimal_places=7, default=Decimal(0))
+    # MonthlyAverage.version of the rates the values were converted with:
+    rates_version = models.IntegerField(default=0)
 
     disbursement_channel = models.ForeignKey(
         DisbursementChannel,
@@ -336,3 +338,63 @@ class TransactionRecipientRegion(models.Model):
 
     def get_publisher(self):
         return self.transaction.activity.publisher
+
+
+class TransactionFact(models.Model):
+    """
+    One row per (sector, recipient country, recipient region) split of a
+    Transaction, used by TransactionAggregation instead of joining the
+    split tables on every request (see iati/transaction/facts.py).
+
+    The values are the transaction's values divided by its number of rows,
+    so summing them over all rows of a transaction gives its value. A
+    weight is the split's percentage / 100 times the number of splits of
+    its kind; multiplying by the weights of the splits that are grouped by
+    or filtered on gives the same percentage weighted sums as
+    annotate_currency().
+    """
+    transaction = models.ForeignKey(
+        Transaction,
+        related_name='facts',
+        on_delete=models.CASCADE)
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE)
+
+    transaction_type = models.ForeignKey(
+        TransactionType, on_delete=models.CASCADE)
+    transaction_date = models.DateField(db_index=True)
+
+    sector = models.ForeignKey(
+        Sector, null=True, on_delete=models.CASCADE)
+    recipient_country = models.ForeignKey(
+        Country, null=True, on_delete=models.CASCADE)
+    recipient_region = models.ForeignKey(
+        Region, null=True, on_delete=models.CASCADE)
+
+    sector_weight = models.DecimalField(
+        max_digits=20, decimal_places=10, null=True)
+    recipient_country_weight = models.DecimalField(
+        max_digits=20, decimal_places=10, null=True)
+    recipient_region_weight = models.DecimalField(
+        max_digits=20, decimal_places=10, null=True)
+
+    value = models.DecimalField(
+        max_digits=20, decimal_places=7, default=Decimal(0))
+    xdr_value = models.DecimalField(
+        max_digits=20, decimal_places=7, default=Decimal(0))
+    usd_value = models.DecimalField(
+        max_digits=20, decimal_places=7, default=Decimal(0))
+    eur_value = models.DecimalField(
+        max_digits=20, decimal_places=7, default=Decimal(0))
+    gbp_value = models.DecimalField(
+        max_digits=20, decimal_places=7, default=Decimal(0))
+    jpy_value = models.DecimalField(
+        max_digits=20, decimal_places=7, default=Decimal(0))
+    cad_value = models.DecimalField(
+        max_digits=20, decimal_places=7, default=Decimal(0))
+
+    def __unicode__(self, ):
+        return "%s - %s - %s - %s" % (
+            self.transaction_id,
+            self.sector_id,
+            self.recipient_country_id,
+            self.recipient_region_id,)
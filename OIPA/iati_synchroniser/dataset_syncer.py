@@ -3,20 +3,43 @@ import errno
 import json
 import logging
 import os
+import shutil
 import ssl
 import urllib
+from urllib.parse import quote
 
+import django_rq
+from dateutil import parser as date_parser
 from django.conf import settings
 
+from common.util import bulk_upsert
+from iati.file_cache import CachedFile
+from iati.filegrabber import FileGrabber
 from iati_organisation.models import Organisation
+from iati_synchroniser import fetch_engine
 from iati_synchroniser.create_publisher_organisation import (
     create_publisher_organisation
 )
-from iati_synchroniser.models import Dataset, Publisher, filetype_choices
-from task_queue.tasks import DatasetValidationTask
+from iati_synchroniser.models import (
+    Dataset, Publisher, RegistrySync, filetype_choices
+)
+from solr.dataset.tasks import DatasetTaskIndexing
+from solr.indexing_buffer import index_instances
+from solr.publisher.tasks import PublisherTaskIndexing
+from task_queue.tasks import DatasetValidationTask, parse_source_by_id
 
 DATASET_URL = 'https://iatiregistry.org/api/action/package_search?rows=200&{options}'  # NOQA: E501
 PUBLISHER_URL = 'https://iatiregistry.org/api/action/organization_list?all_fields=true&include_extras=true&limit=200&{options}'  # NOQA: E501
+DELTA_DATASET_URL = 'https://iatiregistry.org/api/action/package_search?rows=200&sort=metadata_modified+asc&{options}'  # NOQA: E501
+PUBLISHER_SHOW_URL = 'https://iatiregistry.org/api/action/organization_show?include_extras=true&include_datasets=false&id={id}'  # NOQA: E501
+PAGE_SIZE = 200
+
+# The Dataset fields a delta sync sets from the registry:
+SYNCED_DATASET_FIELDS = [
+    'name', 'title', 'filetype', 'publisher', 'source_url', 'iati_version',
+    'last_found_in_registry', 'added_manually', 'date_created',
+    'date_updated', 'internal_url',
+]
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
@@ -25,6 +48,11 @@ logger = logging.getLogger(__name__)
 class DatasetSyncer(object):
     is_download_datasets = False
 
+    # With a concurrent sync: the (url, path) of the datasets to download and
+    # the ids of the datasets to validate after downloading them
+    pending_downloads = None
+    pending_validations = None
+
     def get_data(self, url):
         req = urllib.request.Request(url)
         response = urllib.request.urlopen(req).read()
@@ -37,14 +65,33 @@ class DatasetSyncer(object):
                 if item.get("key") and item["key"] == key), None
         )
 
-    def synchronize_with_iati_api(self, is_download_datasets=False):
+    def synchronize_with_iati_api(self, is_download_datasets=False,
+                                  concurrent=None, delta=None):
         """
         First update all publishers.
         Then all datasets.
+
+        With {concurrent} (default settings.IATI_REGISTRY_CONCURRENT_SYNC)
+        the registry pages and the datasets are fetched concurrently. With
+        {delta} (default settings.IATI_REGISTRY_DELTA_SYNC) only the
+        datasets modified since the last delta sync are updated, see
+        synchronize_delta()
         """
 
         self.is_download_datasets = is_download_datasets
 
+        if concurrent is None:
+            concurrent = settings.IATI_REGISTRY_CONCURRENT_SYNC
+
+        if delta is None:
+            delta = settings.IATI_REGISTRY_DELTA_SYNC
+
+        if delta:
+            return self.synchronize_delta(concurrent=concurrent)
+
+        if concurrent:
+            return self.synchronize_concurrently()
+
         # parse publishers
         offset = 0
 
@@ -85,6 +132,313 @@ class DatasetSyncer(object):
         # remove deprecated publishers / datasets
         # self.remove_deprecated()
 
+    def get_fetch_engine(self, verify=True):
+        return fetch_engine.FetchEngine(
+            max_connections=settings.IATI_REGISTRY_SYNC_CONNECTIONS,
+            max_per_host=settings.IATI_REGISTRY_SYNC_CONNECTIONS_PER_HOST,
+            timeout=settings.IATI_REGISTRY_SYNC_TIMEOUT,
+            verify=verify,
+        )
+
+    def synchronize_concurrently(self):
+        """
+        synchronize_with_iati_api() with the registry pages fetched a few at
+        a time, and all datasets downloaded at the end, concurrently
+        """
+        self.pending_downloads = []
+        self.pending_validations = []
+
+        engine = self.get_fetch_engine()
+
+        try:
+            for publisher in engine.get_pages(
+                lambda offset: PUBLISHER_URL.format(
+                    options='offset={}'.format(offset)),
+                PAGE_SIZE,
+                lambda page: page['result'],
+            ):
+                self.update_or_create_publisher(publisher)
+
+            for dataset in engine.get_pages(
+                lambda offset: DATASET_URL.format(
+                    options='start={}'.format(offset)),
+                PAGE_SIZE,
+                lambda page: page['result']['results'],
+            ):
+                self.update_or_create_dataset(dataset)
+        finally:
+            engine.close()
+
+        self.finish_pending()
+
+    def finish_pending(self):
+        """
+        Downloads the pending datasets and then validates them
+        """
+        self.download_pending_datasets()
+
+        for dataset_id in self.pending_validations:
+            DatasetValidationTask.delay(dataset_id=dataset_id)
+
+        self.pending_downloads = None
+        self.pending_validations = None
+
+    def download_pending_datasets(self):
+        if not self.pending_downloads:
+            return
+
+        # do not verify SSL (for downloading dataset):
+        engine = self.get_fetch_engine(verify=False)
+
+        try:
+            results = engine.download(self.pending_downloads)
+        finally:
+            engine.close()
+
+        for result in results:
+            if isinstance(result, Exception):
+                logger.info("Could not download dataset: %s", result)
+
+    def get_last_metadata_modified(self):
+        last_sync = RegistrySync.objects.filter(
+            finished__isnull=False,
+            metadata_modified__isnull=False,
+        ).first()
+
+        return last_sync.metadata_modified if last_sync else None
+
+    def get_modified_packages(self, since):
+        """
+        Yields the registry packages modified since {since} (all packages
+        when None) a page at a time, oldest first. Every page is asked from
+        the metadata_modified (in whole seconds) of the previous page on, so
+        packages which are modified during the sync (and move to the end)
+        aren't skipped. When a full page doesn't get past that second, the
+        next page is asked with an offset within it
+        """
+        seen = set()
+        start = 0
+
+        if since is not None:
+            since = since.replace(microsecond=0)
+
+        while True:
+            options = 'start={}'.format(start)
+
+            if since is not None:
+                options += '&fq=' + quote(
+                    'metadata_modified:[{} TO *]'.format(
+                        since.strftime('%Y-%m-%dT%H:%M:%SZ')))
+
+            results = self.get_data(
+                DELTA_DATASET_URL.format(options=options)
+            )['result']['results']
+
+            packages = [
+                package for package in results if package['id'] not in seen
+            ]
+
+            if packages:
+                seen.update(package['id'] for package in packages)
+
+                yield packages
+
+            if len(results) < PAGE_SIZE:
+                return
+
+            page_since = max(
+                date_parser.parse(package['metadata_modified'])
+                for package in results
+            ).replace(microsecond=0)
+
+            if since is not None and page_since <= since:
+                # (a full page of packages modified in the same second)
+                start += len(results)
+            else:
+                since = page_since
+                start = 0
+
+    def synchronize_delta(self, concurrent=False):
+        """
+        Updates the publishers and datasets of the registry packages modified
+        since the last delta sync, with one INSERT ... ON CONFLICT per model
+        and page, and queues a parse of the datasets which are new or of
+        which the URL or the file hash changed. Returns the RegistrySync
+        """
+        since = self.get_last_metadata_modified()
+        sync = RegistrySync.objects.create(metadata_modified=since)
+        fetched_publishers = set()
+
+        if concurrent:
+            self.pending_downloads = []
+            self.pending_validations = []
+
+        # do not verify SSL (for downloading dataset):
+        ssl._create_default_https_context = ssl._create_unverified_context
+
+        for packages in self.get_modified_packages(since):
+            sync.publisher_count += self.upsert_publishers(
+                packages, fetched_publishers)
+
+            dataset_count, queued_count = self.upsert_datasets(packages)
+            sync.dataset_count += dataset_count
+            sync.queued_count += queued_count
+
+            sync.metadata_modified = max(
+                date_parser.parse(package['metadata_modified'])
+                for package in packages)
+
+        if concurrent:
+            self.finish_pending()
+
+        sync.finished = datetime.datetime.now()
+        sync.save()
+
+        logger.info(
+            "Registry delta sync: %d publishers, %d datasets, %d parses "
+            "queued", sync.publisher_count, sync.dataset_count,
+            sync.queued_count)
+
+        return sync
+
+    def upsert_publishers(self, packages, fetched_publishers):
+        """
+        Updates or creates the publishers of {packages} which aren't in
+        {fetched_publishers} yet. Returns the number of publishers
+        """
+        publisher_ids = sorted({
+            package['organization']['id'] for package in packages
+            if self.is_syncable_dataset(package)
+        } - fetched_publishers)
+
+        if not publisher_ids:
+            return 0
+
+        publishers = [
+            self.get_data(PUBLISHER_SHOW_URL.format(id=publisher_id))[
+                'result']
+            for publisher_id in publisher_ids
+        ]
+
+        bulk_upsert(
+            Publisher,
+            [
+                Publisher(
+                    iati_id=publisher['id'],
+                    **self.get_publisher_fields(publisher))
+                for publisher in publishers
+            ],
+            ['iati_id'],
+            update_fields=[
+                'publisher_iati_id', 'name', 'display_name', 'package_count'
+            ],
+        )
+
+        objs = {
+            obj.iati_id: obj
+            for obj in Publisher.objects.filter(iati_id__in=publisher_ids)
+        }
+
+        for publisher in publishers:
+            self.create_publisher_organisation(
+                objs[publisher['id']], publisher)
+
+        # bulk_upsert doesn't send the post_save signals which index them:
+        index_instances(PublisherTaskIndexing, objs.values())
+
+        fetched_publishers.update(publisher_ids)
+
+        return len(publishers)
+
+    def is_changed_dataset(self, dataset, source_url, sha1):
+        """
+        Whether the file of registry package {dataset} changed, compared to
+        the {source_url} and {sha1} of the Dataset
+        """
+        resource = dataset['resources'][0]
+
+        if resource['url'] != source_url:
+            return True
+
+        # the registry's sha1 of the file:
+        registry_hash = resource.get('hash')
+
+        return bool(registry_hash) and registry_hash != sha1
+
+    def upsert_datasets(self, packages):
+        """
+        Updates or creates (and downloads) the datasets of {packages} and
+        queues a parse of the changed ones. Returns the number of datasets
+        and the number of queued parses
+        """
+        packages = [
+            package for package in packages
+            if self.is_syncable_dataset(package)
+        ]
+
+        if not packages:
+            return 0, 0
+
+        iati_ids = [package['id'] for package in packages]
+
+        existing = {
+            iati_id: (source_url, sha1)
+            for iati_id, source_url, sha1 in Dataset.objects.filter(
+                iati_id__in=iati_ids
+            ).values_list('iati_id', 'source_url', 'sha1')
+        }
+
+        publishers = {
+            publisher.iati_id: publisher
+            for publisher in Publisher.objects.filter(iati_id__in={
+                package['organization']['id'] for package in packages
+            })
+        }
+
+        datasets = []
+        changed_iati_ids = []
+
+        for package in packages:
+            dataset = Dataset(
+                iati_id=package['id'],
+                **self.get_dataset_fields(
+                    package, publishers[package['organization']['id']]))
+
+            # this also returns internal URL for the Dataset:
+            dataset.internal_url = self.download_dataset(package) or ''
+            datasets.append(dataset)
+
+            if package['id'] not in existing or self.is_changed_dataset(
+                    package, *existing[package['id']]):
+                changed_iati_ids.append(package['id'])
+
+        bulk_upsert(
+            Dataset, datasets, ['iati_id'],
+            update_fields=SYNCED_DATASET_FIELDS)
+
+        # bulk_upsert doesn't send the post_save signals which index them:
+        index_instances(
+            DatasetTaskIndexing, Dataset.objects.filter(iati_id__in=iati_ids))
+
+        dataset_ids = dict(Dataset.objects.filter(
+            iati_id__in=iati_ids
+        ).values_list('iati_id', 'id'))
+
+        for iati_id in iati_ids:
+            if self.pending_validations is not None:
+                self.pending_validations.append(dataset_ids[iati_id])
+            else:
+                DatasetValidationTask.delay(dataset_id=dataset_ids[iati_id])
+
+        queue = django_rq.get_queue("parser")
+
+        for iati_id in changed_iati_ids:
+            queue.enqueue(
+                parse_source_by_id, args=(dataset_ids[iati_id],),
+                timeout=14400)
+
+        return len(datasets), len(changed_iati_ids)
+
     def get_iati_version(self, dataset_data):
 
         iati_version = self.get_val_in_list_of_dicts(
@@ -96,25 +450,36 @@ class DatasetSyncer(object):
 
         return iati_version
 
-    def update_or_create_publisher(self, publisher):
+    def get_publisher_fields(self, publisher):
         """
-
+        Returns the Publisher fields of registry organisation {publisher}
         """
         if publisher['package_count'] == 0:
             package_count = None
         else:
             package_count = publisher['package_count']
 
+        return {
+            'publisher_iati_id': publisher['publisher_iati_id'],
+            'name': publisher['name'],
+            'display_name': publisher['title'],
+            'package_count': package_count,
+        }
+
+    def update_or_create_publisher(self, publisher):
+        """
+
+        """
         obj, created = Publisher.objects.update_or_create(
             iati_id=publisher['id'],
-            defaults={
-                'publisher_iati_id': publisher['publisher_iati_id'],
-                'name': publisher['name'],
-                'display_name': publisher['title'],
-                'package_count': package_count,
-            }
+            defaults=self.get_publisher_fields(publisher)
         )
 
+        self.create_publisher_organisation(obj, publisher)
+
+        return obj
+
+    def create_publisher_organisation(self, obj, publisher):
         if not Organisation.objects.filter(
                 organisation_identifier=publisher[
                     'publisher_iati_id'
@@ -124,8 +489,6 @@ class DatasetSyncer(object):
                 publisher['publisher_organization_type']
             )
 
-        return obj
-
     def get_dataset_filetype(self, dataset_data):
         filetype_name = self.get_val_in_list_of_dicts(
             'filetype', dataset_data['extras'])
@@ -137,6 +500,27 @@ class DatasetSyncer(object):
 
         return filetype
 
+    def is_syncable_dataset(self, dataset):
+        # trololo edge cases
+        return bool(len(dataset['resources']) and dataset['organization'])
+
+    def get_dataset_fields(self, dataset, publisher):
+        """
+        Returns the Dataset fields of registry package {dataset}
+        """
+        return {
+            'name': dataset['name'],
+            'title': dataset['title'][0:254],
+            'filetype': self.get_dataset_filetype(dataset),
+            'publisher': publisher,
+            'source_url': dataset['resources'][0]['url'],
+            'iati_version': self.get_iati_version(dataset),
+            'last_found_in_registry': datetime.datetime.now(),
+            'added_manually': False,
+            'date_created': dataset['metadata_created'],
+            'date_updated': dataset['metadata_modified']
+        }
+
     def update_or_create_dataset(self, dataset):
         """
         Updates or creates a Dataset AND downloads it locally. Returns internal
@@ -144,12 +528,7 @@ class DatasetSyncer(object):
 
         """
 
-        filetype = self.get_dataset_filetype(dataset)
-
-        iati_version = self.get_iati_version(dataset)
-
-        # trololo edge cases
-        if not len(dataset['resources']) or not dataset['organization']:
+        if not self.is_syncable_dataset(dataset):
             return
 
         publisher = Publisher.objects.get(
@@ -157,18 +536,7 @@ class DatasetSyncer(object):
 
         obj, created = Dataset.objects.update_or_create(
             iati_id=dataset['id'],
-            defaults={
-                'name': dataset['name'],
-                'title': dataset['title'][0:254],
-                'filetype': filetype,
-                'publisher': publisher,
-                'source_url': dataset['resources'][0]['url'],
-                'iati_version': iati_version,
-                'last_found_in_registry': datetime.datetime.now(),
-                'added_manually': False,
-                'date_created': dataset['metadata_created'],
-                'date_updated': dataset['metadata_modified']
-            }
+            defaults=self.get_dataset_fields(dataset, publisher)
         )
 
         # this also returns internal URL for the Dataset:
@@ -177,7 +545,11 @@ class DatasetSyncer(object):
 
         # Validation dataset with the current. we don't do validation for
         # the moment
-        DatasetValidationTask.delay(dataset_id=obj.id)
+        if self.pending_validations is not None:
+            # (after the dataset is downloaded)
+            self.pending_validations.append(obj.id)
+        else:
+            DatasetValidationTask.delay(dataset_id=obj.id)
 
     def download_dataset(self, dataset_data):
         """Based on dataset URL, downloads and saves it in the server
@@ -257,6 +629,18 @@ class DatasetSyncer(object):
                 filename
             )
 
+            if settings.IATI_FILE_CACHE:
+                self.copy_from_file_cache(
+                    dataset_url, download_dir_with_filename)
+
+                return os.path.join(main_download_dir, filename)
+
+            if self.pending_downloads is not None:
+                self.pending_downloads.append(
+                    (dataset_url, download_dir_with_filename))
+
+                return os.path.join(main_download_dir, filename)
+
             try:
                 urllib.request.urlretrieve(
                     dataset_url,
@@ -272,6 +656,21 @@ class DatasetSyncer(object):
             # URL string to save as a Dataset attribute:
             return os.path.join(main_download_dir, filename)
 
+    def copy_from_file_cache(self, dataset_url, path):
+        """Fetches the dataset through the file cache (a conditional GET)
+        and copies it to {path}, unless it didn't change since it was
+        copied there
+        """
+        response = FileGrabber().get_dataset_file(dataset_url)
+
+        if not isinstance(response, CachedFile):
+            return
+
+        if response.not_modified and os.path.exists(path):
+            return
+
+        shutil.copyfile(response.path, path)
+
     def remove_deprecated(self):
         """
         remove old publishers and datasets that used an id between 1-5000
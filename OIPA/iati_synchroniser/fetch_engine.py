@@ -0,0 +1,246 @@
+"""Fetches registry pages and dataset files concurrently.
+
+The requests are scheduled on an asyncio event loop and run in a pool of
+threads (the HTTP client, requests, blocks), bounded by:
+
+- max_connections: requests running at the same time (the size of the thread
+  pool),
+- max_per_host: requests running at the same time per host, so one slow
+  publisher server doesn't take the whole pool, and no server gets more
+  than a few requests at once.
+
+requests.Session isn't thread-safe, so every thread of the pool uses a
+session of its own, which keeps its connections open for the next requests
+of the thread. The sessions are closed at the end of the run.
+
+Failed requests (connection errors, timeouts and 5xx/429 responses) are
+retried with an exponential backoff. Files are streamed to a temporary file
+next to their destination and moved into place when complete, so a failed
+or interrupted download never leaves a partial file behind.
+
+Used by DatasetSyncer.synchronize_with_iati_api() with
+settings.IATI_REGISTRY_CONCURRENT_SYNC.
+"""
+import asyncio
+import functools
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Size of the chunks in which downloaded files are written to disk:
+CHUNK_SIZE = 1024 * 1024
+
+# Status codes for which a request is retried:
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class FetchError(Exception):
+    """A request which failed after all retries"""
+
+    def __init__(self, url, reason):
+        super(FetchError, self).__init__('{}: {}'.format(url, reason))
+        self.url = url
+        self.reason = reason
+
+
+class RetryableResponse(Exception):
+    """A response with one of RETRY_STATUS_CODES"""
+
+
+class FetchEngine(object):
+
+    def __init__(self, max_connections=20, max_per_host=4, timeout=60,
+                 retries=3, backoff=1.0, verify=True):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.verify = verify
+
+        # sessions of the threads of the pool:
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+
+        # created per run, on the loop of the run:
+        self._semaphore = None
+        self._host_semaphores = None
+        self._executor = None
+
+    def close(self):
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, []
+
+        for session in sessions:
+            session.close()
+
+    def _session(self):
+        """
+        Returns the session of the current thread, created on first use
+        """
+        session = getattr(self._local, 'session', None)
+
+        if session is None:
+            session = requests.Session()
+            # a thread runs one request at a time:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=self.max_connections, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+
+            with self._sessions_lock:
+                self._sessions.append(session)
+
+        return session
+
+    def _run(self, coroutine_function, *args):
+        loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_connections)
+
+        try:
+            return loop.run_until_complete(coroutine_function(*args))
+        finally:
+            self._executor.shutdown(wait=True)
+            loop.close()
+            # the threads of the pool are gone:
+            self.close()
+
+    def _host_semaphore(self, url):
+        host = urlparse(url).netloc
+
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(
+                self.max_per_host)
+
+        return self._host_semaphores[host]
+
+    async def _gather(self, coroutines):
+        self._semaphore = asyncio.Semaphore(self.max_connections)
+        self._host_semaphores = {}
+
+        return await asyncio.gather(*coroutines, return_exceptions=True)
+
+    async def _request(self, url, function):
+        """
+        Runs function({url}) in the thread pool within the connection limits,
+        retrying it on failure. Raises a FetchError when all tries failed
+        """
+        loop = asyncio.get_event_loop()
+        host_semaphore = self._host_semaphore(url)
+        attempt = 0
+
+        while True:
+            try:
+                async with host_semaphore, self._semaphore:
+                    return await loop.run_in_executor(
+                        self._executor, function, url)
+
+            except (requests.RequestException, RetryableResponse) as e:
+                if attempt >= self.retries:
+                    raise FetchError(url, e)
+
+                logger.info("Retrying %s after %s", url, e)
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+
+    def _get(self, url, stream=False):
+        response = self._session().get(
+            url, timeout=self.timeout, stream=stream, verify=self.verify)
+
+        if response.status_code in RETRY_STATUS_CODES:
+            response.close()
+            raise RetryableResponse(
+                'status code {}'.format(response.status_code))
+
+        return response
+
+    def _get_json(self, url):
+        response = self._get(url)
+
+        if response.status_code != 200:
+            raise FetchError(
+                url, 'status code {}'.format(response.status_code))
+
+        return response.json()
+
+    def _download(self, url, path):
+        response = self._get(url, stream=True)
+
+        try:
+            if response.status_code != 200:
+                raise FetchError(
+                    url, 'status code {}'.format(response.status_code))
+
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory)
+
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in response.iter_content(
+                            chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        finally:
+            response.close()
+
+        return path
+
+    def get_json(self, urls):
+        """
+        Fetches the JSON documents at {urls}. Returns them in the order of
+        {urls}, with a FetchError for every URL which failed
+        """
+        return self._run(self._gather, [
+            self._request(url, self._get_json) for url in urls
+        ])
+
+    def download(self, files):
+        """
+        Downloads {files}, a list of (url, path). Returns the path, or a
+        FetchError, per file in the order of {files}
+        """
+        return self._run(self._gather, [
+            self._request(url, functools.partial(self._download, path=path))
+            for url, path in files
+        ])
+
+    def get_pages(self, page_url, page_size, get_items, window=5):
+        """
+        Yields the items of all pages of a paginated registry listing.
+        {page_url} returns the URL of the page at an offset, {get_items} the
+        items of a page. {window} pages are fetched at a time, until a page
+        isn't full. Raises the FetchError of a failed page
+        """
+        offset = 0
+
+        while True:
+            urls = [
+                page_url(offset + page_size * i) for i in range(window)
+            ]
+            offset += page_size * window
+
+            for page in self.get_json(urls):
+                if isinstance(page, Exception):
+                    raise page
+
+                items = get_items(page)
+                yield from items
+
+                if len(items) < page_size:
+                    return
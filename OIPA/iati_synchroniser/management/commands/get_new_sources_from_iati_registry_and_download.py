@@ -5,7 +5,18 @@ from iati_synchroniser.dataset_syncer import DatasetSyncer
 
 class Command(BaseCommand):
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--delta',
+            action='store_true',
+            dest='delta',
+            default=None,
+            help='Only sync the datasets modified since the last delta sync '
+                 '(default: IATI_REGISTRY_DELTA_SYNC)',
+        )
+
     def handle(self, *args, **options):
 
         ds = DatasetSyncer()
-        ds.synchronize_with_iati_api(is_download_datasets=True)
+        ds.synchronize_with_iati_api(
+            is_download_datasets=True, delta=options['delta'])
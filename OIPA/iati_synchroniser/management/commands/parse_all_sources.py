@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from iati_synchroniser.parse_orchestrator import ParseOrchestrator
+
+
+class Command(BaseCommand):
+    """
+    Parse all datasets over a pool of processes, largest datasets first and
+    never two datasets of one publisher at the same time
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            dest='workers',
+            default=None,
+            help='Number of processes (default: PARSER_POOL_WORKERS)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            dest='force',
+            default=False,
+            help='Force parse the sources (dont look at \
+                 last-updated-datetimes)',
+        )
+        parser.add_argument(
+            '--check-validation',
+            action='store_true',
+            dest='check_validation',
+            default=False,
+            help='Skip datasets with critical validation errors',
+        )
+
+    def handle(self, *args, **options):
+        parse_run = ParseOrchestrator(
+            workers=options['workers'],
+            force_reparse=options['force'],
+            check_validation=options['check_validation'],
+        ).run()
+
+        for status, count in parse_run.datasets.order_by(
+                'status').values_list('status').annotate(count=Count('id')):
+            self.stdout.write('{}: {}'.format(status, count))
+
+        for result in parse_run.datasets.all()[:10]:
+            self.stdout.write('{} ({}): {:.1f}s, {} parsed, {} skipped'.format(
+                result.dataset_name,
+                result.publisher_iati_id,
+                result.wall_time,
+                result.activities_parsed,
+                result.activities_skipped))
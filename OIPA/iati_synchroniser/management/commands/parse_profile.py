@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from iati.parser.profiling import (
+    HANDLER, PHASE, POST_SAVE, POST_SAVE_VALIDATOR, report
+)
+from iati_synchroniser.models import Dataset, DatasetParseProfile
+
+
+class Command(BaseCommand):
+    """
+    Show the time, calls and queries per element handler, post-save step and
+    phase of the last profiled parse of a dataset, or parse it with
+    profiling first (--parse)
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset_id', nargs=1, type=int)
+
+        parser.add_argument(
+            '--parse',
+            action='store_true',
+            dest='parse',
+            default=False,
+            help='Parse the dataset with profiling first',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            dest='force',
+            default=False,
+            help='Force parse the dataset (with --parse)',
+        )
+        parser.add_argument(
+            '--kind',
+            dest='kind',
+            default=None,
+            choices=[HANDLER, POST_SAVE, POST_SAVE_VALIDATOR, PHASE],
+            help='Only show this kind of functions',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            dest='limit',
+            default=30,
+            help='Number of functions to show, slowest first',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            dataset = Dataset.objects.get(pk=options['dataset_id'][0])
+        except Dataset.DoesNotExist:
+            raise CommandError('Dataset {} does not exist'.format(
+                options['dataset_id'][0]))
+
+        if options['parse']:
+            dataset.process(force_reparse=options['force'], profiling=True)
+
+        profile = DatasetParseProfile.objects.filter(dataset=dataset).first()
+
+        if profile is None:
+            raise CommandError(
+                'No profiled parse of dataset {} (use --parse, or set '
+                'IATI_PARSER_PROFILING)'.format(dataset.pk))
+
+        stats = profile.stats
+        if options['kind']:
+            stats = [stat for stat in stats if stat['kind'] == options['kind']]
+
+        self.stdout.write(
+            '{}: parsed {}, {} activities parsed, {} skipped, {} queries in '
+            '{:.3f}s'.format(
+                dataset.name,
+                profile.started,
+                profile.activities_parsed,
+                profile.activities_skipped,
+                profile.query_count,
+                profile.wall_time))
+        self.stdout.write(report(stats, options['limit']))
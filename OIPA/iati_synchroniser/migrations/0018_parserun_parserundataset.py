@@ -0,0 +1,49 @@
+# Generated by Django 2.0.13 on 2026-10-18 12:00
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iati_synchroniser', '0017_auto_20200317_1516'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParseRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started', models.DateTimeField(default=datetime.datetime.now)),
+                ('finished', models.DateTimeField(default=None, null=True)),
+                ('workers', models.IntegerField(default=1)),
+                ('force_reparse', models.BooleanField(default=False)),
+                ('dataset_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-started'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ParseRunDataset',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dataset_name', models.CharField(default='', max_length=255)),
+                ('publisher_iati_id', models.CharField(default='', max_length=100)),
+                ('status', models.CharField(choices=[('parsed', 'Parsed'), ('unchanged', 'Unchanged'), ('invalid', 'Invalid'), ('not_parsed', 'Not parsed'), ('failed', 'Failed')], default='parsed', max_length=20)),
+                ('error', models.TextField(blank=True, default=None, null=True)),
+                ('started', models.DateTimeField(default=None, null=True)),
+                ('wall_time', models.FloatField(default=0)),
+                ('activities_parsed', models.IntegerField(default=0)),
+                ('activities_skipped', models.IntegerField(default=0)),
+                ('dataset', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='iati_synchroniser.Dataset')),
+                ('parse_run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='datasets', to='iati_synchroniser.ParseRun')),
+            ],
+            options={
+                'ordering': ['-wall_time'],
+            },
+        ),
+    ]
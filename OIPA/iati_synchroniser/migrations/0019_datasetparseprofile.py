@@ -0,0 +1,33 @@
+# Generated by Django 2.0.13 on 2026-10-18 12:00
+
+import datetime
+
+import django.contrib.postgres.fields.jsonb
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iati_synchroniser', '0018_parserun_parserundataset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatasetParseProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started', models.DateTimeField(default=datetime.datetime.now)),
+                ('wall_time', models.FloatField(default=0)),
+                ('query_count', models.IntegerField(default=0)),
+                ('activities_parsed', models.IntegerField(default=0)),
+                ('activities_skipped', models.IntegerField(default=0)),
+                ('stats', django.contrib.postgres.fields.jsonb.JSONField(default=list)),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parse_profiles', to='iati_synchroniser.Dataset')),
+            ],
+            options={
+                'ordering': ['-started'],
+            },
+        ),
+    ]
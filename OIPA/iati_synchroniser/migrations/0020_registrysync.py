@@ -0,0 +1,30 @@
+# Generated by Django 2.0.13 on 2026-10-18 12:00
+
+import datetime
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iati_synchroniser', '0019_datasetparseprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrySync',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started', models.DateTimeField(default=datetime.datetime.now)),
+                ('finished', models.DateTimeField(default=None, null=True)),
+                ('metadata_modified', models.DateTimeField(default=None, null=True)),
+                ('publisher_count', models.IntegerField(default=0)),
+                ('dataset_count', models.IntegerField(default=0)),
+                ('queued_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-started'],
+            },
+        ),
+    ]
@@ -87,15 +87,20 @@ class Dataset(models.Model):
     def __unicode__(self):
         return self.name
 
-    def process(self, force_reparse=False):
+    def process(self, force_reparse=False, profiling=None):
         """if not self.iati_version:
-            self.update_activities_count()"""
+            self.update_activities_count()
+
+        Returns the ParseManager used, or None when the dataset's version
+        isn't parsed. With profiling=True (defaults to
+        settings.IATI_PARSER_PROFILING) a DatasetParseProfile is stored"""
 
         if self.iati_version in ['2.01', '2.02', '2.03']:
             from iati.parser.parse_manager import ParseManager
             start_datetime = datetime.datetime.now()
 
-            parser = ParseManager(self, force_reparse=force_reparse)
+            parser = ParseManager(
+                self, force_reparse=force_reparse, profiling=profiling)
             parser.parse_all()
             self.is_parsed = True
 
@@ -115,12 +120,15 @@ class Dataset(models.Model):
 
             self.save(process=False)
 
+            return parser
+
     def process_activity(self, activity_id):
         """
         process a single activity
         """
         from iati.parser.parse_manager import ParseManager
-        parser = ParseManager(self)
+        # (parse_activity() needs the file, also when it didn't change)
+        parser = ParseManager(self, force_reparse=True)
         parser.parse_activity(activity_id)
 
     def get_internal_url(self):
@@ -147,7 +155,7 @@ class Dataset(models.Model):
         try:
             # Activity count in the XML
             file_grabber = FileGrabber()
-            response = file_grabber.get_the_file(self.source_url)
+            response = file_grabber.get_dataset_file(self.source_url)
 
             # Parse to XML tree
             tree = etree.fromstring(response.content)
@@ -195,6 +203,86 @@ class DatasetNote(models.Model):
         null=True, blank=True, auto_now=True)
 
 
+class ParseRun(models.Model):
+    """A run of the parse orchestrator over many datasets (see
+    iati_synchroniser/parse_orchestrator.py)"""
+    started = models.DateTimeField(default=datetime.datetime.now)
+    finished = models.DateTimeField(null=True, default=None)
+    workers = models.IntegerField(default=1)
+    force_reparse = models.BooleanField(default=False)
+    dataset_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-started']
+
+
+class RegistrySync(models.Model):
+    """A delta sync with the IATI Registry (see
+    DatasetSyncer.synchronize_delta()). The next delta sync asks the registry
+    for the packages modified since the metadata_modified of the last
+    finished one"""
+    started = models.DateTimeField(default=datetime.datetime.now)
+    finished = models.DateTimeField(null=True, default=None)
+    # the highest metadata_modified of the packages seen:
+    metadata_modified = models.DateTimeField(null=True, default=None)
+    publisher_count = models.IntegerField(default=0)
+    dataset_count = models.IntegerField(default=0)
+    queued_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-started']
+
+
+class DatasetParseProfile(models.Model):
+    """Time, calls and queries per element handler, post-save step and
+    phase of one parse of a dataset (see iati/parser/profiling.py)"""
+    dataset = models.ForeignKey(
+        Dataset, related_name='parse_profiles', on_delete=models.CASCADE)
+    started = models.DateTimeField(default=datetime.datetime.now)
+    # totals of the parse, wall time in seconds:
+    wall_time = models.FloatField(default=0)
+    query_count = models.IntegerField(default=0)
+    activities_parsed = models.IntegerField(default=0)
+    activities_skipped = models.IntegerField(default=0)
+    # list of {kind, name, calls, seconds, queries}, slowest first:
+    stats = JSONField(default=list)
+
+    class Meta:
+        ordering = ['-started']
+
+
+parse_run_status_choices = (
+    ('parsed', 'Parsed'),
+    ('unchanged', 'Unchanged'),
+    ('invalid', 'Invalid'),
+    ('not_parsed', 'Not parsed'),
+    ('failed', 'Failed'),
+)
+
+
+class ParseRunDataset(models.Model):
+    """Summary of parsing one dataset in a ParseRun"""
+    parse_run = models.ForeignKey(
+        ParseRun, related_name='datasets', on_delete=models.CASCADE)
+    dataset = models.ForeignKey(
+        Dataset, null=True, on_delete=models.SET_NULL)
+    dataset_name = models.CharField(max_length=255, default='')
+    publisher_iati_id = models.CharField(max_length=100, default='')
+
+    status = models.CharField(
+        max_length=20, choices=parse_run_status_choices, default='parsed')
+    error = models.TextField(null=True, blank=True, default=None)
+
+    started = models.DateTimeField(null=True, default=None)
+    # wall time of parsing this dataset, in seconds:
+    wall_time = models.FloatField(default=0)
+    activities_parsed = models.IntegerField(default=0)
+    activities_skipped = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-wall_time']
+
+
 class Codelist(models.Model):
     name = models.CharField(primary_key=True, max_length=100)
     description = models.TextField(max_length=1000, blank=True, null=True)
@@ -0,0 +1,292 @@
+"""Parses many datasets in a pool of processes.
+
+Datasets are handed out largest first, so a huge dataset doesn't start last
+and hold up the whole run, and never two datasets of the same publisher at
+the same time, so references between activities of a publisher's datasets
+stay consistent. Organisation files are parsed before activity files, like
+parse_all_existing_sources does.
+
+A dataset which takes longer than settings.PARSER_POOL_DATASET_TIMEOUT, or
+of which the pool process dies twice, is marked failed.
+
+Every run is stored as a ParseRun with a ParseRunDataset per dataset (wall
+time, activities parsed and skipped).
+"""
+import datetime
+import logging
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from timeit import default_timer
+
+from django import db
+from django.conf import settings
+
+from iati_synchroniser.models import Dataset, ParseRun, ParseRunDataset
+
+logger = logging.getLogger(__name__)
+
+
+def dataset_size(dataset):
+    return max(
+        dataset.activities_count_in_xml,
+        dataset.activities_count_in_database
+    )
+
+
+class ParseScheduler(object):
+    """Hands out datasets largest first, but never two datasets of the same
+    publisher at the same time
+    """
+
+    def __init__(self, datasets):
+        self.pending = sorted(datasets, key=dataset_size, reverse=True)
+        self.running_publishers = set()
+
+    def has_pending(self):
+        return bool(self.pending)
+
+    def next_dataset(self):
+        """Returns the largest pending dataset of which the publisher isn't
+        being parsed, or None
+        """
+        for i, dataset in enumerate(self.pending):
+            if dataset.publisher_id not in self.running_publishers:
+                self.running_publishers.add(dataset.publisher_id)
+                return self.pending.pop(i)
+
+        return None
+
+    def done(self, dataset):
+        self.running_publishers.discard(dataset.publisher_id)
+
+    def retry(self, dataset):
+        """Hands out {dataset} again, after its parse was stopped"""
+        self.pending.append(dataset)
+        self.pending.sort(key=dataset_size, reverse=True)
+
+
+def parse_dataset(dataset_id, force_reparse=False):
+    """Parses one dataset (in a pool process).
+
+    Returns a dict with the summary fields of a ParseRunDataset
+    """
+    result = {
+        'started': datetime.datetime.now(),
+        'status': 'not_parsed',
+        'error': None,
+        'activities_parsed': 0,
+        'activities_skipped': 0,
+    }
+    start = default_timer()
+
+    try:
+        dataset = Dataset.objects.get(pk=dataset_id)
+        parse_manager = dataset.process(force_reparse=force_reparse)
+
+        if parse_manager is None:
+            pass
+        elif not parse_manager.valid_dataset:
+            result['status'] = 'invalid'
+        elif not (force_reparse or parse_manager.hash_changed):
+            result['status'] = 'unchanged'
+        else:
+            result['status'] = 'parsed'
+            result['activities_parsed'] = \
+                parse_manager.parser.activities_parsed
+            result['activities_skipped'] = \
+                parse_manager.parser.activities_skipped
+
+    except Exception as e:
+        logger.exception(e)
+        result['status'] = 'failed'
+        result['error'] = str(e)
+
+    result['wall_time'] = default_timer() - start
+
+    return result
+
+
+class ParseOrchestrator(object):
+    # seconds between checks for timed out datasets:
+    poll_interval = 60
+
+    def __init__(self, workers=None, force_reparse=False,
+                 check_validation=False, timeout=None):
+        """
+        Keyword arguments:
+        workers -- number of processes (settings.PARSER_POOL_WORKERS)
+        force_reparse -- reparse datasets and activities which didn't change
+        check_validation -- only parse datasets without critical validation
+        errors, like parse_source_by_id_task
+        timeout -- seconds after which the parse of a dataset is stopped and
+        the dataset is marked failed (settings.PARSER_POOL_DATASET_TIMEOUT)
+        """
+        self.workers = workers or settings.PARSER_POOL_WORKERS
+        self.force_reparse = force_reparse
+        self.check_validation = check_validation
+        self.timeout = timeout or settings.PARSER_POOL_DATASET_TIMEOUT
+        self.executor = None
+
+    def get_datasets(self, filetype):
+        datasets = Dataset.objects.filter(filetype=filetype)
+
+        if self.check_validation:
+            datasets = datasets.filter(validation_status__critical__lte=0)
+
+        return list(datasets.select_related('publisher'))
+
+    def run(self):
+        parse_run = ParseRun.objects.create(
+            workers=self.workers,
+            force_reparse=self.force_reparse,
+        )
+
+        # first organisation files, then activity files:
+        phases = [self.get_datasets(2), self.get_datasets(1)]
+        parse_run.dataset_count = sum(len(phase) for phase in phases)
+        parse_run.save()
+
+        self.start_executor()
+
+        try:
+            for datasets in phases:
+                self.run_phase(parse_run, datasets)
+        finally:
+            self.stop_executor()
+
+        parse_run.finished = datetime.datetime.now()
+        parse_run.save()
+
+        return parse_run
+
+    def create_executor(self):
+        return ProcessPoolExecutor(self.workers)
+
+    def start_executor(self):
+        # pool processes are forked with a copy of this process, they
+        # should not share its database connections:
+        db.connections.close_all()
+        self.executor = self.create_executor()
+
+    def stop_executor(self):
+        """
+        Stops the pool processes, also the ones which are still parsing:
+        ProcessPoolExecutor can't cancel a running call, so they are
+        terminated
+        """
+        for process in list((self.executor._processes or {}).values()):
+            process.terminate()
+
+        self.executor.shutdown(wait=True)
+
+    def restart_executor(self):
+        self.stop_executor()
+        self.start_executor()
+
+    def run_phase(self, parse_run, datasets):
+        """
+        Parses {datasets}. A dataset which takes longer than the timeout is
+        marked failed, and when a pool process dies (e.g. killed when out
+        of memory) the datasets it may have been parsing are marked failed
+        when it happens a second time. Both stop the pool: the other
+        datasets which were running in it are parsed again in a new one
+        """
+        scheduler = ParseScheduler(datasets)
+        # future -> (dataset, start time)
+        running = {}
+        # ids of the datasets which were running when a pool process died:
+        retried = set()
+
+        while scheduler.has_pending() or running:
+            while len(running) < self.workers:
+                dataset = scheduler.next_dataset()
+                if dataset is None:
+                    break
+
+                future = self.executor.submit(
+                    parse_dataset, dataset.id, self.force_reparse)
+                running[future] = (dataset, default_timer())
+
+            finished, not_finished = futures.wait(
+                running,
+                timeout=self.poll_interval,
+                return_when=futures.FIRST_COMPLETED)
+
+            if any(isinstance(future.exception(), BrokenProcessPool)
+                   for future in finished):
+                logger.error("A pool process died, restarting the pool")
+                self.restart_executor()
+                # all calls in the stopped pool are finished now:
+                finished = list(running)
+
+            timed_out = [
+                future for future, (dataset, start) in running.items()
+                if future not in finished
+                and default_timer() - start > self.timeout
+            ]
+
+            for future in finished:
+                dataset, start = running.pop(future)
+                scheduler.done(dataset)
+
+                if isinstance(future.exception(), BrokenProcessPool):
+                    if dataset.id not in retried:
+                        retried.add(dataset.id)
+                        scheduler.retry(dataset)
+                        continue
+
+                    result = {
+                        'status': 'failed',
+                        'error': 'A pool process died while parsing it',
+                    }
+                elif future.exception() is not None:
+                    result = {
+                        'status': 'failed',
+                        'error': str(future.exception()),
+                    }
+                else:
+                    result = future.result()
+
+                self.save_result(parse_run, dataset, result)
+
+            if timed_out:
+                self.stop_timed_out(parse_run, scheduler, running, timed_out)
+
+    def stop_timed_out(self, parse_run, scheduler, running, timed_out):
+        """
+        Marks the datasets of {timed_out} failed and restarts the pool to
+        stop them. The other running datasets are handed out again
+        """
+        for future, (dataset, start) in running.items():
+            scheduler.done(dataset)
+
+            if future in timed_out:
+                logger.error(
+                    "Stopped parsing dataset %s after %d seconds",
+                    dataset.name, self.timeout)
+                self.save_result(parse_run, dataset, {
+                    'status': 'failed',
+                    'error': 'Timed out after {} seconds'.format(
+                        self.timeout),
+                    'wall_time': default_timer() - start,
+                })
+            else:
+                scheduler.retry(dataset)
+
+        running.clear()
+        self.restart_executor()
+
+    def save_result(self, parse_run, dataset, result):
+        ParseRunDataset.objects.create(
+            parse_run=parse_run,
+            dataset=dataset,
+            dataset_name=dataset.name,
+            publisher_iati_id=dataset.publisher.publisher_iati_id,
+            status=result['status'],
+            error=result.get('error'),
+            started=result.get('started'),
+            wall_time=result.get('wall_time', 0),
+            activities_parsed=result.get('activities_parsed', 0),
+            activities_skipped=result.get('activities_skipped', 0),
+        )
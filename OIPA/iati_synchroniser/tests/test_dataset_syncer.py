@@ -1,13 +1,18 @@
+import datetime
 import json
 import os
 import unittest
+from urllib.parse import quote
 
 from django.test import TestCase
-from mock import MagicMock
+from mock import MagicMock, patch
 
 from iati.factory import iati_factory
 from iati_synchroniser.dataset_syncer import DatasetSyncer
-from iati_synchroniser.models import Dataset, Publisher
+from iati_synchroniser.factory.synchroniser_factory import (
+    DatasetFactory, PublisherFactory
+)
+from iati_synchroniser.models import Dataset, Publisher, RegistrySync
 
 
 class DatasetSyncerTestCase(TestCase):
@@ -112,3 +117,169 @@ class DatasetSyncerTestCase(TestCase):
         self.assertEqual(
             "http://aidstream.org/files/xml/cic-sl.xml", dataset.source_url)
         self.assertEqual(1, dataset.filetype)
+
+
+def registry_package(iati_id, url, sha1, metadata_modified):
+    return {
+        'id': iati_id,
+        'name': iati_id,
+        'title': iati_id,
+        'resources': [{'url': url, 'hash': sha1}],
+        'organization': {'id': 'publisher-1'},
+        'extras': [
+            {'key': 'iati_version', 'value': '2.02'},
+            {'key': 'filetype', 'value': 'activity'},
+        ],
+        'metadata_created': '2019-01-01T00:00:00.000000',
+        'metadata_modified': metadata_modified,
+    }
+
+
+@patch('iati_synchroniser.dataset_syncer.DatasetValidationTask')
+@patch('iati_synchroniser.dataset_syncer.django_rq')
+class DatasetSyncerDeltaTestCase(TestCase):
+    """
+    Test DatasetSyncer.synchronize_delta()
+    """
+
+    def setUp(self):
+        iati_factory.OrganisationFactory.create(
+            organisation_identifier='NL-1')
+
+        publisher = PublisherFactory.create(
+            iati_id='publisher-1', publisher_iati_id='NL-1')
+        self.dataset = DatasetFactory.create(
+            iati_id='dataset-1',
+            publisher=publisher,
+            source_url='http://example.com/1.xml',
+            sha1='abc')
+
+        self.urls = []
+        self.pages = [[
+            registry_package('dataset-1', 'http://example.com/1.xml', 'abc',
+                             '2019-02-01T00:00:00.000000'),
+            registry_package('dataset-2', 'http://example.com/2.xml', 'def',
+                             '2019-03-01T12:00:00.000000'),
+        ]]
+
+        self.datasetSyncer = DatasetSyncer()
+        self.datasetSyncer.get_data = self.get_data
+
+    def get_data(self, url):
+        self.urls.append(url)
+
+        if 'organization_show' in url:
+            return {'result': {
+                'id': 'publisher-1',
+                'publisher_iati_id': 'NL-1',
+                'name': 'publisher-1',
+                'title': 'Publisher 1',
+                'package_count': 2,
+                'publisher_organization_type': '22',
+            }}
+
+        results = self.pages.pop(0) if self.pages else []
+        return {'result': {'results': results}}
+
+    def test_synchronize_delta(self, django_rq, validation_task):
+        sync = self.datasetSyncer.synchronize_delta()
+
+        self.assertEqual(Dataset.objects.count(), 2)
+        self.assertEqual(
+            Publisher.objects.get(iati_id='publisher-1').display_name,
+            'Publisher 1')
+
+        # the existing dataset is updated in place:
+        self.dataset.refresh_from_db()
+        self.assertEqual(self.dataset.sha1, 'abc')
+        self.assertFalse(self.dataset.added_manually)
+
+        # only the new dataset is parsed:
+        queue = django_rq.get_queue.return_value
+        self.assertEqual(queue.enqueue.call_count, 1)
+        self.assertEqual(
+            queue.enqueue.call_args[1]['args'],
+            (Dataset.objects.get(iati_id='dataset-2').id,))
+
+        self.assertEqual(
+            (sync.publisher_count, sync.dataset_count, sync.queued_count),
+            (1, 2, 1))
+        self.assertEqual(
+            sync.metadata_modified, datetime.datetime(2019, 3, 1, 12))
+
+    def test_upserted_rows_are_indexed(self, django_rq, validation_task):
+        """
+        The publishers and datasets written by bulk_upsert (without
+        post_save signals) are indexed
+        """
+        with patch(
+                'iati_synchroniser.dataset_syncer.index_instances') as index:
+            self.datasetSyncer.synchronize_delta()
+
+        indexed = {
+            call[0][0].__name__: sorted(
+                instance.iati_id for instance in call[0][1])
+            for call in index.call_args_list
+        }
+
+        self.assertEqual(indexed, {
+            'PublisherTaskIndexing': ['publisher-1'],
+            'DatasetTaskIndexing': ['dataset-1', 'dataset-2'],
+        })
+
+    def test_next_synchronize_delta(self, django_rq, validation_task):
+        RegistrySync.objects.create(
+            finished=datetime.datetime(2019, 3, 2),
+            metadata_modified=datetime.datetime(2019, 3, 1, 12))
+        self.pages = []
+
+        sync = self.datasetSyncer.synchronize_delta()
+
+        self.assertIn(
+            'start=0&fq=metadata_modified%3A%5B2019-03-01T12%3A00%3A00Z%20TO'
+            '%20%2A%5D',
+            self.urls[0])
+        self.assertEqual(sync.dataset_count, 0)
+        self.assertEqual(
+            sync.metadata_modified, datetime.datetime(2019, 3, 1, 12))
+
+    def test_full_page_in_one_second(self, django_rq, validation_task):
+        """
+        A full page of packages modified in the same second is paged through
+        with an offset
+        """
+        registry = [
+            registry_package(
+                'dataset-{}'.format(i), 'http://example.com/{}.xml'.format(i),
+                '', '2019-02-01T00:00:00.{:06d}'.format(i))
+            for i in range(1, 4)
+        ]
+        package_urls = []
+
+        def get_data(url):
+            if 'organization_show' in url:
+                return self.get_data(url)
+
+            package_urls.append(url)
+            packages = registry
+
+            if 'fq=' in url:
+                since = datetime.datetime(2019, 2, 1)
+                self.assertIn(quote(since.strftime('%Y-%m-%dT%H:%M:%SZ')), url)
+                packages = [
+                    package for package in registry
+                    if package['metadata_modified'] >= since.isoformat()
+                ]
+
+            start = int(url.split('start=')[1].split('&')[0])
+            return {'result': {'results': packages[start:start + 2]}}
+
+        self.datasetSyncer.get_data = get_data
+
+        with patch('iati_synchroniser.dataset_syncer.PAGE_SIZE', 2):
+            sync = self.datasetSyncer.synchronize_delta()
+
+        self.assertEqual(sync.dataset_count, 3)
+        self.assertEqual(Dataset.objects.count(), 3)
+        self.assertEqual(len(package_urls), 3)
+        self.assertIn('start=2&fq=', package_urls[2])
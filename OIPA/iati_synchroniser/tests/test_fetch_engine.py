@@ -0,0 +1,130 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from django.test import SimpleTestCase
+
+from iati_synchroniser.fetch_engine import FetchEngine, FetchError
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class RegistryHandler(BaseHTTPRequestHandler):
+    """
+    A stand-in for the registry and the publisher servers:
+
+    - /page?offset=N: a page of 2 items of a listing of 5 items
+    - /file/NAME: the file NAME
+    - /flaky: fails once, then returns a file
+    - /missing: 404
+    """
+    flaky_requests = 0
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body, status=200):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith('/page'):
+            offset = int(self.path.split('offset=')[1])
+            items = list(range(5))[offset:offset + 2]
+            self.send_body(json.dumps({'result': items}).encode('utf-8'))
+        elif self.path.startswith('/file/'):
+            self.send_body(self.path[len('/file/'):].encode('utf-8'))
+        elif self.path == '/flaky':
+            RegistryHandler.flaky_requests += 1
+
+            if RegistryHandler.flaky_requests == 1:
+                self.send_body(b'', status=503)
+            else:
+                self.send_body(b'flaky')
+        else:
+            self.send_body(b'', status=404)
+
+
+class FetchEngineTestCase(SimpleTestCase):
+
+    def setUp(self):
+        RegistryHandler.flaky_requests = 0
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RegistryHandler)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever).start()
+
+        self.directory = tempfile.mkdtemp()
+        self.engine = FetchEngine(
+            max_connections=4, max_per_host=2, timeout=5, backoff=0)
+
+    def tearDown(self):
+        self.engine.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def test_get_pages(self):
+        items = self.engine.get_pages(
+            lambda offset: '{}/page?offset={}'.format(self.url, offset),
+            2,
+            lambda page: page['result'],
+            window=2)
+
+        self.assertEqual(list(items), [0, 1, 2, 3, 4])
+
+    def test_download(self):
+        path = os.path.join(self.directory, 'datasets', 'a', 'a.xml')
+        missing_path = os.path.join(self.directory, 'missing.xml')
+
+        results = self.engine.download([
+            ('{}/file/a'.format(self.url), path),
+            ('{}/flaky'.format(self.url), path + '.flaky'),
+            ('{}/missing'.format(self.url), missing_path),
+        ])
+
+        self.assertEqual(results[:2], [path, path + '.flaky'])
+        self.assertIsInstance(results[2], FetchError)
+
+        with open(path) as f:
+            self.assertEqual(f.read(), 'a')
+
+        with open(path + '.flaky') as f:
+            self.assertEqual(f.read(), 'flaky')
+
+        # no partial or temporary files are left behind:
+        self.assertFalse(os.path.exists(missing_path))
+        self.assertEqual(
+            sorted(os.listdir(os.path.dirname(path))),
+            ['a.xml', 'a.xml.flaky'])
+
+    def test_session_per_thread(self):
+        sessions = {}
+
+        def get_sessions(name):
+            sessions[name] = (self.engine._session(), self.engine._session())
+
+        threads = [
+            threading.Thread(target=get_sessions, args=(name,))
+            for name in ('a', 'b')]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # one session per thread, reused within the thread:
+        self.assertIs(sessions['a'][0], sessions['a'][1])
+        self.assertIsNot(sessions['a'][0], sessions['b'][0])
+        self.assertEqual(len(self.engine._sessions), 2)
+
+        self.engine.close()
+        self.assertEqual(self.engine._sessions, [])
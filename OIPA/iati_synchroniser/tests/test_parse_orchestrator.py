@@ -0,0 +1,185 @@
+import threading
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+
+from django.test import TestCase
+from mock import MagicMock
+
+from iati_synchroniser.parse_orchestrator import (
+    ParseOrchestrator, ParseScheduler
+)
+
+
+class ParseSchedulerTestCase(TestCase):
+    """
+    Order in which the parse orchestrator hands out datasets
+    """
+
+    def dataset(self, name, publisher_id, count_in_xml, count_in_database=0):
+        # (name is a constructor argument of MagicMock itself)
+        dataset = MagicMock(
+            publisher_id=publisher_id,
+            activities_count_in_xml=count_in_xml,
+            activities_count_in_database=count_in_database)
+        dataset.name = name
+        return dataset
+
+    def test_largest_first(self):
+        small = self.dataset('small', 1, 10)
+        large = self.dataset('large', 2, 10, 5000)
+        medium = self.dataset('medium', 3, 500)
+
+        scheduler = ParseScheduler([small, large, medium])
+
+        self.assertEqual(scheduler.next_dataset(), large)
+        self.assertEqual(scheduler.next_dataset(), medium)
+        self.assertEqual(scheduler.next_dataset(), small)
+        self.assertFalse(scheduler.has_pending())
+
+    def test_one_dataset_per_publisher(self):
+        first = self.dataset('first', 1, 1000)
+        second = self.dataset('second', 1, 100)
+        other = self.dataset('other', 2, 10)
+
+        scheduler = ParseScheduler([first, second, other])
+
+        self.assertEqual(scheduler.next_dataset(), first)
+        # the publisher of second is still running:
+        self.assertEqual(scheduler.next_dataset(), other)
+        self.assertIsNone(scheduler.next_dataset())
+
+        scheduler.done(first)
+        self.assertEqual(scheduler.next_dataset(), second)
+
+
+class FakeExecutor(object):
+    """
+    A process pool in which dataset {id} returns after durations[id]
+    seconds, or makes its process die when its duration is negative. When
+    a process dies, or the pool is stopped, all running calls fail with
+    BrokenProcessPool, like in ProcessPoolExecutor
+    """
+    _processes = {}
+
+    def __init__(self, datasets, durations):
+        self.datasets = datasets
+        self.durations = durations
+        self.running = {}
+        self.timers = []
+
+    def submit(self, func, dataset_id, force_reparse):
+        future = futures.Future()
+        duration = self.durations[dataset_id]
+        self.running[future] = self.datasets[dataset_id]
+
+        if duration < 0:
+            timer = threading.Timer(-duration, self.break_pool)
+        else:
+            timer = threading.Timer(
+                duration, self.finish, (future, {'status': 'parsed'}))
+
+        self.timers.append(timer)
+        timer.start()
+
+        return future
+
+    def finish(self, future, result):
+        if self.running.pop(future, None) is not None:
+            future.set_result(result)
+
+    def break_pool(self):
+        for future in list(self.running):
+            self.running.pop(future)
+            future.set_exception(BrokenProcessPool())
+
+    def shutdown(self, wait=True):
+        for timer in self.timers:
+            timer.cancel()
+
+        self.break_pool()
+
+
+class ParseOrchestratorTestCase(TestCase):
+
+    def dataset(self, dataset_id, publisher_id):
+        dataset = MagicMock(
+            id=dataset_id,
+            publisher_id=publisher_id,
+            activities_count_in_xml=dataset_id,
+            activities_count_in_database=0)
+        dataset.name = 'dataset-{}'.format(dataset_id)
+        return dataset
+
+    def run_phase(self, datasets, durations, timeout=60):
+        """
+        Returns the saved (dataset, status)'s and the executors which were
+        started
+        """
+        executors = []
+
+        def create_executor():
+            executors.append(FakeExecutor(
+                {dataset.id: dataset for dataset in datasets}, durations))
+            return executors[-1]
+
+        orchestrator = ParseOrchestrator(workers=2, timeout=timeout)
+        orchestrator.poll_interval = 0.05
+        orchestrator.create_executor = create_executor
+        orchestrator.save_result = MagicMock()
+
+        orchestrator.start_executor()
+        orchestrator.run_phase(None, datasets)
+        orchestrator.stop_executor()
+
+        return [
+            (call[0][1], call[0][2]['status'])
+            for call in orchestrator.save_result.call_args_list
+        ], executors
+
+    def test_one_dataset_per_publisher(self):
+        first = self.dataset(2, 1)
+        second = self.dataset(1, 1)
+
+        results, executors = self.run_phase(
+            [first, second], {first.id: 0.1, second.id: 0.1})
+
+        self.assertEqual(results, [(first, 'parsed'), (second, 'parsed')])
+        self.assertEqual(len(executors), 1)
+
+    def test_timed_out_dataset(self):
+        """
+        A timed out dataset is marked failed and its pool is stopped, the
+        dataset which was running next to it is parsed again
+        """
+        slow = self.dataset(4, 1)
+        other = self.dataset(3, 2)
+        later = self.dataset(2, 2)
+        next_of_publisher = self.dataset(1, 1)
+
+        results, executors = self.run_phase(
+            [slow, other, later, next_of_publisher],
+            {slow.id: 10, other.id: 0.3, later.id: 0.4,
+             next_of_publisher.id: 0},
+            timeout=0.5)
+
+        self.assertEqual(sorted(results, key=lambda r: r[0].id), [
+            (next_of_publisher, 'parsed'),
+            (later, 'parsed'),
+            (other, 'parsed'),
+            (slow, 'failed'),
+        ])
+        self.assertEqual(len(executors), 2)
+
+    def test_dead_process(self):
+        """
+        When a process dies, the datasets of the pool are parsed again once,
+        and marked failed the second time
+        """
+        dying = self.dataset(2, 1)
+        other = self.dataset(1, 2)
+
+        results, executors = self.run_phase(
+            [dying, other], {dying.id: -0.2, other.id: 0.1})
+
+        self.assertEqual(results, [(other, 'parsed'), (dying, 'failed')])
+        self.assertEqual(len(executors), 3)
@@ -0,0 +1,201 @@
+# If on Python 2.X
+from __future__ import print_function
+
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Number of activities of which the documents are built and sent at once:
+DEFAULT_BATCH_SIZE = 500
+
+_local = threading.local()
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def get_document_querysets():
+    """
+    Returns the querysets the documents of the activity, transaction, budget
+    and result cores are built from, with the related rows their indexing
+    reads prefetched, as {task indexing class: queryset}
+    """
+    from iati.activity_manager import get_result_queryset
+    from iati.models import Activity, Budget
+    from iati.transaction.models import Transaction
+    from solr.activity.tasks import ActivityTaskIndexing
+    from solr.budget.tasks import BudgetTaskIndexing
+    from solr.result.tasks import ResultTaskIndexing
+    from solr.transaction.tasks import TransactionTaskIndexing
+
+    return OrderedDict([
+        (ActivityTaskIndexing, Activity.objects.prefetch_all()),
+        (TransactionTaskIndexing, Transaction.objects.prefetch_all()
+            .prefetch_related(
+                'transactionsector_set',
+                'transactionaidtype_set__aid_type',
+                'activity__description_set__narratives',
+                'activity__activitysector_set__narratives',
+            )),
+        (BudgetTaskIndexing, Budget.objects.select_related('activity')
+            .prefetch_related(
+                'activity__activityrecipientcountry_set__country',
+            )),
+        (ResultTaskIndexing, get_result_queryset()
+            .select_related('activity')
+            .prefetch_related(
+                'documentlink_set',
+                'resultreference_set',
+            )),
+    ])
+
+
+class IndexingBuffer(object):
+    """
+    Collects the activities to (re)index and the documents to delete while
+    a dataset is parsed, instead of indexing every saved activity on its
+    own with a commit per document (see solr/signals.py).
+
+    flush() deletes the documents, builds the activity, transaction, budget
+    and result documents in batches of activities and sends them to each
+    core without committing, followed by one soft commit per core.
+    """
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.SOLR.get(
+            'batch_size', DEFAULT_BATCH_SIZE)
+        self.activity_ids = set()
+        # task indexing class -> ids of the documents to delete
+        self.deleted = OrderedDict()
+
+    def add_activity(self, activity):
+        self.activity_ids.add(activity.id)
+
+    def delete(self, task_indexing, instance):
+        from solr.activity.tasks import ActivityTaskIndexing
+
+        self.deleted.setdefault(task_indexing, set()).add(instance.id)
+
+        if task_indexing is ActivityTaskIndexing:
+            self.activity_ids.discard(instance.id)
+
+    def get_querysets(self, activity_ids):
+        """
+        Returns (task indexing class, queryset) for every core that has
+        documents of the activities {activity_ids}
+        """
+        from solr.activity.tasks import ActivityTaskIndexing
+
+        return [
+            (task_indexing, queryset.filter(id__in=activity_ids)
+             if task_indexing is ActivityTaskIndexing
+             else queryset.filter(activity_id__in=activity_ids))
+            for task_indexing, queryset in get_document_querysets().items()
+        ]
+
+    def flush(self):
+        if not settings.SOLR.get('indexing'):
+            self.clear()
+            return
+
+        # pysolr.Solr instances of the cores that need a commit:
+        cores = []
+
+        def send(solr, method, **kwargs):
+            try:
+                getattr(solr, method)(commit=False, **kwargs)
+            except Exception as e:
+                logger.exception(e)
+
+            if solr not in cores:
+                cores.append(solr)
+
+        # deletes go first, a reparsed activity gets new documents:
+        for task_indexing, ids in self.deleted.items():
+            for ids_chunk in chunks(sorted(ids), self.batch_size):
+                send(task_indexing.solr, 'delete',
+                     id=[str(instance_id) for instance_id in ids_chunk])
+
+        for activity_ids in chunks(
+                sorted(self.activity_ids), self.batch_size):
+            for task_indexing, queryset in self.get_querysets(activity_ids):
+                # pylint: disable=not-callable
+                docs = [
+                    task_indexing.indexing(instance).data
+                    for instance in queryset
+                ]
+
+                if docs:
+                    send(task_indexing.solr, 'add', docs=docs)
+
+        for solr in cores:
+            try:
+                solr.commit(softCommit=True)
+            except Exception as e:
+                logger.exception(e)
+
+        self.clear()
+
+    def clear(self):
+        self.activity_ids = set()
+        self.deleted = OrderedDict()
+
+
+def index_instances(task_indexing, queryset, batch_size=None):
+    """
+    Indexes the instances of {queryset} with {task_indexing} in batches,
+    without committing, followed by one soft commit. For rows written
+    without save(), which don't get indexed by the post_save signals of
+    solr/signals.py (e.g. by common.util.bulk_upsert)
+    """
+    if not settings.SOLR.get('indexing'):
+        return
+
+    batch_size = batch_size or settings.SOLR.get(
+        'batch_size', DEFAULT_BATCH_SIZE)
+
+    try:
+        for instances in chunks(list(queryset), batch_size):
+            # pylint: disable=not-callable
+            task_indexing.solr.add(docs=[
+                task_indexing.indexing(instance).data
+                for instance in instances
+            ], commit=False)
+
+        task_indexing.solr.commit(softCommit=True)
+    except Exception as e:
+        logger.exception(e)
+
+
+def get_indexing_buffer():
+    """
+    Returns the active IndexingBuffer of this thread, or None
+    """
+    return getattr(_local, 'buffer', None)
+
+
+@contextmanager
+def buffered_indexing(batch_size=None):
+    """
+    Buffers the Solr indexing triggered by saved and deleted activities
+    until the end of the block. Nested blocks share the outer buffer.
+    """
+    if get_indexing_buffer() is not None:
+        yield get_indexing_buffer()
+        return
+
+    _local.buffer = IndexingBuffer(batch_size)
+
+    try:
+        yield _local.buffer
+    finally:
+        indexing_buffer = _local.buffer
+        _local.buffer = None
+        indexing_buffer.flush()
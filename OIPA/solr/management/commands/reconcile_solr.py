@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from solr.reconciler import DEFAULT_BATCH_SIZE, SolrReconciler
+
+
+class Command(BaseCommand):
+    """
+    Index the records missing in Solr and delete the documents of removed
+    records, then print the drift counts per core
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'cores',
+            nargs='*',
+            help='Cores to reconcile (default: all)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='Only report the drift, do not change Solr',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            dest='batch_size',
+            default=DEFAULT_BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        report = SolrReconciler(
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        ).reconcile(cores=options['cores'])
+
+        for core, drift in report.items():
+            self.stdout.write(
+                '{}: {} in database, {} in Solr, {} missing, {} extra'.format(
+                    core, *drift.values()))
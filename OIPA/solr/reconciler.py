@@ -0,0 +1,197 @@
+# If on Python 2.X
+from __future__ import print_function
+
+import logging
+from collections import OrderedDict
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+# Number of ids per Solr page, and per batch of deletes / adds:
+DEFAULT_BATCH_SIZE = 1000
+
+
+class SolrReconciler(object):
+    """
+    Finds and fixes the differences between the database and the Solr
+    cores, without loading all ids of a core in memory.
+
+    The ids of a model (read with a server-side cursor) and the ids of its
+    core (read with cursorMark paging) are both walked in sorted order and
+    merged: ids only in the database are indexed, ids only in Solr are
+    deleted, in batches without commits and one soft commit per core.
+
+    Solr ids are strings, so both sides are sorted as text.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+
+    def get_cores(self):
+        """
+        Returns (core name, task indexing class, queryset to build the
+        documents from) for every core to reconcile
+        """
+        from solr.activity.tasks import ActivityTaskIndexing
+        from solr.budget.tasks import BudgetTaskIndexing
+        from solr.datasetnote.tasks import DatasetNoteTaskIndexing
+        from solr.indexing_buffer import get_document_querysets
+        from solr.result.tasks import ResultTaskIndexing
+        from solr.transaction.tasks import TransactionTaskIndexing
+
+        querysets = get_document_querysets()
+
+        return [
+            ('activity', ActivityTaskIndexing,
+             querysets[ActivityTaskIndexing]),
+            ('transaction', TransactionTaskIndexing,
+             querysets[TransactionTaskIndexing]),
+            ('budget', BudgetTaskIndexing,
+             querysets[BudgetTaskIndexing]),
+            ('result', ResultTaskIndexing,
+             querysets[ResultTaskIndexing]),
+            ('datasetnote', DatasetNoteTaskIndexing,
+             DatasetNoteTaskIndexing.model.objects.all()),
+        ]
+
+    def get_database_ids(self, model):
+        """
+        Yields the ids of {model} as strings, in the order Solr sorts them
+        """
+        quote_name = connection.ops.quote_name
+        order = RawSQL(
+            'CAST({table}.{pk} AS text) COLLATE "C"'.format(
+                table=quote_name(model._meta.db_table),
+                pk=quote_name(model._meta.pk.column)), [])
+
+        for pk in model.objects.order_by(order).values_list(
+                'pk', flat=True).iterator(chunk_size=self.batch_size):
+            yield str(pk)
+
+    def get_solr_ids(self, solr):
+        """
+        Yields the ids in the core of {solr} in sorted order, a page at a
+        time (cursorMark paging)
+        """
+        cursor_mark = '*'
+
+        while True:
+            results = solr.search(
+                q='*:*',
+                fl='id',
+                sort='id asc',
+                rows=self.batch_size,
+                cursorMark=cursor_mark)
+
+            for doc in results.docs:
+                yield doc['id']
+
+            next_cursor_mark = results.raw_response.get('nextCursorMark')
+
+            if not next_cursor_mark or next_cursor_mark == cursor_mark:
+                break
+
+            cursor_mark = next_cursor_mark
+
+    def merge(self, database_ids, solr_ids):
+        """
+        Merges two sorted id iterators. Yields (id, in database, in Solr)
+        """
+        database_id = next(database_ids, None)
+        solr_id = next(solr_ids, None)
+
+        while database_id is not None or solr_id is not None:
+            if solr_id is None or (
+                    database_id is not None and database_id < solr_id):
+                yield database_id, True, False
+                database_id = next(database_ids, None)
+            elif database_id is None or solr_id < database_id:
+                yield solr_id, False, True
+                solr_id = next(solr_ids, None)
+            else:
+                yield database_id, True, True
+                database_id = next(database_ids, None)
+                solr_id = next(solr_ids, None)
+
+    def add(self, task_indexing, queryset, ids):
+        if self.dry_run or not ids:
+            return
+
+        # pylint: disable=not-callable
+        docs = [
+            task_indexing.indexing(instance).data
+            for instance in queryset.filter(pk__in=[int(i) for i in ids])
+        ]
+
+        if docs:
+            task_indexing.solr.add(docs, commit=False)
+
+    def delete(self, task_indexing, ids):
+        if self.dry_run or not ids:
+            return
+
+        task_indexing.solr.delete(id=ids, commit=False)
+
+    def reconcile_core(self, task_indexing, queryset):
+        """
+        Returns the drift counts of one core
+        """
+        drift = OrderedDict([
+            ('database', 0),
+            ('solr', 0),
+            ('missing', 0),
+            ('extra', 0),
+        ])
+        to_add = []
+        to_delete = []
+
+        for pk, in_database, in_solr in self.merge(
+                self.get_database_ids(task_indexing.model),
+                self.get_solr_ids(task_indexing.solr)):
+            drift['database'] += in_database
+            drift['solr'] += in_solr
+
+            if not in_solr:
+                drift['missing'] += 1
+                to_add.append(pk)
+            elif not in_database:
+                drift['extra'] += 1
+                to_delete.append(pk)
+
+            if len(to_add) >= self.batch_size:
+                self.add(task_indexing, queryset, to_add)
+                to_add = []
+
+            if len(to_delete) >= self.batch_size:
+                self.delete(task_indexing, to_delete)
+                to_delete = []
+
+        self.add(task_indexing, queryset, to_add)
+        self.delete(task_indexing, to_delete)
+
+        if not self.dry_run and (drift['missing'] or drift['extra']):
+            task_indexing.solr.commit(softCommit=True)
+
+        return drift
+
+    def reconcile(self, cores=None):
+        """
+        Reconciles all cores (or the ones named in {cores}), returns the
+        drift counts per core
+        """
+        report = OrderedDict()
+
+        for name, task_indexing, queryset in self.get_cores():
+            if cores and name not in cores:
+                continue
+
+            report[name] = self.reconcile_core(task_indexing, queryset)
+
+            logger.info(
+                "Solr core %s: %s in database, %s in Solr, %s missing, "
+                "%s extra", name, *report[name].values())
+
+        return report
@@ -11,11 +11,21 @@ from solr.budget.tasks import BudgetTaskIndexing
 from solr.codelists.country.tasks import CodeListCountryTaskIndexing
 from solr.codelists.region.tasks import CodeListRegionTaskIndexing
 from solr.dataset.tasks import DatasetTaskIndexing
+from solr.indexing_buffer import get_indexing_buffer
 from solr.organisation.tasks import OrganisationTaskIndexing
 from solr.publisher.tasks import PublisherTaskIndexing
 from solr.transaction.tasks import TransactionTaskIndexing
 
 
+def delete_document(task_indexing, instance):
+    indexing_buffer = get_indexing_buffer()
+
+    if indexing_buffer is not None:
+        indexing_buffer.delete(task_indexing, instance)
+    else:
+        task_indexing(instance=instance).delete()
+
+
 @receiver(signals.post_save, sender=Dataset)
 def dataset_post_save(sender, instance, **kwargs):
     DatasetTaskIndexing(instance=instance).run()
@@ -43,7 +53,13 @@ def code_list_region_post_save(sender, instance, **kwargs):
 
 @receiver(signals.post_save, sender=Activity)
 def activity_post_save(sender, instance, **kwargs):
-    ActivityTaskIndexing(instance=instance, related=True).run()
+    indexing_buffer = get_indexing_buffer()
+
+    # while parsing, activities are indexed in batches at the end:
+    if indexing_buffer is not None:
+        indexing_buffer.add_activity(instance)
+    else:
+        ActivityTaskIndexing(instance=instance, related=True).run()
 
 
 @receiver(signals.pre_delete, sender=Dataset)
@@ -73,14 +89,14 @@ def code_list_region_pre_delete(sender, instance, **kwargs):
 
 @receiver(signals.pre_delete, sender=Activity)
 def activity_pre_delete(sender, instance, **kwargs):
-    ActivityTaskIndexing(instance=instance).delete()
+    delete_document(ActivityTaskIndexing, instance)
 
 
 @receiver(signals.pre_delete, sender=Budget)
 def budget_pre_delete(sender, instance, **kwargs):
-    BudgetTaskIndexing(instance=instance).delete()
+    delete_document(BudgetTaskIndexing, instance)
 
 
 @receiver(signals.pre_delete, sender=Transaction)
 def transaction_pre_delete(sender, instance, **kwargs):
-    TransactionTaskIndexing(instance=instance).delete()
+    delete_document(TransactionTaskIndexing, instance)
@@ -0,0 +1,164 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+from mock import patch
+
+from iati.factory import iati_factory
+from iati.transaction.factories import TransactionFactory
+from solr.activity.tasks import ActivityTaskIndexing
+from solr.indexing_buffer import (
+    IndexingBuffer, buffered_indexing, get_document_querysets,
+    get_indexing_buffer, index_instances
+)
+
+SOLR = {'indexing': True}
+
+
+class FakeSolr(object):
+    """Records the calls to a core in {log}, as (core, method, kwargs)"""
+
+    def __init__(self, core, log):
+        self.core = core
+        self.log = log
+
+    def add(self, docs, commit=True):
+        self.log.append((self.core, 'add', {'docs': docs, 'commit': commit}))
+
+    def delete(self, id=None, commit=True):
+        self.log.append((self.core, 'delete', {'id': id, 'commit': commit}))
+
+    def commit(self, softCommit=False):
+        self.log.append((self.core, 'commit', {'softCommit': softCommit}))
+
+
+class FakeIndexing(object):
+
+    def __init__(self, instance):
+        self.data = {'id': str(instance)}
+
+
+def fake_task_indexing(core, log):
+    return type(core, (object,), {
+        'solr': FakeSolr(core, log),
+        'indexing': FakeIndexing,
+    })
+
+
+@override_settings(SOLR=SOLR)
+class IndexingBufferFlushTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.log = []
+        self.activity = fake_task_indexing('activity', self.log)
+        self.transaction = fake_task_indexing('transaction', self.log)
+
+        self.buffer = IndexingBuffer(batch_size=2)
+        self.buffer.activity_ids = {1, 2, 3}
+        self.buffer.deleted[self.transaction] = {70, 80, 90}
+
+        self.buffer.get_querysets = lambda activity_ids: [
+            (self.activity, list(activity_ids)),
+            (self.transaction, [i * 10 for i in activity_ids]),
+        ]
+
+    def calls(self, method):
+        return [(core, kwargs) for core, m, kwargs in self.log if m == method]
+
+    def test_deletes_first(self):
+        self.buffer.flush()
+
+        self.assertEqual(
+            [method for core, method, kwargs in self.log[:2]],
+            ['delete', 'delete'])
+        self.assertEqual(self.calls('delete'), [
+            ('transaction', {'id': ['70', '80'], 'commit': False}),
+            ('transaction', {'id': ['90'], 'commit': False}),
+        ])
+
+    def test_one_add_per_batch_per_core(self):
+        self.buffer.flush()
+
+        self.assertEqual([
+            (core, [doc['id'] for doc in kwargs['docs']], kwargs['commit'])
+            for core, kwargs in self.calls('add')
+        ], [
+            ('activity', ['1', '2'], False),
+            ('transaction', ['10', '20'], False),
+            ('activity', ['3'], False),
+            ('transaction', ['30'], False),
+        ])
+
+    def test_one_soft_commit_per_core(self):
+        self.buffer.flush()
+
+        self.assertEqual(self.calls('commit'), [
+            ('transaction', {'softCommit': True}),
+            ('activity', {'softCommit': True}),
+        ])
+        # the commits come last:
+        self.assertEqual(
+            [method for core, method, kwargs in self.log[-2:]],
+            ['commit', 'commit'])
+
+        # the buffer is empty afterwards:
+        self.assertEqual(self.buffer.activity_ids, set())
+        self.assertEqual(len(self.buffer.deleted), 0)
+
+    @override_settings(SOLR={'indexing': False})
+    def test_indexing_off(self):
+        self.buffer.flush()
+
+        self.assertEqual(self.log, [])
+
+    def test_index_instances(self):
+        index_instances(self.activity, [1, 2, 3], batch_size=2)
+
+        self.assertEqual([
+            (method, [doc['id'] for doc in kwargs.get('docs', [])])
+            for core, method, kwargs in self.log
+        ], [('add', ['1', '2']), ('add', ['3']), ('commit', [])])
+
+
+class BufferedIndexingTestCase(TestCase):
+
+    def test_collects_saves_and_deletes(self):
+        with patch.object(IndexingBuffer, 'flush') as flush:
+            with buffered_indexing() as indexing_buffer:
+                kept = iati_factory.ActivityFactory.create(
+                    iati_identifier='IATI-0001')
+                deleted = iati_factory.ActivityFactory.create(
+                    iati_identifier='IATI-0002')
+                deleted_id = deleted.id
+                deleted.delete()
+
+                self.assertIs(get_indexing_buffer(), indexing_buffer)
+
+        self.assertIsNone(get_indexing_buffer())
+        self.assertEqual(flush.call_count, 1)
+        self.assertEqual(indexing_buffer.activity_ids, {kept.id})
+        self.assertIn(
+            deleted_id, indexing_buffer.deleted[ActivityTaskIndexing])
+
+    def test_nested_blocks(self):
+        with patch.object(IndexingBuffer, 'flush') as flush:
+            with buffered_indexing() as outer:
+                with buffered_indexing() as inner:
+                    self.assertIs(inner, outer)
+
+                self.assertEqual(flush.call_count, 0)
+                self.assertIs(get_indexing_buffer(), outer)
+
+        self.assertEqual(flush.call_count, 1)
+
+    def test_document_querysets(self):
+        """
+        The prefetches of the document querysets exist
+        """
+        activity = iati_factory.ActivityFactory.create()
+        TransactionFactory.create(activity=activity)
+        iati_factory.BudgetFactory.create(activity=activity)
+        iati_factory.ResultFactory.create(activity=activity)
+
+        for task_indexing, queryset in IndexingBuffer().get_querysets(
+                [activity.id]):
+            self.assertEqual(len(list(queryset)), 1)
+
+        self.assertEqual(len(get_document_querysets()), 4)
@@ -0,0 +1,144 @@
+from django.test import SimpleTestCase
+
+from solr.reconciler import SolrReconciler
+
+
+class FakeResults(object):
+
+    def __init__(self, docs, next_cursor_mark):
+        self.docs = docs
+        self.raw_response = {'nextCursorMark': next_cursor_mark}
+
+
+class FakeSolr(object):
+    """
+    A core with the documents {ids}, paged by cursorMark (an offset here).
+    Records the adds, deletes and commits in {log}
+    """
+
+    def __init__(self, ids):
+        self.ids = sorted(ids)
+        self.log = []
+
+    def search(self, q, fl, sort, rows, cursorMark):
+        start = 0 if cursorMark == '*' else int(cursorMark)
+        docs = [{'id': i} for i in self.ids[start:start + rows]]
+
+        return FakeResults(docs, str(start + len(docs)))
+
+    def add(self, docs, commit=True):
+        self.log.append(('add', [doc['id'] for doc in docs], commit))
+
+    def delete(self, id=None, commit=True):
+        self.log.append(('delete', id, commit))
+
+    def commit(self, softCommit=False):
+        self.log.append(('commit', softCommit))
+
+
+class FakeIndexing(object):
+
+    def __init__(self, instance):
+        self.data = {'id': str(instance)}
+
+
+class FakeQuerySet(object):
+    """The instances of the model are their ids"""
+
+    def filter(self, pk__in):
+        return sorted(pk__in)
+
+
+class SolrReconcilerMergeTestCase(SimpleTestCase):
+
+    def merge(self, database_ids, solr_ids):
+        return list(SolrReconciler().merge(iter(database_ids), iter(solr_ids)))
+
+    def test_interleaved(self):
+        self.assertEqual(self.merge(['1', '3', '5'], ['2', '3', '4']), [
+            ('1', True, False),
+            ('2', False, True),
+            ('3', True, True),
+            ('4', False, True),
+            ('5', True, False),
+        ])
+
+    def test_empty(self):
+        self.assertEqual(self.merge([], []), [])
+        self.assertEqual(self.merge(['1', '2'], []), [
+            ('1', True, False),
+            ('2', True, False),
+        ])
+        self.assertEqual(self.merge([], ['1', '2']), [
+            ('1', False, True),
+            ('2', False, True),
+        ])
+
+    def test_trailing(self):
+        self.assertEqual(self.merge(['1'], ['1', '2', '3']), [
+            ('1', True, True),
+            ('2', False, True),
+            ('3', False, True),
+        ])
+        self.assertEqual(self.merge(['1', '2', '3'], ['1']), [
+            ('1', True, True),
+            ('2', True, False),
+            ('3', True, False),
+        ])
+
+    def test_text_order(self):
+        """
+        Ids are compared as text, like Solr sorts them: "10" < "9"
+        """
+        self.assertEqual(self.merge(['10', '9'], ['9']), [
+            ('10', True, False),
+            ('9', True, True),
+        ])
+
+
+class SolrReconcilerCoreTestCase(SimpleTestCase):
+    """
+    Database: 1, 2, 3, 4, 5, Solr: 4, 6, 7, 8
+    """
+
+    def reconcile_core(self, dry_run=False):
+        self.solr = FakeSolr(['4', '6', '7', '8'])
+        task_indexing = type('FakeTaskIndexing', (object,), {
+            'model': None,
+            'solr': self.solr,
+            'indexing': FakeIndexing,
+        })
+
+        reconciler = SolrReconciler(batch_size=2, dry_run=dry_run)
+        reconciler.get_database_ids = lambda model: iter(
+            ['1', '2', '3', '4', '5'])
+
+        return reconciler.reconcile_core(task_indexing, FakeQuerySet())
+
+    def test_drift(self):
+        drift = self.reconcile_core()
+
+        self.assertEqual(dict(drift), {
+            'database': 5,
+            'solr': 4,
+            'missing': 4,
+            'extra': 3,
+        })
+
+    def test_batches(self):
+        self.reconcile_core()
+
+        self.assertEqual(self.solr.log, [
+            ('add', ['1', '2'], False),
+            ('add', ['3', '5'], False),
+            ('delete', ['6', '7'], False),
+            ('delete', ['8'], False),
+            ('commit', True),
+        ])
+
+    def test_dry_run(self):
+        drift = self.reconcile_core(dry_run=True)
+
+        self.assertEqual(self.solr.log, [])
+        self.assertEqual(drift['missing'], 4)
+        self.assertEqual(drift['extra'], 3)
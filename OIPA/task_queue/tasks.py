@@ -4,6 +4,7 @@ import json
 import logging
 import os
 import time
+import uuid
 
 import celery
 import django_rq
@@ -16,26 +17,21 @@ from django.core.cache import caches
 from django_rq import job
 from redis import Redis
 from rest_framework_extensions.settings import extensions_api_settings
-from rq import Worker
 from rq.job import Job
 
 from api.export.serializers import ActivityXMLSerializer
-from api.renderers import XMLRenderer
+from api.renderers import StreamingXMLRenderer
 from common.download_file import DownloadFile, hash_file
+from common.fragment_cache import invalidate_all_fragments
 from iati.activity_aggregation_calculation import (
-    ActivityAggregationCalculation
+    BulkActivityAggregationCalculation
 )
-from iati.models import Activity, Budget, Document, DocumentLink, Result
-from iati.transaction.models import Transaction
+from iati.models import Activity, Document, DocumentLink
 from iati_synchroniser.models import Dataset, DatasetNote
 from OIPA.celery import app
 from solr.activity.tasks import ActivityTaskIndexing
-from solr.activity.tasks import solr as solr_activity
-from solr.budget.tasks import solr as solr_budget
 from solr.datasetnote.tasks import DatasetNoteTaskIndexing
 from solr.datasetnote.tasks import solr as solr_dataset_note
-from solr.result.tasks import solr as solr_result
-from solr.transaction.tasks import solr as solr_transaction
 from task_queue.utils import Tasks
 from task_queue.validation import DatasetValidationTask
 
@@ -53,7 +49,8 @@ def remove_all_api_caches():
     Call this function after the API data has been changed,
     to remove all cached of the API data
 
-    TODO: remove just for a specific of the API data which has been changed
+    The caches of a single dataset are expired after it's parsed, see
+    common/cache_tags.py
     """
     api_caches = caches[extensions_api_settings.DEFAULT_USE_CACHE]
     api_caches.clear()
@@ -149,6 +146,24 @@ def parse_all_existing_sources():
         queue.enqueue(start_searchable_activities_task, args=(0,), timeout=300)
 
 
+@job
+def parse_all_existing_sources_in_pool(force=False, check_validation=False):
+    """
+    Parse all sources over a pool of processes (see
+    iati_synchroniser/parse_orchestrator.py), largest datasets first
+    """
+    from iati_synchroniser.parse_orchestrator import ParseOrchestrator
+
+    ParseOrchestrator(
+        force_reparse=force,
+        check_validation=check_validation
+    ).run()
+
+    if settings.ROOT_ORGANISATIONS:
+        queue = django_rq.get_queue("parser")
+        queue.enqueue(start_searchable_activities_task, args=(0,), timeout=300)
+
+
 @job
 def parse_all_sources_by_publisher_ref(org_ref):
     queue = django_rq.get_queue("parser")
@@ -214,10 +229,16 @@ def parse_source_by_id(source_id):
 
 @job
 def calculate_activity_aggregations_per_source(source_ref):
-    aac = ActivityAggregationCalculation()
+    aac = BulkActivityAggregationCalculation()
     aac.parse_activity_aggregations_by_source(source_ref)
 
 
+@job
+def calculate_all_activity_aggregations():
+    aac = BulkActivityAggregationCalculation()
+    aac.parse_all_activity_aggregations()
+
+
 @job
 def delete_source_by_id(source_id):
     try:
@@ -279,17 +300,32 @@ def find_replace_source_url(find_url, replace_url):
 
 @job
 def export_publisher_activities(publisher_id):
+    """
+    Write the IATI XML of the publisher's activities to a new file in
+    settings.EXPORT_ROOT (which isn't served publicly), a chunk of
+    activities at a time, and remove the earlier exports of the publisher.
+    Returns the path of the file relative to EXPORT_ROOT
+    """
     queryset = Activity.objects.all().filter(
         ready_to_publish=True,
         publisher_id=publisher_id
-    )
+    ).order_by('iati_identifier').prefetch_all()
+
+    directory = os.path.join(settings.EXPORT_ROOT, str(publisher_id))
+    os.makedirs(directory, exist_ok=True)
 
-    serializer = ActivityXMLSerializer(queryset, many=True)
+    # (a name which can't be guessed)
+    filename = '{}.xml'.format(uuid.uuid4().hex)
 
-    xml_renderer = XMLRenderer()
-    xml = xml_renderer.render(serializer.data)
+    xml_renderer = StreamingXMLRenderer()
+    xml_renderer.write_file(
+        os.path.join(directory, filename), queryset, ActivityXMLSerializer)
 
-    return xml
+    for old_filename in os.listdir(directory):
+        if old_filename != filename:
+            os.remove(os.path.join(directory, old_filename))
+
+    return os.path.join(str(publisher_id), filename)
 
 
 #############################
@@ -303,6 +339,9 @@ def update_exchange_rates():
     r = RateParser()
     r.update_rates(force=False)
 
+    queue = django_rq.get_queue("default")
+    queue.enqueue(revalue_currency_values, timeout=7200)
+
 
 @job
 def force_update_exchange_rates():
@@ -311,6 +350,28 @@ def force_update_exchange_rates():
     r = RateParser()
     r.update_rates(force=True)
 
+    queue = django_rq.get_queue("default")
+    queue.enqueue(revalue_currency_values, timeout=7200)
+
+
+@job
+def revalue_currency_values():
+    """
+    Recompute the converted values of the transactions and budgets of which
+    the exchange rates changed
+    """
+    from currency_convert.revaluation import revalue
+    from iati.transaction.facts import refresh_transaction_facts
+
+    updated = revalue()
+
+    if settings.ACTIVITY_FRAGMENT_CACHE and any(updated.values()):
+        invalidate_all_fragments()
+
+    # the facts hold copies of the converted transaction values:
+    if settings.TRANSACTION_FACTS and updated.get('iati_transaction'):
+        refresh_transaction_facts()
+
 
 ###############################
 ######## GEODATA TASKS ########  # NOQA: E266
@@ -369,39 +430,13 @@ def wait_300():
 
 @job
 def start_searchable_activities_task(counter=0):
-    workers = Worker.all(connection=redis_conn)
-    queue = django_rq.get_queue("parser")
-
-    has_other_jobs = False
-    already_running_update = False
-
-    for w in workers:
-        if len(w.queues):
-            if w.queues[0].name == "parser":
-                current_job = w.get_current_job()
-                if current_job:
-                    if ('start_searchable_activities_task'
-                            not in current_job.description):
-                        has_other_jobs = True
-                    if ('update_searchable_activities'
-                            in current_job.description):
-                        already_running_update = True
-
-    if already_running_update:
-        # update_searchable_activities already running or other
-        # start_searchable_activities_task running, invalidate task
-        pass
-    elif not has_other_jobs:
-        queue.enqueue(update_searchable_activities)
-    elif counter > 180:
-        raise Exception(
-            "Waited for 30 min, still jobs runnings so invalidating this task. \
-                    If this happens please contact OIPA devs!")
-    else:
-        counter += 1
-        time.sleep(120)
-        queue.enqueue(start_searchable_activities_task,
-                      args=(counter,), timeout=300)
+    """
+    Update the searchable activities. This used to wait for the parser queue
+    to be empty; the update is a single statement now, and the activities of
+    datasets which are parsed later are updated by the parser itself (see
+    iati/searchable_activities.py). {counter} is kept for queued jobs
+    """
+    update_searchable_activities()
 
 
 @job
@@ -513,105 +548,14 @@ def update_activity_count():
 
 
 @job
-def synchronize_solr_indexing():
-    queue = django_rq.get_queue('solr')
-    # Budget
-    list_budget_id = list(
-        Budget.objects.all().values_list('id', flat=True)
-    )
-    budget_hits = solr_budget.search(q='*:*', fl='id').hits
-    budget_docs = solr_budget.search(
-        q='*:*', fl='id', rows=budget_hits
-    ).docs
-    list_budget_doc_id = [
-        int(budget_doc['id']) for budget_doc in budget_docs
-    ]
-    for ids in divide_delete_ids(list_budget_id, list_budget_doc_id):
-        delete_multiple_rows_budget_in_solr(ids)
-
-    # Result
-    list_result_id = list(
-        Result.objects.all().values_list('id', flat=True)
-    )
-    result_hits = solr_result.search(q='*:*', fl='id').hits
-    result_docs = solr_result.search(
-        q='*:*', fl='id', rows=result_hits
-    ).docs
-    list_result_doc_id = [
-        int(result_doc['id']) for result_doc in result_docs
-    ]
-    for ids in divide_delete_ids(list_result_id, list_result_doc_id):
-        delete_multiple_rows_result_in_solr(ids)
-
-    # Transaction
-    list_transaction_id = list(
-        Transaction.objects.all().values_list('id', flat=True)
-    )
-    transaction_hits = solr_transaction.search(q='*:*', fl='id').hits
-    transaction_docs = solr_transaction.search(
-        q='*:*', fl='id', rows=transaction_hits
-    ).docs
-    list_transaction_doc_id = [
-        int(transaction_doc['id']) for transaction_doc in transaction_docs
-    ]
-    for ids in divide_delete_ids(list_transaction_id, list_transaction_doc_id):
-        delete_multiple_rows_transaction_in_solr(ids)
-
-    # Activity
-    list_activity_id = list(
-        Activity.objects.all().values_list('id', flat=True)
-    )
-    activity_hits = solr_activity.search(q='*:*', fl='id').hits
-    activity_docs = solr_activity.search(
-        q='*:*', fl='id', rows=activity_hits
-    ).docs
-    list_activity_doc_id = [
-        int(activity_doc['id']) for activity_doc in activity_docs
-    ]
-    for ids in divide_delete_ids(list_activity_id, list_activity_doc_id):
-        delete_multiple_rows_activiy_in_solr(ids)
-
-    for activity_id in (
-            list(set(list_activity_id) - set(list_activity_doc_id))
-    ):
-        queue.enqueue(add_activity_to_solr, args=(activity_id,))
-
-    # Dataset Note
-    list_dataset_note_id = list(
-        DatasetNote.objects.all().values_list('id', flat=True)
-    )
-    dataset_note_hits = solr_dataset_note.search(q='*:*', fl='id').hits
-    dataset_note_docs = solr_dataset_note.search(
-        q='*:*', fl='id', rows=dataset_note_hits
-    ).docs
-    list_dataset_note_doc_id = [
-        int(dataset_note_doc['id']) for dataset_note_doc in dataset_note_docs
-    ]
-    for ids in divide_delete_ids(
-            list_dataset_note_id,
-            list_dataset_note_doc_id
-    ):
-        delete_multiple_rows_dataset_note_in_solr(ids)
-
-    for dataset_note_id in (
-            list(set(list_dataset_note_id) - set(list_dataset_note_doc_id))
-    ):
-        queue.enqueue(add_dataset_note_to_solr, args=(dataset_note_id,))
-
-
-def divide_delete_ids(list_ids, list_solr_ids, start=0, end=1000, inc=1000):
-    ids_to_delete = list(
-        set(list_solr_ids) - set(list_ids)
-    )
-    ids = ids_to_delete[start:end]
-    result = []
-    while ids:
-        result.append(ids)
-        start += inc
-        end += inc
-        ids = ids_to_delete[start:end]
+def synchronize_solr_indexing(dry_run=False):
+    """
+    Index the records missing in Solr and delete the documents of removed
+    records (see solr/reconciler.py). Returns the drift counts per core
+    """
+    from solr.reconciler import SolrReconciler
 
-    return result
+    return SolrReconciler(dry_run=dry_run).reconcile()
 
 
 @job
@@ -630,41 +574,6 @@ def delete_dataset_note_in_solr(dataset_note_id):
     solr_dataset_note.delete(q='id:{id}'.format(id=dataset_note_id))
 
 
-@job
-def delete_multiple_rows_activiy_in_solr(ids):
-    solr_activity.delete(
-        q='id:({ids})'.format(ids=' OR '.join(str(i) for i in ids))
-    )
-
-
-@job
-def delete_multiple_rows_budget_in_solr(ids):
-    solr_budget.delete(
-        q='id:({ids})'.format(ids=' OR '.join(str(i) for i in ids))
-    )
-
-
-@job
-def delete_multiple_rows_transaction_in_solr(ids):
-    solr_transaction.delete(
-        q='id:({ids})'.format(ids=' OR '.join(str(i) for i in ids))
-    )
-
-
-@job
-def delete_multiple_rows_result_in_solr(ids):
-    solr_result.delete(
-        q='id:({ids})'.format(ids=' OR '.join(str(i) for i in ids))
-    )
-
-
-@job
-def delete_multiple_rows_dataset_note_in_solr(ids):
-    solr_dataset_note.delete(
-        q='id:({ids})'.format(ids=' OR '.join(str(i) for i in ids))
-    )
-
-
 @job
 def add_dataset_note_to_solr(dataset_note_id):
     try:
@@ -9,6 +9,7 @@ import requests
 from django.conf import settings
 from requests.exceptions import RequestException
 
+from iati.filegrabber import FileGrabber
 from iati_synchroniser.models import Dataset
 
 # Get an instance of a logger
@@ -43,10 +44,12 @@ class DatasetValidationTask(celery.Task):
     _file_id = None
     _json_result = None
     _validation_md5 = None
+    _source_response = None
 
     def run(self, dataset_id=None, *args, **kwargs):
         """Run the dataset validation task"""
         self._dataset = Dataset.objects.get(id=dataset_id)
+        self._source_response = None
 
         if self._check():
             self._updated()
@@ -69,9 +72,27 @@ class DatasetValidationTask(celery.Task):
                     if self._json_result:
                         self._updated()
 
+    def _get_source(self):
+        """
+        Get the file of the dataset. With settings.IATI_FILE_CACHE it is
+        read from the file cache, once per run (shared by _check and _post)
+        """
+        if not settings.IATI_FILE_CACHE:
+            return requests.get(self._dataset.source_url)
+
+        if self._source_response is None:
+            self._source_response = FileGrabber().get_dataset_file(
+                self._dataset.source_url)
+
+            if self._source_response is None:
+                raise RequestException(
+                    'Cannot access ' + self._dataset.source_url)
+
+        return self._source_response
+
     def _check(self):
         try:
-            get_respons = requests.get(self._dataset.source_url)
+            get_respons = self._get_source()
             if get_respons.status_code == 200:
                 md5 = hashlib.md5()
                 md5.update(get_respons.content)
@@ -106,7 +127,7 @@ class DatasetValidationTask(celery.Task):
         """Send XML file to the third party validation"""
         try:
             # Get file from the url of the dataset
-            get_response = requests.get(self._dataset.source_url)
+            get_response = self._get_source()
             # Continue if status is OK
             if get_response.status_code == 200:
                 # Assign file from the content response
@@ -0,0 +1,594 @@
+"""In-memory graph engine for the traceability chains.
+
+ChainRetriever builds a chain activity by activity, with queries per node and
+link. ChainGraph loads everything the rules of
+ChainRetriever.get_activity_links() look at (incoming funds, disbursements,
+expenditures, related activities and participating organisations of all
+activities) once, in a few queries, into adjacency lists per activity id.
+Chains are then walked breadth-first in memory, their begin / end of line
+nodes and tiers are computed in memory and they are saved with bulk_create().
+To rebuild only some chains, load_activities() loads the activities a walk
+reaches as it goes instead.
+
+The rules are the same as the ones of ChainRetriever, except that the start
+activity of a chain is only walked once (ChainRetriever walks it twice, which
+records its links and errors twice).
+"""
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime
+
+from django.db.models import Q
+
+from iati.models import (
+    Activity, ActivityParticipatingOrganisation, RelatedActivity
+)
+from iati.transaction.models import (
+    Transaction, TransactionProvider, TransactionReceiver
+)
+from traceability.models import (
+    Chain, ChainLink, ChainLinkRelation, ChainNode, ChainNodeError
+)
+
+INCOMING_FUNDS = '1'
+DISBURSEMENT = '3'
+EXPENDITURE = '4'
+
+RELATED_PARENT = '1'
+RELATED_CHILD = '2'
+
+ROLE_FUNDING = '1'
+ROLE_IMPLEMENTING = '4'
+
+# Number of chains saved together:
+SAVE_BATCH_SIZE = 100
+
+
+class GraphChain(object):
+    """A chain being built: its nodes, links and errors by activity id"""
+
+    def __init__(self, start_activity_id):
+        self.start_activity_id = start_activity_id
+        # activity id -> treated_as_end_node, in the order they were found:
+        self.nodes = OrderedDict()
+        # (start activity id, end activity id) -> list of relations:
+        self.links = OrderedDict()
+        # list of (activity id, error type, mentioned activity or org,
+        # warning level, related id):
+        self.errors = []
+        # nodes that still have to be walked:
+        self.pending = deque()
+
+        self.bols = set()
+        self.eols = set()
+        # activity id -> tier:
+        self.tiers = {}
+
+    def add_node(self, activity_id, treated_as_end_node=False):
+        if activity_id in self.nodes:
+            return
+
+        self.nodes[activity_id] = treated_as_end_node
+
+        if not treated_as_end_node:
+            self.pending.append(activity_id)
+
+    def add_link(self, start_activity_id, end_activity_id, relation,
+                 from_node, related_id, treat_upstream_as_end_node):
+        self.add_node(start_activity_id, treat_upstream_as_end_node)
+        self.add_node(end_activity_id)
+
+        self.links.setdefault((start_activity_id, end_activity_id), []).append(
+            {
+                'relation': relation,
+                'from_node': from_node,
+                'related_id': related_id,
+            })
+
+    def add_error(self, activity_id, error_code, mentioned_activity_or_org,
+                  warning_level, related_id):
+        self.errors.append((
+            activity_id,
+            error_code,
+            mentioned_activity_or_org,
+            warning_level,
+            related_id))
+
+    def calculate_lines(self):
+        """
+        Sets the begin of line nodes (which aren't the end node of a link)
+        and the end of line nodes (which aren't the start node of a link)
+        """
+        start_nodes = {start for start, end in self.links}
+        end_nodes = {end for start, end in self.links}
+
+        self.bols = {node for node in self.nodes if node not in end_nodes}
+        self.eols = {node for node in self.nodes if node not in start_nodes}
+
+    def calculate_tiers(self):
+        """
+        Sets the tier of every node by walking from the begin of line nodes,
+        like ChainRetriever.calculate_tiers(): a node which is reached again
+        from a higher tier moves to the deepest tier. Moved nodes don't start
+        a next tier, which stops cycles.
+        """
+        tiers = {node: None for node in self.nodes}
+        tiers.update((node, 0) for node in self.bols)
+
+        outgoing = defaultdict(list)
+        for start, end in self.links:
+            outgoing[start].append(end)
+
+        tier = 0
+
+        while True:
+            moved_nodes = set()
+
+            for node in [n for n in self.nodes if tiers[n] == tier]:
+                for end_node in outgoing[node]:
+                    if tiers[end_node] and tiers[end_node] < tier + 1:
+                        moved_nodes.add(end_node)
+                        tiers[end_node] = tier + 1
+                    elif not tiers[end_node]:
+                        tiers[end_node] = tier + 1
+
+            if not [n for n in self.nodes
+                    if tiers[n] == tier + 1 and n not in moved_nodes]:
+                break
+
+            tier += 1
+
+        self.tiers = tiers
+
+
+class ChainGraph(object):
+    """
+    The traceability data of all activities, loaded once, and the chain
+    building on top of it
+    """
+
+    def __init__(self):
+        # activity id -> iati identifier:
+        self.iati_identifiers = {}
+        # activity id -> list of (transaction id, has provider / receiver
+        # org, org ref, provider / receiver activity ref, provider / receiver
+        # activity id):
+        self.incoming_funds = defaultdict(list)
+        self.disbursements = defaultdict(list)
+        # activity id -> receiver org refs of expenditures:
+        self.expenditure_receiver_refs = defaultdict(list)
+        # activity id -> list of (related activity id, type, ref, ref
+        # activity id):
+        self.related_activities = defaultdict(list)
+        # activity id -> list of (participating org id, role, ref):
+        self.participating_organisations = defaultdict(list)
+        # provider-activity-id of incoming funds -> ids of the activities
+        # they're in:
+        self.funded_by_ref = defaultdict(set)
+        # receiver-activity-id of disbursements -> ids of the activities
+        # they're in:
+        self.disbursing_to_ref = defaultdict(set)
+        # activities set as provider-activity on any transaction:
+        self.providers = set()
+        # activities with a provider-activity on any transaction:
+        self.provided = set()
+
+        # all activities are loaded (load()), or only the activities in
+        # self.loaded (load_activities()):
+        self.all_loaded = False
+        self.loaded = set()
+
+    def load(self):
+        """Loads the data of all activities"""
+        self.iati_identifiers = dict(
+            Activity.objects.values_list('id', 'iati_identifier').iterator())
+
+        self._load_transactions(Transaction.objects.all(), by_ref=True)
+        self._load_related_activities(RelatedActivity.objects.all())
+        self._load_participating_organisations(
+            ActivityParticipatingOrganisation.objects.all())
+        self._load_providers(TransactionProvider.objects.all())
+        self.all_loaded = True
+
+        return self
+
+    def load_activities(self, activity_ids):
+        """
+        Loads the data of the activities in {activity_ids} which isn't loaded
+        yet. Used to build the chains of a part of the graph (see
+        traceability/incremental.py) without loading all activities
+        """
+        if self.all_loaded:
+            return
+
+        activity_ids = set(activity_ids) - self.loaded
+        if not activity_ids:
+            return
+
+        self.loaded.update(activity_ids)
+
+        identifiers = dict(Activity.objects.filter(
+            id__in=activity_ids).values_list('id', 'iati_identifier'))
+        self.iati_identifiers.update(identifiers)
+
+        self._load_transactions(
+            Transaction.objects.filter(activity_id__in=activity_ids),
+            by_ref=False)
+
+        # the activities which refer to the loaded ones (rules 6 and 7):
+        for ref, activity_id in TransactionProvider.objects.filter(
+            transaction__transaction_type=INCOMING_FUNDS,
+            provider_activity_ref__in=identifiers.values(),
+        ).values_list('provider_activity_ref', 'transaction__activity_id'):
+            self.funded_by_ref[ref].add(activity_id)
+
+        for ref, activity_id in TransactionReceiver.objects.filter(
+            transaction__transaction_type=DISBURSEMENT,
+            receiver_activity_ref__in=identifiers.values(),
+        ).values_list('receiver_activity_ref', 'transaction__activity_id'):
+            self.disbursing_to_ref[ref].add(activity_id)
+
+        self._load_related_activities(RelatedActivity.objects.filter(
+            current_activity_id__in=activity_ids))
+        self._load_participating_organisations(
+            ActivityParticipatingOrganisation.objects.filter(
+                activity_id__in=activity_ids))
+        self._load_providers(TransactionProvider.objects.filter(
+            Q(provider_activity_id__in=activity_ids)
+            | Q(transaction__activity_id__in=activity_ids)))
+
+    def is_loaded(self, activity_id):
+        return self.all_loaded or activity_id in self.loaded
+
+    def _load_transactions(self, transactions, by_ref):
+        """
+        Loads {transactions}. With {by_ref}, they're all transactions and
+        also make up the activities referring to others by iati identifier
+        """
+        transactions = transactions.filter(
+            transaction_type__in=[INCOMING_FUNDS, DISBURSEMENT, EXPENDITURE]
+        ).order_by('id').values_list(
+            'id',
+            'activity_id',
+            'transaction_type_id',
+            'provider_organisation__id',
+            'provider_organisation__ref',
+            'provider_organisation__provider_activity_ref',
+            'provider_organisation__provider_activity_id',
+            'receiver_organisation__id',
+            'receiver_organisation__ref',
+            'receiver_organisation__receiver_activity_ref',
+            'receiver_organisation__receiver_activity_id',
+        )
+
+        for (transaction_id, activity_id, transaction_type,
+                provider_id, provider_ref, provider_activity_ref,
+                provider_activity_id, receiver_id, receiver_ref,
+                receiver_activity_ref, receiver_activity_id) \
+                in transactions.iterator():
+            if transaction_type == INCOMING_FUNDS:
+                self.incoming_funds[activity_id].append((
+                    transaction_id,
+                    provider_id is not None,
+                    provider_ref,
+                    provider_activity_ref,
+                    provider_activity_id))
+
+                if by_ref and provider_id is not None:
+                    self.funded_by_ref[provider_activity_ref].add(
+                        activity_id)
+
+            elif transaction_type == DISBURSEMENT:
+                self.disbursements[activity_id].append((
+                    transaction_id,
+                    receiver_id is not None,
+                    receiver_ref,
+                    receiver_activity_ref,
+                    receiver_activity_id))
+
+                if by_ref and receiver_id is not None:
+                    self.disbursing_to_ref[receiver_activity_ref].add(
+                        activity_id)
+
+            elif receiver_id is not None:
+                self.expenditure_receiver_refs[activity_id].append(
+                    receiver_ref)
+
+    def _load_related_activities(self, related_activities):
+        for row in related_activities.order_by('id').values_list(
+                'current_activity_id', 'id', 'type_id', 'ref',
+                'ref_activity_id').iterator():
+            self.related_activities[row[0]].append(row[1:])
+
+    def _load_participating_organisations(self, participating_organisations):
+        for row in participating_organisations.order_by('id').values_list(
+                'activity_id', 'id', 'role_id', 'ref').iterator():
+            self.participating_organisations[row[0]].append(row[1:])
+
+    def _load_providers(self, transaction_providers):
+        for provider_activity_id, activity_id in transaction_providers.filter(
+            provider_activity__isnull=False
+        ).values_list(
+            'provider_activity_id', 'transaction__activity_id'
+        ).iterator():
+            self.providers.add(provider_activity_id)
+            self.provided.add(activity_id)
+
+    def filter_start_activities(self, activity_ids):
+        """
+        Returns the activities in {activity_ids} which are start activities
+        (see get_start_activities()), loading the data it needs
+        """
+        self.load_activities(activity_ids)
+        self.load_activities(
+            related[3]
+            for activity_id in activity_ids
+            for related in self.related_activities.get(activity_id, ())
+            if related[3] is not None)
+
+        return [
+            activity_id for activity_id in activity_ids
+            if self._is_start_activity(activity_id)
+        ]
+
+    def _is_start_activity(self, activity_id):
+        if activity_id in self.provided:
+            return False
+
+        return activity_id in self.providers or bool([
+            related
+            for related in self.related_activities.get(activity_id, ())
+            if related[3] in self.providers
+        ])
+
+    def get_start_activities(self):
+        """
+        Returns the ids of the activities chains start from, like
+        ChainRetriever.retrieve_chain_for_all_activities(): activities (or
+        the parents of activities) which are set as provider of funds, but
+        don't have a provider themselves
+        """
+        related_providers = {
+            activity_id
+            for activity_id, related in self.related_activities.items()
+            if [r for r in related if r[3] in self.providers]
+        }
+
+        return sorted(
+            activity_id
+            for activity_id in self.providers | related_providers
+            if self._is_start_activity(activity_id)
+        )
+
+    def add_activity_links(self, chain, activity_id,
+                           treat_upstream_as_end_node):
+        """
+        Applies the rules of ChainRetriever.get_activity_links() to
+        {activity_id}
+        """
+        provider_org_refs = []
+        receiver_org_refs = []
+
+        chain.add_node(activity_id)
+
+        # 1.
+        incoming_funds = self.incoming_funds.get(activity_id, ())
+        for (transaction_id, has_org, ref, provider_activity_ref,
+                provider_activity_id) in incoming_funds:
+            if not has_org:
+                chain.add_error(activity_id, '1', '', 'error', transaction_id)
+                continue
+
+            provider_org_refs.append(ref)
+
+            if not provider_activity_ref:
+                chain.add_error(activity_id, '2', '', 'error', transaction_id)
+            elif provider_activity_id is None:
+                chain.add_error(
+                    activity_id, '3', provider_activity_ref, 'error',
+                    transaction_id)
+            else:
+                chain.add_link(
+                    provider_activity_id, activity_id, 'incoming_fund',
+                    'end_node', transaction_id, treat_upstream_as_end_node)
+
+        # 2.
+        disbursements = self.disbursements.get(activity_id, ())
+        for (transaction_id, has_org, ref, receiver_activity_ref,
+                receiver_activity_id) in disbursements:
+            if not has_org:
+                chain.add_error(
+                    activity_id, '4', '', 'warning', transaction_id)
+                continue
+
+            receiver_org_refs.append(ref)
+
+            if not receiver_activity_ref:
+                chain.add_error(activity_id, '5', '', 'info', transaction_id)
+            elif receiver_activity_id is None:
+                chain.add_error(
+                    activity_id, '6', receiver_activity_ref, 'error',
+                    transaction_id)
+            else:
+                chain.add_link(
+                    activity_id, receiver_activity_id, 'disbursement',
+                    'start_node', transaction_id, False)
+
+        # 3 and 4.
+        for related_id, related_type, ref, ref_activity_id in \
+                self.related_activities.get(activity_id, ()):
+            if related_type == RELATED_PARENT:
+                if ref_activity_id is None:
+                    chain.add_error(activity_id, '7', ref, 'error', related_id)
+                else:
+                    chain.add_link(
+                        ref_activity_id, activity_id, 'parent', 'end_node',
+                        related_id, False)
+            elif related_type == RELATED_CHILD:
+                if ref_activity_id is None:
+                    chain.add_error(activity_id, '8', ref, 'error', related_id)
+                else:
+                    chain.add_link(
+                        activity_id, ref_activity_id, 'child', 'start_node',
+                        related_id, False)
+
+        # cache for #5
+        receiver_org_refs.extend(
+            self.expenditure_receiver_refs.get(activity_id, ()))
+
+        # 5.
+        for participating_id, role, ref in \
+                self.participating_organisations.get(activity_id, ()):
+            if role == ROLE_FUNDING and ref not in provider_org_refs:
+                chain.add_error(
+                    activity_id, '9', ref, 'info', participating_id)
+            elif role == ROLE_IMPLEMENTING and ref not in receiver_org_refs:
+                chain.add_error(
+                    activity_id, '10', ref, 'info', participating_id)
+
+        iati_identifier = self.iati_identifiers[activity_id]
+
+        # 6.
+        for funded_activity_id in sorted(
+                self.funded_by_ref.get(iati_identifier, ())):
+            chain.add_link(
+                activity_id, funded_activity_id, 'incoming_fund', 'end_node',
+                'to do', False)
+
+        # 7.
+        for disbursing_activity_id in sorted(
+                self.disbursing_to_ref.get(iati_identifier, ())):
+            chain.add_link(
+                disbursing_activity_id, activity_id, 'disbursement',
+                'start_node', 'to do', False)
+
+    def build_chain(self, start_activity_id):
+        """
+        Returns the GraphChain of {start_activity_id}: the activities linked
+        to it, breadth-first, with begin / end of line nodes and tiers
+        """
+        chain = GraphChain(start_activity_id)
+        chain.add_node(start_activity_id)
+
+        while chain.pending:
+            activity_id = chain.pending.popleft()
+
+            if not self.is_loaded(activity_id):
+                # load all activities waiting to be walked at once:
+                self.load_activities([activity_id] + list(chain.pending))
+
+            # upstream activities found further down the chain are end
+            # nodes:
+            self.add_activity_links(
+                chain, activity_id, activity_id != start_activity_id)
+
+        # (the end nodes weren't walked)
+        self.load_activities(chain.nodes)
+
+        chain.calculate_lines()
+        chain.calculate_tiers()
+
+        return chain
+
+    def save_chains(self, chains):
+        """
+        Saves {chains} (GraphChains) with one bulk_create() per model
+        """
+        now = datetime.now()
+        chain_objects = Chain.objects.bulk_create([
+            Chain(name="Unnamed chain", last_updated=now) for chain in chains
+        ])
+
+        nodes = []
+        for chain_object, chain in zip(chain_objects, chains):
+            for activity_id, treated_as_end_node in chain.nodes.items():
+                nodes.append(ChainNode(
+                    chain=chain_object,
+                    activity_id=activity_id,
+                    activity_oipa_id=activity_id,
+                    activity_iati_id=self.iati_identifiers[activity_id],
+                    tier=chain.tiers.get(activity_id),
+                    bol=activity_id in chain.bols,
+                    eol=activity_id in chain.eols,
+                    checked=not treated_as_end_node,
+                    treated_as_end_node=treated_as_end_node))
+
+        ChainNode.objects.bulk_create(nodes)
+
+        # (chain id, activity id) -> ChainNode:
+        node_objects = {
+            (node.chain_id, node.activity_id): node for node in nodes}
+
+        links = []
+        relations = []
+        errors = []
+
+        for chain_object, chain in zip(chain_objects, chains):
+            for (start, end), link_relations in chain.links.items():
+                link = ChainLink(
+                    chain=chain_object,
+                    start_node=node_objects[(chain_object.id, start)],
+                    end_node=node_objects[(chain_object.id, end)])
+                links.append(link)
+                relations.extend(
+                    (link, relation) for relation in link_relations)
+
+            for (activity_id, error_code, mentioned_activity_or_org,
+                    warning_level, related_id) in chain.errors:
+                errors.append(ChainNodeError(
+                    chain_node=node_objects[(chain_object.id, activity_id)],
+                    error_type=error_code,
+                    mentioned_activity_or_org=mentioned_activity_or_org,
+                    warning_level=warning_level,
+                    related_id=related_id))
+
+        ChainLink.objects.bulk_create(links)
+        ChainLinkRelation.objects.bulk_create([
+            ChainLinkRelation(chain_link=link, **relation)
+            for link, relation in relations
+        ])
+        ChainNodeError.objects.bulk_create(errors)
+
+        return chain_objects
+
+    def retrieve_chains(self, start_activity_ids):
+        """
+        Replaces the chains which start from {start_activity_ids}. An
+        activity which is a start node of a chain built before in this run
+        doesn't get a chain of its own, like in ChainRetriever.
+        Returns the number of saved chains
+        """
+        start_activity_ids = list(start_activity_ids)
+
+        Chain.objects.filter(
+            chainnode__activity_id__in=start_activity_ids,
+            chainnode__bol=True,
+            chainnode__treated_as_end_node=False,
+            chainnode__tier=0,
+        ).delete()
+
+        started = set()
+        chains = []
+        count = 0
+
+        for activity_id in start_activity_ids:
+            if activity_id in started:
+                continue
+
+            chain = self.build_chain(activity_id)
+            started.update(
+                node for node in chain.bols if not chain.nodes[node])
+            chains.append(chain)
+
+            if len(chains) >= SAVE_BATCH_SIZE:
+                self.save_chains(chains)
+                count += len(chains)
+                chains = []
+
+        if chains:
+            self.save_chains(chains)
+            count += len(chains)
+
+        return count
+
+    def retrieve_chain_for_all_activities(self):
+        return self.retrieve_chains(self.get_start_activities())
@@ -0,0 +1,206 @@
+"""Incremental maintenance of the traceability chains after a dataset is
+parsed (settings.TRACEABILITY_INCREMENTAL_CHAINS).
+
+ParseManager takes a ChainSnapshot of a dataset before parsing it and calls
+update_dataset_chains() afterwards, which:
+
+- compares the provider-activity, receiver-activity and related-activity
+  edges of the activities of the dataset before and after parsing,
+- finds the activities of other datasets with an edge to an activity which
+  was added to (or removed from) the dataset,
+- finds the chains which contain an activity of a changed edge, or which lost
+  nodes because a reparsed activity was deleted (along with its chain nodes),
+- replaces those chains by the chains of their start activities and of the
+  activities of the changed edges which are start activities now.
+
+The chains are built by a ChainGraph which only loads the activities it
+walks. All other chains are left untouched.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+
+from iati.models import Activity, RelatedActivity
+from iati.transaction.models import TransactionProvider, TransactionReceiver
+from traceability.graph import DISBURSEMENT, INCOMING_FUNDS, ChainGraph
+from traceability.models import Chain, ChainNode
+
+log = logging.getLogger(__name__)
+
+
+def get_dataset_edges(dataset):
+    """
+    Returns the traceability edges of the activities of {dataset}, as a set
+    of (iati identifier, relation, referenced iati identifier)
+    """
+    edges = set()
+
+    edges.update(
+        (iati_identifier, 'incoming_fund', ref)
+        for iati_identifier, ref in TransactionProvider.objects.filter(
+            transaction__activity__dataset=dataset,
+            transaction__transaction_type=INCOMING_FUNDS,
+        ).values_list(
+            'transaction__activity__iati_identifier', 'provider_activity_ref'
+        ).iterator())
+
+    edges.update(
+        (iati_identifier, 'disbursement', ref)
+        for iati_identifier, ref in TransactionReceiver.objects.filter(
+            transaction__activity__dataset=dataset,
+            transaction__transaction_type=DISBURSEMENT,
+        ).values_list(
+            'transaction__activity__iati_identifier', 'receiver_activity_ref'
+        ).iterator())
+
+    edges.update(
+        (iati_identifier, 'related_activity:{}'.format(related_type), ref)
+        for iati_identifier, related_type, ref
+        in RelatedActivity.objects.filter(
+            current_activity__dataset=dataset,
+        ).values_list(
+            'current_activity__iati_identifier', 'type_id', 'ref'
+        ).iterator())
+
+    return edges
+
+
+def get_incoming_edges(dataset, identifiers):
+    """
+    Returns the edges from activities outside of {dataset} to one of
+    {identifiers}, of which the reference is resolved (or lost) when the
+    parser saves (or deletes) the activities of {dataset}. A set of (iati
+    identifier, referenced iati identifier)
+    """
+    edges = set()
+
+    edges.update(TransactionProvider.objects.filter(
+        provider_activity_ref__in=identifiers,
+        transaction__transaction_type=INCOMING_FUNDS,
+    ).exclude(
+        transaction__activity__dataset=dataset,
+    ).values_list(
+        'transaction__activity__iati_identifier', 'provider_activity_ref'
+    ).iterator())
+
+    edges.update(TransactionReceiver.objects.filter(
+        receiver_activity_ref__in=identifiers,
+        transaction__transaction_type=DISBURSEMENT,
+    ).exclude(
+        transaction__activity__dataset=dataset,
+    ).values_list(
+        'transaction__activity__iati_identifier', 'receiver_activity_ref'
+    ).iterator())
+
+    edges.update(RelatedActivity.objects.filter(
+        ref__in=identifiers,
+    ).exclude(
+        current_activity__dataset=dataset,
+    ).values_list(
+        'current_activity__iati_identifier', 'ref'
+    ).iterator())
+
+    return edges
+
+
+def get_dataset_identifiers(dataset):
+    return set(Activity.objects.filter(
+        dataset=dataset).values_list('iati_identifier', flat=True))
+
+
+def get_chain_roots(chain_ids):
+    """
+    Returns the iati identifiers of the start nodes of {chain_ids}, as
+    {chain id: set of iati identifiers}
+    """
+    roots = defaultdict(set)
+
+    for chain_id, iati_identifier in ChainNode.objects.filter(
+        chain_id__in=chain_ids,
+        bol=True,
+        treated_as_end_node=False,
+        tier=0,
+    ).values_list('chain_id', 'activity_iati_id'):
+        roots[chain_id].add(iati_identifier)
+
+    return roots
+
+
+class ChainSnapshot(object):
+    """The chain data of a dataset, before it's parsed"""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.edges = get_dataset_edges(dataset)
+        self.identifiers = get_dataset_identifiers(dataset)
+
+        # chain id -> ids of the activities of the dataset in the chain:
+        self.chain_activities = defaultdict(set)
+
+        for chain_id, activity_id in ChainNode.objects.filter(
+            activity__dataset=dataset
+        ).values_list('chain_id', 'activity_id').iterator():
+            self.chain_activities[chain_id].add(activity_id)
+
+        # (the start nodes may be deleted by parsing)
+        self.roots = get_chain_roots(list(self.chain_activities))
+
+
+def update_dataset_chains(snapshot):
+    """
+    Rebuilds the chains affected by parsing the dataset of {snapshot} (a
+    ChainSnapshot taken before parsing it). Returns the number of rebuilt
+    chains
+    """
+    changed_edges = get_dataset_edges(snapshot.dataset) ^ snapshot.edges
+    changed_identifiers = {edge[0] for edge in changed_edges}
+    changed_identifiers.update(edge[2] for edge in changed_edges if edge[2])
+
+    # activities which were added or removed, and the activities of other
+    # datasets which refer to them: parsing resolved (or lost) those edges,
+    # so e.g. an added activity can be a new start activity without edges
+    # of its own:
+    added_or_removed = get_dataset_identifiers(
+        snapshot.dataset) ^ snapshot.identifiers
+    for edge in get_incoming_edges(snapshot.dataset, added_or_removed):
+        changed_identifiers.update(edge)
+
+    # chains which lost the nodes of reparsed (deleted) activities:
+    activity_ids = set().union(*snapshot.chain_activities.values())
+    existing_activity_ids = set(Activity.objects.filter(
+        id__in=activity_ids).values_list('id', flat=True))
+    chain_ids = {
+        chain_id
+        for chain_id, chain_activity_ids in snapshot.chain_activities.items()
+        if chain_activity_ids - existing_activity_ids
+    }
+
+    chain_ids.update(ChainNode.objects.filter(
+        activity_iati_id__in=changed_identifiers
+    ).values_list('chain_id', flat=True))
+
+    if not chain_ids and not changed_identifiers:
+        return 0
+
+    root_identifiers = set(changed_identifiers)
+    for roots in get_chain_roots(chain_ids).values():
+        root_identifiers.update(roots)
+    for chain_id in chain_ids:
+        root_identifiers.update(snapshot.roots.get(chain_id, ()))
+
+    graph = ChainGraph()
+    start_activity_ids = graph.filter_start_activities(list(
+        Activity.objects.filter(
+            iati_identifier__in=root_identifiers
+        ).order_by('id').values_list('id', flat=True)))
+
+    with transaction.atomic():
+        Chain.objects.filter(id__in=chain_ids).delete()
+        chain_count = graph.retrieve_chains(start_activity_ids)
+
+    log.info(
+        "Replaced %d traceability chains of dataset %s by %d chains",
+        len(chain_ids), snapshot.dataset.name, chain_count)
+
+    return chain_count
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from traceability.graph import ChainGraph
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the traceability chains of all activities which are set as
+    provider of funds, with the in-memory graph engine
+    """
+
+    def handle(self, *args, **options):
+        graph = ChainGraph().load()
+        chain_count = graph.retrieve_chain_for_all_activities()
+
+        self.stdout.write('{} chains'.format(chain_count))
@@ -0,0 +1,117 @@
+from django.test import TestCase
+
+from iati.factory import iati_factory
+from iati.transaction.factories import (
+    TransactionFactory, TransactionProviderFactory,
+    TransactionReceiverFactory, TransactionTypeFactory
+)
+from iati_codelists.factory.codelist_factory import RelatedActivityTypeFactory
+from traceability.graph import ChainGraph
+from traceability.models import (
+    Chain, ChainLink, ChainLinkRelation, ChainNode, ChainNodeError
+)
+from traceability.retrieve_chains import ChainRetriever
+
+
+class ChainGraphTestCase(TestCase):
+    """
+    A funds B, B disburses to C, C has a parent which doesn't exist
+    """
+
+    def setUp(self):
+        self.a = iati_factory.ActivityFactory.create(
+            iati_identifier='IATI-A')
+        self.b = iati_factory.ActivityFactory.create(
+            iati_identifier='IATI-B')
+        self.c = iati_factory.ActivityFactory.create(
+            iati_identifier='IATI-C')
+
+        TransactionProviderFactory.create(
+            transaction=TransactionFactory.create(activity=self.b),
+            provider_activity=self.a,
+            provider_activity_ref='IATI-A')
+
+        TransactionReceiverFactory.create(
+            transaction=TransactionFactory.create(
+                activity=self.b,
+                transaction_type=TransactionTypeFactory.create(
+                    code='3', name='Disbursement')),
+            receiver_activity=self.c,
+            receiver_activity_ref='IATI-C')
+
+        iati_factory.RelatedActivityFactory.create(
+            current_activity=self.c,
+            ref_activity=None,
+            ref='IATI-X',
+            type=RelatedActivityTypeFactory.create(code='1'))
+
+    def get_chain(self, chain):
+        nodes = {
+            (node.activity_iati_id, node.tier, node.bol, node.eol,
+             node.checked, node.treated_as_end_node)
+            for node in ChainNode.objects.filter(chain=chain)
+        }
+        links = {
+            (link.start_node.activity_iati_id,
+             link.end_node.activity_iati_id)
+            for link in ChainLink.objects.filter(chain=chain)
+        }
+        relations = {
+            (relation.chain_link.start_node.activity_iati_id,
+             relation.relation, relation.from_node)
+            for relation in ChainLinkRelation.objects.filter(
+                chain_link__chain=chain)
+        }
+        errors = {
+            (error.chain_node.activity_iati_id, error.error_type,
+             error.mentioned_activity_or_org)
+            for error in ChainNodeError.objects.filter(
+                chain_node__chain=chain)
+        }
+
+        return nodes, links, relations, errors
+
+    def test_start_activities(self):
+        graph = ChainGraph().load()
+
+        self.assertEqual(graph.get_start_activities(), [self.a.id])
+
+    def test_same_chain_as_chain_retriever(self):
+        ChainRetriever().retrieve_chain(self.a)
+        expected = self.get_chain(Chain.objects.get())
+
+        graph = ChainGraph().load()
+        self.assertEqual(graph.retrieve_chain_for_all_activities(), 1)
+
+        # the old chain of A is replaced:
+        chain = Chain.objects.get()
+        nodes, links, relations, errors = self.get_chain(chain)
+
+        self.assertEqual((nodes, links, relations, errors), expected)
+        self.assertEqual(nodes, {
+            ('IATI-A', 0, True, False, True, False),
+            ('IATI-B', 1, False, False, True, False),
+            ('IATI-C', 2, False, True, True, False),
+        })
+        self.assertEqual(errors, {('IATI-C', '7', 'IATI-X')})
+
+    def test_cycle(self):
+        """A link back to an earlier tier stops the tier calculation"""
+        TransactionReceiverFactory.create(
+            transaction=TransactionFactory.create(
+                activity=self.c,
+                transaction_type=TransactionTypeFactory.create(
+                    code='3', name='Disbursement')),
+            receiver_activity=self.b,
+            receiver_activity_ref='IATI-B')
+
+        chain = ChainGraph().load().build_chain(self.a.id)
+
+        self.assertEqual(chain.bols, {self.a.id})
+        self.assertEqual(chain.eols, set())
+        self.assertEqual(chain.tiers[self.a.id], 0)
+        self.assertEqual(set(chain.links), {
+            (self.a.id, self.b.id),
+            (self.b.id, self.c.id),
+            (self.c.id, self.b.id),
+        })
@@ -0,0 +1,134 @@
+from django.test import TestCase
+
+from iati.factory import iati_factory
+from iati.models import Activity
+from iati.transaction.factories import (
+    TransactionFactory, TransactionProviderFactory,
+    TransactionReceiverFactory, TransactionTypeFactory
+)
+from iati_synchroniser.factory.synchroniser_factory import DatasetFactory
+from traceability.graph import ChainGraph
+from traceability.incremental import ChainSnapshot, update_dataset_chains
+from traceability.models import Chain, ChainNode
+
+
+class UpdateDatasetChainsTestCase(TestCase):
+    """
+    A funds B (both in the dataset), X funds Y (in another dataset)
+    """
+
+    def setUp(self):
+        self.dataset = DatasetFactory.create(name='dataset-1')
+        other_dataset = DatasetFactory.create(name='dataset-2')
+
+        self.a = iati_factory.ActivityFactory.create(
+            iati_identifier='IATI-A', dataset=self.dataset)
+        self.b = iati_factory.ActivityFactory.create(
+            iati_identifier='IATI-B', dataset=self.dataset)
+        x = iati_factory.ActivityFactory.create(
+            iati_identifier='IATI-X', dataset=other_dataset)
+        y = iati_factory.ActivityFactory.create(
+            iati_identifier='IATI-Y', dataset=other_dataset)
+
+        TransactionProviderFactory.create(
+            transaction=TransactionFactory.create(activity=self.b),
+            provider_activity=self.a,
+            provider_activity_ref='IATI-A')
+        TransactionProviderFactory.create(
+            transaction=TransactionFactory.create(activity=y),
+            provider_activity=x,
+            provider_activity_ref='IATI-X')
+
+        ChainGraph().load().retrieve_chain_for_all_activities()
+
+        self.other_chain = ChainNode.objects.get(
+            activity_iati_id='IATI-X').chain
+
+    def get_chain_identifiers(self):
+        return {
+            frozenset(ChainNode.objects.filter(chain=chain).values_list(
+                'activity_iati_id', flat=True))
+            for chain in Chain.objects.all()
+        }
+
+    def test_unchanged_dataset(self):
+        snapshot = ChainSnapshot(self.dataset)
+
+        self.assertEqual(update_dataset_chains(snapshot), 0)
+        self.assertEqual(Chain.objects.count(), 2)
+
+    def test_changed_edge(self):
+        snapshot = ChainSnapshot(self.dataset)
+
+        # B now disburses to C:
+        c = iati_factory.ActivityFactory.create(iati_identifier='IATI-C')
+        TransactionReceiverFactory.create(
+            transaction=TransactionFactory.create(
+                activity=self.b,
+                transaction_type=TransactionTypeFactory.create(
+                    code='3', name='Disbursement')),
+            receiver_activity=c,
+            receiver_activity_ref='IATI-C')
+
+        self.assertEqual(update_dataset_chains(snapshot), 1)
+
+        self.assertEqual(self.get_chain_identifiers(), {
+            frozenset(['IATI-A', 'IATI-B', 'IATI-C']),
+            frozenset(['IATI-X', 'IATI-Y']),
+        })
+
+        # the chain of the other dataset is left untouched:
+        self.assertTrue(Chain.objects.filter(id=self.other_chain.id).exists())
+
+    def test_deleted_activity(self):
+        snapshot = ChainSnapshot(self.dataset)
+
+        # reparsing deletes and recreates the activities of the dataset:
+        self.b.delete()
+        b = iati_factory.ActivityFactory.create(
+            iati_identifier='IATI-B', dataset=self.dataset)
+        TransactionProviderFactory.create(
+            transaction=TransactionFactory.create(activity=b),
+            provider_activity=self.a,
+            provider_activity_ref='IATI-A')
+
+        self.assertEqual(update_dataset_chains(snapshot), 1)
+
+        self.assertEqual(self.get_chain_identifiers(), {
+            frozenset(['IATI-A', 'IATI-B']),
+            frozenset(['IATI-X', 'IATI-Y']),
+        })
+        self.assertTrue(Chain.objects.filter(id=self.other_chain.id).exists())
+
+    def test_activity_referenced_by_other_dataset(self):
+        """
+        Y (in another dataset) gets funds from P, before P is parsed. P has
+        no edges of its own, it's a start activity once it exists
+        """
+        y = Activity.objects.get(iati_identifier='IATI-Y')
+        provider = TransactionProviderFactory.create(
+            transaction=TransactionFactory.create(activity=y),
+            provider_activity=None,
+            provider_activity_ref='IATI-P')
+
+        new_dataset = DatasetFactory.create(name='dataset-3')
+        snapshot = ChainSnapshot(new_dataset)
+
+        # the first parse of the dataset, post_save resolves the reference:
+        p = iati_factory.ActivityFactory.create(
+            iati_identifier='IATI-P', dataset=new_dataset)
+        provider.provider_activity = p
+        provider.save()
+
+        self.assertGreater(update_dataset_chains(snapshot), 0)
+
+        p_chains = set(ChainNode.objects.filter(
+            activity_iati_id='IATI-P').values_list('chain_id', flat=True))
+        self.assertEqual(len(p_chains), 1)
+        self.assertTrue(ChainNode.objects.filter(
+            chain_id__in=p_chains, activity_iati_id='IATI-Y').exists())
+
+        # the chain of A and B is left untouched:
+        self.assertEqual(
+            ChainNode.objects.get(activity_iati_id='IATI-A').chain_id,
+            ChainNode.objects.get(activity_iati_id='IATI-B').chain_id)